@@ -0,0 +1,146 @@
+"""Latency percentiles for many concurrent tablets against running servers.
+
+Each simulated tablet keeps one keep-alive connection and loops: mostly polling
+a trip's detail and logs (sending the ETag it last saw, like the frontend), and
+occasionally creating a trip. Start the servers first, e.g.
+
+    python manage.py runserver --noreload 8000                       # WSGI
+    uvicorn eld_trip_planner.asgi:application --port 8001            # ASGI
+
+then compare the sync views under WSGI with the async views under ASGI:
+
+    python benchmarks/bench_concurrency.py \\
+        --url http://127.0.0.1:8000/api/v1/ --url http://127.0.0.1:8001/api/v1/async/
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.http_client import HTTPConnection  # noqa: E402
+from benchmarks.synthetic import random_trips  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+async def seed_trips(url, trips_data):
+    """Create the trips and return their ids"""
+    connection = HTTPConnection(url)
+    try:
+        trip_ids = []
+        for trip_data in trips_data:
+            response = await connection.post('/trip-plans/', trip_data)
+            if response.status != 201:
+                raise RuntimeError(f'Seeding {url} failed with {response.status}: {response.body[:200]!r}')
+            trip_ids.append(response.json()['trip_id'])
+        return trip_ids
+    finally:
+        await connection.close()
+
+
+async def tablet(url, trip_ids, trips_to_create, requests, create_ratio, rng, latencies, errors):
+    connection = HTTPConnection(url)
+    etags = {}
+    try:
+        for _ in range(requests):
+            if rng.random() < create_ratio:
+                kind, method, path, body, headers = 'create', 'POST', '/trip-plans/', rng.choice(trips_to_create), None
+            else:
+                kind = rng.choice(('detail', 'logs'))
+                trip_id = rng.choice(trip_ids)
+                path = f'/trip-plans/{trip_id}/' if kind == 'detail' else f'/trip-plans/{trip_id}/logs/'
+                method, body = 'GET', None
+                headers = {'If-None-Match': etags[path]} if path in etags else None
+
+            start = time.perf_counter()
+            try:
+                response = await connection.request(method, path, body=body, headers=headers)
+            except (OSError, asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError) as exc:
+                errors[type(exc).__name__] = errors.get(type(exc).__name__, 0) + 1
+                continue
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+
+            if response.status >= 400:
+                errors[str(response.status)] = errors.get(str(response.status), 0) + 1
+            elif 'etag' in response.headers:
+                etags[path] = response.headers['etag']
+    finally:
+        await connection.close()
+
+
+async def run(url, args):
+    trip_ids = await seed_trips(url, random_trips(args.seed_trips, seed=args.seed))
+    trips_to_create = random_trips(100, seed=args.seed + 1)
+
+    latencies, errors = {}, {}
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        tablet(url, trip_ids, trips_to_create, args.requests, args.create_ratio,
+               random.Random(args.seed + index), latencies, errors)
+        for index in range(args.concurrency)
+    ))
+    elapsed = time.perf_counter() - start
+
+    all_latencies = sorted(value for values in latencies.values() for value in values)
+    report = {
+        'url': url,
+        'concurrency': args.concurrency,
+        'requests': len(all_latencies),
+        'errors': errors,
+        'seconds': elapsed,
+        'requests_per_second': len(all_latencies) / elapsed if elapsed else None,
+        'latency_ms': {},
+    }
+    for kind, values in [('all', all_latencies)] + sorted(latencies.items()):
+        values = sorted(values)
+        report['latency_ms'][kind] = {
+            name: percentile(values, fraction) * 1000
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+        } if values else {}
+    return report
+
+
+def print_report(report):
+    print(f"{report['url']}: {report['requests']} requests from {report['concurrency']} tablets "
+          f"in {report['seconds']:.1f}s ({report['requests_per_second']:.0f} req/s), errors: {report['errors'] or 0}")
+    print(f"{'':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for kind, stats in report['latency_ms'].items():
+        if stats:
+            print(f"{kind:>8} {stats['p50']:>9.1f} {stats['p95']:>9.1f} {stats['p99']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', action='append', required=True,
+                        help='API base URL, e.g. http://127.0.0.1:8001/api/v1/async/ (repeat to compare)')
+    parser.add_argument('--concurrency', type=int, default=500, help='Simulated tablets (default: 500)')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per tablet (default: 20)')
+    parser.add_argument('--create-ratio', type=float, default=0.05, help='Share of requests that create trips')
+    parser.add_argument('--seed-trips', type=int, default=50, help='Trips created up front for polling')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='Also write the reports to this file')
+    args = parser.parse_args()
+
+    reports = []
+    for url in args.url:
+        report = asyncio.run(run(url, args))
+        print_report(report)
+        reports.append(report)
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(reports, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""Export throughput (log sheets per second) and peak memory by format and trip count.
+
+    python benchmarks/bench_export.py [--trips 1000,5000] [--formats ndjson,csv,parquet]
+
+Each trip count is seeded with trips between freight hubs (synthetic.hub_trips)
+in an on-disk SQLite test database. Every export is encoded and thrown away, as
+if written to a file, once for the timing and once under tracemalloc for the
+peak Python memory. A constant peak across trip counts is what streaming buys.
+"""
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import setup_django, test_database  # noqa: E402
+from benchmarks.synthetic import hub_trips  # noqa: E402
+
+SEED_BATCH = 500
+
+
+def export(kind, export_format):
+    """Rows and bytes of one export"""
+    from trip_planner.exports import export_chunks, export_rows
+
+    rows = size = 0
+
+    def counted(source):
+        nonlocal rows
+        for row in source:
+            rows += 1
+            yield row
+
+    for chunk in export_chunks(kind, export_format, counted(export_rows(kind))):
+        size += len(chunk)
+    return rows, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--trips', default='1000,5000')
+    parser.add_argument('--formats', default='ndjson,csv,parquet')
+    parser.add_argument('--kind', default='logs')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    setup_django()
+    from trip_planner.exports import parquet_available
+    from trip_planner.services import TripPlanningService
+
+    formats = [name for name in args.formats.split(',') if name != 'parquet' or parquet_available()]
+    service = TripPlanningService()
+    seeded = 0
+    print(f"{'trips':>6} {'format':>8} {'rows':>8} {'MB':>7} {'rows/s':>9} {'peak MB':>8}")
+    with test_database(on_disk=True):
+        for trips in sorted(int(count) for count in args.trips.split(',')):
+            while seeded < trips:
+                batch = min(SEED_BATCH, trips - seeded)
+                service.plan_trips(hub_trips(batch, seed=seeded))
+                seeded += batch
+
+            for export_format in formats:
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    rows, size = export(args.kind, export_format)
+                    elapsed = time.perf_counter() - start
+                    best = elapsed if best is None else min(best, elapsed)
+
+                tracemalloc.start()
+                export(args.kind, export_format)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print(f"{trips:>6} {export_format:>8} {rows:>8} {size / 1e6:>7.1f} {rows / best:>9.0f} "
+                      f"{peak / 1e6:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
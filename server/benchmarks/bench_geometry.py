@@ -0,0 +1,50 @@
+"""Throughput of scalar vs vectorized route segment planning by batch size.
+
+    python benchmarks/bench_geometry.py [--sizes 1,10,100,1000,10000,100000]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import best_of  # noqa: E402
+from benchmarks.synthetic import random_trips  # noqa: E402
+from trip_planner import geometry  # noqa: E402
+from trip_planner.engine import PlanningEngine  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,10,100,1000,10000,100000')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if not geometry.available():
+        sys.exit('NumPy is not installed; the vectorized kernel is unavailable')
+
+    engine = PlanningEngine()
+    print(f"{'trips':>8} {'scalar trips/s':>16} {'vectorized trips/s':>20} {'kernel trips/s':>16} {'speedup':>8}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        trips = random_trips(size, seed=size)
+
+        scalar = best_of(args.repeat, lambda: [
+            engine.route_segments(t['current_location'], t['pickup_location'], t['dropoff_location'])
+            for t in trips
+        ])
+        vectorized = best_of(args.repeat, lambda: engine.route_segments_many(trips))
+
+        lats = geometry.np.array([t['current_location']['lat'] for t in trips])
+        lngs = geometry.np.array([t['current_location']['lng'] for t in trips])
+        plats = geometry.np.array([t['pickup_location']['lat'] for t in trips])
+        plngs = geometry.np.array([t['pickup_location']['lng'] for t in trips])
+        kernel = best_of(args.repeat, lambda: geometry.split_legs(
+            geometry.haversine_km(lats, lngs, plats, plngs), engine.FUEL_INTERVAL_KM
+        ))
+
+        print(f"{size:>8} {size / scalar:>16,.0f} {size / vectorized:>20,.0f} "
+              f"{size / kernel:>16,.0f} {scalar / vectorized:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Nearby-trip lookups through the geohash index vs a full scan, by table size.
+
+    python benchmarks/bench_nearby.py [--sizes 100000,1000000] [--radius-km 50]
+
+Trips are inserted straight into an on-disk test database with random US
+pickups; only the columns the lookup reads are filled in.
+"""
+import argparse
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import best_of, setup_django, test_database  # noqa: E402
+
+INSERT_CHUNK = 5000
+
+
+def insert_trips(count, rng):
+    from trip_planner.geohash import location_geohash
+    from trip_planner.models import Trip
+
+    location = {'lat': 39.0, 'lng': -95.0}
+    for offset in range(0, count, INSERT_CHUNK):
+        trips = []
+        for _ in range(min(INSERT_CHUNK, count - offset)):
+            pickup = {'lat': rng.uniform(25, 49), 'lng': rng.uniform(-124, -67)}
+            trips.append(Trip(
+                current_location=location, pickup_location=pickup, dropoff_location=location,
+                current_cycle_used_hours=0, total_distance_km=0, estimated_days=1,
+                pickup_geohash=location_geohash(pickup),
+            ))
+        Trip.objects.bulk_create(trips)
+
+
+def full_scan(lat, lng, radius_km):
+    from trip_planner.engine import PlanningEngine
+    from trip_planner.models import Trip
+
+    engine = PlanningEngine()
+    origin = {'lat': lat, 'lng': lng}
+    return sum(
+        1 for pickup in Trip.objects.values_list('pickup_location', flat=True).iterator(chunk_size=10000)
+        if engine.distance(origin, pickup) <= radius_km
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100000,1000000')
+    parser.add_argument('--radius-km', type=float, default=50)
+    parser.add_argument('--queries', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scan-repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    setup_django()
+    from trip_planner.models import Trip
+    from trip_planner.spatial import nearby_trips
+
+    rng = random.Random(0)
+    centres = [(rng.uniform(30, 45), rng.uniform(-115, -75)) for _ in range(args.queries)]
+
+    print(f"{'trips':>9} {'matches':>8} {'indexed ms':>11} {'scan ms':>9} {'speedup':>8}")
+    with test_database(on_disk=True):
+        for size in sorted(int(s) for s in args.sizes.split(',')):
+            insert_trips(size - Trip.objects.count(), rng)
+
+            matches = [nearby_trips(lat, lng, args.radius_km)[0] for lat, lng in centres]
+            lat, lng = centres[0]
+            if full_scan(lat, lng, args.radius_km) != matches[0]:
+                sys.exit('Indexed lookup and full scan disagree')
+
+            indexed = best_of(args.repeat, lambda: [nearby_trips(la, ln, args.radius_km) for la, ln in centres])
+            indexed /= len(centres)
+            scan = best_of(args.scan_repeat, lambda: full_scan(lat, lng, args.radius_km))
+
+            print(f"{size:>9,} {sum(matches) / len(matches):>8.1f} {indexed * 1000:>11.2f} "
+                  f"{scan * 1000:>9.0f} {scan / indexed:>7.0f}x")
+
+
+if __name__ == '__main__':
+    main()
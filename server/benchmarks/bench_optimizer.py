@@ -0,0 +1,70 @@
+"""Solution quality and runtime of the multi-stop optimizer by stop count.
+
+    python benchmarks/bench_optimizer.py [--stops 5,8,10,15,20,25,50] [--budgets 0.05,0.5]
+
+For every stop count it solves ``--instances`` seeded LTL-style trips and
+reports the nearest neighbour distance, the improvement local search makes over
+it and the runtime. Up to ``--exact-max`` stops the optimum is also found by
+enumerating every pickup-before-dropoff order, giving the optimality gap.
+"""
+import argparse
+import statistics
+import sys
+from itertools import permutations
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import setup_django  # noqa: E402
+from benchmarks.synthetic import random_multi_stop_trip  # noqa: E402
+
+
+def exact_distance(trip):
+    from trip_planner.optimizer import distance_matrix, order_is_feasible, precedence_pairs
+
+    stops = trip['stops']
+    distances = distance_matrix([trip['current_location']] + [stop['location'] for stop in stops])
+    pairs = precedence_pairs(stops)
+    best = None
+    for order in permutations(range(1, len(stops) + 1)):
+        if not order_is_feasible(order, [(p + 1, d + 1) for p, d in pairs]):
+            continue
+        total = distances[0][order[0]] + sum(distances[a][b] for a, b in zip(order, order[1:]))
+        if best is None or total < best:
+            best = total
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stops', default='5,8,10,15,20,25,50')
+    parser.add_argument('--budgets', default='0.05,0.5', help='Time budgets in seconds to compare')
+    parser.add_argument('--instances', type=int, default=10)
+    parser.add_argument('--exact-max', type=int, default=8, help='Largest stop count solved exactly')
+    args = parser.parse_args()
+
+    setup_django()
+    from trip_planner.optimizer import optimize_stop_order
+
+    print(f"{'stops':>5} {'budget s':>8} {'NN km':>9} {'opt km':>9} {'vs NN':>7} {'gap':>6} "
+          f"{'mean ms':>8} {'max ms':>8} {'converged':>9}")
+    for stop_count in (int(s) for s in args.stops.split(',')):
+        trips = [random_multi_stop_trip(stop_count, seed=seed) for seed in range(args.instances)]
+        exact = [exact_distance(trip) for trip in trips] if stop_count <= args.exact_max else None
+
+        for budget in (float(b) for b in args.budgets.split(',')):
+            results = [optimize_stop_order(trip['current_location'], trip['stops'], time_budget=budget)
+                       for trip in trips]
+            improvement = statistics.mean(1 - r.distance_km / r.initial_distance_km for r in results)
+            gap = f"{'-':>6}"
+            if exact:
+                gap = f"{statistics.mean(r.distance_km / e - 1 for r, e in zip(results, exact)):>6.1%}"
+            print(f"{stop_count:>5} {budget:>8.2f} {statistics.mean(r.initial_distance_km for r in results):>9,.0f} "
+                  f"{statistics.mean(r.distance_km for r in results):>9,.0f} {improvement:>7.1%} {gap} "
+                  f"{statistics.mean(r.seconds for r in results) * 1000:>8.1f} "
+                  f"{max(r.seconds for r in results) * 1000:>8.1f} "
+                  f"{sum(r.converged for r in results):>5}/{len(results)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""Progress updates late in a trip vs planning the trip again from scratch.
+
+    python benchmarks/bench_progress.py [--stops 10,25,50] [--at 0.9]
+
+For each stop count, ``--trips`` long multi-stop trips are stored. Each one then
+gets a progress update ``--at`` of the way through its log clock. This is
+compared with what a progress update used to cost: planning the whole trip
+again and storing it as a new trip. The output lists the rows written and the
+queries issued by each approach.
+"""
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import setup_django, test_database  # noqa: E402
+from benchmarks.synthetic import random_multi_stop_trip  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stops', default='10,25,50')
+    parser.add_argument('--at', type=float, default=0.9, help='fraction of the trip already driven')
+    parser.add_argument('--trips', type=int, default=20)
+    parser.add_argument('--region-degrees', type=float, default=20.0)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from trip_planner.engine import PlanningEngine
+    from trip_planner.services import TripPlanningService
+
+    service = TripPlanningService()
+    print(f"{'stops':>5} {'segments':>8} {'days':>5} {'replan rows':>11} {'queries':>7} {'replan ms':>9} "
+          f"{'update rows':>11} {'queries':>7} {'update ms':>9} {'speedup':>8}")
+    with test_database(on_disk=True):
+        for stop_count in (int(s) for s in args.stops.split(',')):
+            trips = [
+                {**random_multi_stop_trip(stop_count, seed=seed, region_degrees=args.region_degrees), 'optimize': False}
+                for seed in range(args.trips)
+            ]
+
+            full_times, full_rows = [], []
+            with CaptureQueriesContext(connection) as full_queries:
+                for trip_data in trips:
+                    start = time.perf_counter()
+                    fields, plan, _ = service.plan_multi_stop(trip_data)
+                    service.save_plans([(fields, plan)])
+                    full_times.append(time.perf_counter() - start)
+                    full_rows.append(len(plan.segments) + len(plan.log_days) + 1)
+
+            # The trips stored above are the ones that get updated
+            stored = [service.save_plans([service.plan_multi_stop(trip_data)[:2]])[0] for trip_data in trips]
+            update_times, update_rows = [], []
+            with CaptureQueriesContext(connection) as update_queries:
+                for trip_data, trip in zip(trips, stored):
+                    segments = list(trip.segments.values_list('duration_minutes', flat=True))
+                    timeline = []
+                    PlanningEngine().log_days(trip.segments.all(), trip.current_cycle_used_hours, timeline=timeline)
+                    elapsed = int((timeline[-1].minute + segments[-1]) * args.at)
+                    position = trip_data['stops'][-1]['location']
+
+                    start = time.perf_counter()
+                    replan = service.update_progress(trip.id, position, elapsed)
+                    update_times.append(time.perf_counter() - start)
+                    update_rows.append(len(replan.segments) + len(replan.log_days) + 1)
+            # Reading the segments for the elapsed time above is setup, not part of the update
+            queries_per_update = len(update_queries) / len(trips) - 2
+
+            full_ms = statistics.mean(full_times) * 1000
+            update_ms = statistics.mean(update_times) * 1000
+            print(f"{stop_count:>5} {len(plan.segments):>8} {len(plan.log_days):>5} "
+                  f"{statistics.mean(full_rows):>11.1f} {len(full_queries) / len(trips):>7.1f} {full_ms:>9.2f} "
+                  f"{statistics.mean(update_rows):>11.1f} {queries_per_update:>7.1f} {update_ms:>9.2f} "
+                  f"{full_ms / update_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
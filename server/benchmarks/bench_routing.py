@@ -0,0 +1,103 @@
+"""Road graph build time and continental shortest-path query latency.
+
+    python benchmarks/bench_routing.py [--spacing 0.25] [--graph /tmp/us.graph] [--queries 200]
+
+Builds a synthetic road network over the continental US (see
+synthetic.synthetic_road_network), or reuses ``--graph`` if it already exists,
+then times west-coast to east-coast routes: node snapping plus the
+contraction-hierarchy search and path unpacking. A few routes are checked
+against plain Dijkstra over the original edges.
+"""
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_concurrency import percentile  # noqa: E402
+from benchmarks.synthetic import synthetic_road_network  # noqa: E402
+from trip_planner.road_graph import RoadGraph, build_road_graph, haversine_km  # noqa: E402
+from trip_planner.routing import RoadGraphRouter  # noqa: E402
+
+
+def dijkstra_km(nodes, edges, source, target):
+    adjacency = [[] for _ in nodes]
+    for u, v, km in edges:
+        adjacency[u].append((v, km))
+        adjacency[v].append((u, km))
+    distances = {source: 0.0}
+    queue = [(0.0, source)]
+    while queue:
+        km, node = heapq.heappop(queue)
+        if node == target:
+            return km
+        if km > distances[node]:
+            continue
+        for neighbour, edge_km in adjacency[node]:
+            if km + edge_km < distances.get(neighbour, float('inf')):
+                distances[neighbour] = km + edge_km
+                heapq.heappush(queue, (km + edge_km, neighbour))
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spacing', type=float, default=0.25, help='Grid spacing in degrees (0.25: ~22k nodes)')
+    parser.add_argument('--graph', help='Graph file to build, or reuse if it exists (default: a temporary file)')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--verify', type=int, default=3, help='Routes checked against plain Dijkstra')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph_path = args.graph or os.path.join(tempfile.mkdtemp(), 'us.graph')
+    nodes, edges = synthetic_road_network(args.spacing, seed=args.seed)
+    if not os.path.exists(graph_path):
+        start = time.perf_counter()
+        stats = build_road_graph(graph_path, nodes, edges)
+        print(f"Built {stats['nodes']:,} nodes, {stats['road_edges']:,} road edges, {stats['shortcuts']:,} shortcuts "
+              f"in {time.perf_counter() - start:.1f}s ({os.path.getsize(graph_path) / 1e6:.1f} MB)")
+
+    start = time.perf_counter()
+    router = RoadGraphRouter(RoadGraph(graph_path))
+    print(f"Opened {graph_path} in {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    rng = random.Random(args.seed)
+    west = [{'lat': rng.uniform(33, 47), 'lng': rng.uniform(-122, -115)} for _ in range(args.queries)]
+    east = [{'lat': rng.uniform(30, 44), 'lng': rng.uniform(-82, -72)} for _ in range(args.queries)]
+
+    latencies, detours = [], []
+    for start_location, end_location in zip(west, east):
+        start = time.perf_counter()
+        route = router.route(start_location, end_location)
+        latencies.append(time.perf_counter() - start)
+        detours.append(route.distance_km / haversine_km(start_location['lat'], start_location['lng'],
+                                                        end_location['lat'], end_location['lng']))
+
+    latencies.sort()
+    print(f"{len(latencies)} continental routes: p50 {percentile(latencies, 0.5) * 1000:.2f} ms, "
+          f"p95 {percentile(latencies, 0.95) * 1000:.2f} ms, max {latencies[-1] * 1000:.2f} ms")
+    print(f"Road / great-circle distance: mean {sum(detours) / len(detours):.3f}, "
+          f"range {min(detours):.3f}-{max(detours):.3f}")
+
+    graph = router.graph
+    # Graph nodes are renumbered by grid cell; map back through the coordinates
+    original = {(round(lat, 4), round(lng, 4)): index for index, (lat, lng) in enumerate(nodes)}
+    for start_location, end_location in list(zip(west, east))[:args.verify]:
+        source = graph.nearest_node(start_location['lat'], start_location['lng'], 100)[0]
+        target = graph.nearest_node(end_location['lat'], end_location['lng'], 100)[0]
+        expected = dijkstra_km(
+            nodes, edges,
+            original[round(graph.lat[source], 4), round(graph.lng[source], 4)],
+            original[round(graph.lat[target], 4), round(graph.lng[target], 4)],
+        )
+        found = graph.shortest_path(source, target)[0]
+        print(f"Dijkstra check: {found:,.1f} km vs {expected:,.1f} km")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""What-if scenarios vs planning and storing every variant as its own trip.
+
+    python benchmarks/bench_scenarios.py [--variants 12,24,48]
+
+Each variant count is a grid of departure hours, cycle hours and sleeper
+splits for one coast-to-coast trip. It is evaluated once with
+``evaluate_scenarios``, and compared with what the same comparison used to
+cost: a ``plan_trip`` (plan plus database writes) per variant.
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import best_of, setup_django, test_database  # noqa: E402
+
+TRIP_DATA = {
+    'current_location': {'lat': 40.7128, 'lng': -74.0060},
+    'pickup_location': {'lat': 41.8781, 'lng': -87.6298},
+    'dropoff_location': {'lat': 34.0522, 'lng': -118.2437},
+    'current_cycle_used_hours': 20,
+}
+
+
+def grid_for(variants):
+    """A grid with about ``variants`` combinations: 2 sleeper choices x 3 cycle values x departures"""
+    departures = max(1, variants // 6)
+    return {
+        'departure_hour': [hour * 24 / departures for hour in range(departures)],
+        'current_cycle_used_hours': [10, 40, 65],
+        'sleeper_split': [False, True],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--variants', default='12,24,48')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from trip_planner.scenarios import evaluate_scenarios, grid_values
+    from trip_planner.services import TripPlanningService
+
+    service = TripPlanningService()
+    print(f"{'variants':>8} {'plan_trip ms':>12} {'scenarios ms':>12} {'speedup':>8}")
+    with test_database(on_disk=True):
+        for variants in (int(v) for v in args.variants.split(',')):
+            grid = grid_for(variants)
+            departures, cycle_hours, _ = grid_values(TRIP_DATA, grid)
+            count = len(departures) * len(cycle_hours) * 2
+
+            def plan_each():
+                # Departure and sleeper split cannot be expressed by plan_trip; only the cycle varies
+                for index in range(count):
+                    service.plan_trip({**TRIP_DATA, 'current_cycle_used_hours': cycle_hours[index % len(cycle_hours)]})
+
+            full = best_of(args.repeat, plan_each)
+            fanned = best_of(args.repeat, lambda: evaluate_scenarios(service.engine, TRIP_DATA, grid))
+            print(f"{count:>8} {full * 1000:>12.2f} {fanned * 1000:>12.2f} {full / fanned:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
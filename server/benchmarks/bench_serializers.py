@@ -0,0 +1,76 @@
+"""DRF serializers + JSONRenderer vs plain-dict payloads + ORJSONRenderer for a long trip.
+
+    python benchmarks/bench_serializers.py [--segments 60] [--days 20]
+"""
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import best_of, setup_django, test_database  # noqa: E402
+
+
+def create_long_trip(segment_count, day_count):
+    """Store a trip whose route and logs repeat a real plan's until they reach the requested size"""
+    from trip_planner.models import LogSheet, RouteSegment
+    from trip_planner.services import TripPlanningService
+    from benchmarks.synthetic import random_trips
+
+    trip = TripPlanningService().plan_trip(random_trips(1, seed=1)[0])
+    segments = list(trip.segments.all())
+    logs = list(trip.logs.all())
+    RouteSegment.objects.bulk_create(
+        RouteSegment(trip=trip, sequence_order=i, type=s.type, start_location=s.start_location,
+                     end_location=s.end_location, duration_minutes=s.duration_minutes, distance_km=s.distance_km)
+        for i, s in ((i, segments[i % len(segments)]) for i in range(len(segments), segment_count))
+    )
+    LogSheet.objects.bulk_create(
+        LogSheet(trip=trip, day_number=day, graph_points=logs[day % len(logs)].graph_points,
+                 points=logs[day % len(logs)].points, summary=logs[day % len(logs)].summary)
+        for day in range(len(logs) + 1, day_count + 1)
+    )
+    return trip.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--segments', type=int, default=60)
+    parser.add_argument('--days', type=int, default=20)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_django()
+    from rest_framework.renderers import JSONRenderer
+    from trip_planner.models import Trip
+    from trip_planner.payloads import trip_detail_payload, trip_logs_payload
+    from trip_planner.renderers import ORJSONRenderer
+    from trip_planner.serializers import TripDetailSerializer, TripLogsSerializer
+
+    with test_database():
+        trip_id = create_long_trip(args.segments, args.days)
+        drf, fast = JSONRenderer(), ORJSONRenderer()
+
+        cases = {
+            'detail': (
+                lambda: drf.render(TripDetailSerializer(Trip.objects.get(id=trip_id)).data),
+                lambda: fast.render(trip_detail_payload(trip_id)),
+            ),
+            'logs': (
+                lambda: drf.render(TripLogsSerializer(Trip.objects.get(id=trip_id)).data),
+                lambda: fast.render(trip_logs_payload(trip_id)),
+            ),
+        }
+
+        print(f"{args.segments} segments, {args.days} log days")
+        print(f"{'endpoint':>8} {'DRF ms':>8} {'fast ms':>8} {'speedup':>8} {'identical':>10}")
+        for name, (baseline, candidate) in cases.items():
+            identical = baseline() == candidate()
+            baseline_time = best_of(5, baseline, number=args.number)
+            candidate_time = best_of(5, candidate, number=args.number)
+            print(f"{name:>8} {baseline_time * 1000:>8.3f} {candidate_time * 1000:>8.3f} "
+                  f"{baseline_time / candidate_time:>7.2f}x {str(identical):>10}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+"""Minimal asyncio HTTP/1.1 keep-alive client for load benchmarks.
+
+Only what the benchmarks need - one request at a time per connection, JSON
+bodies, Content-Length or chunked responses - so thousands of simulated
+clients can run in one process without third-party dependencies.
+"""
+import asyncio
+import json
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import urlsplit
+
+
+class HTTPResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class HTTPConnection:
+    """One persistent connection to ``base_url``'s host; reconnects when the server closes it"""
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.base_path = parts.path.rstrip('/')
+        self.timeout = timeout
+        self._reader = self._writer = None
+
+    async def request(self, method: str, path: str, body=None, headers: Optional[Dict[str, str]] = None):
+        return await asyncio.wait_for(self._request(method, path, body, headers or {}), self.timeout)
+
+    async def get(self, path: str, headers: Optional[Dict[str, str]] = None):
+        return await self.request('GET', path, headers=headers)
+
+    async def post(self, path: str, data, headers: Optional[Dict[str, str]] = None):
+        return await self.request('POST', path, body=data, headers=headers)
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+            self._reader = self._writer = None
+
+    async def _request(self, method, path, body, headers):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+        payload = b'' if body is None else json.dumps(body).encode()
+        lines = [f'{method} {self.base_path}{path} HTTP/1.1', f'Host: {self.host}:{self.port}',
+                 f'Content-Length: {len(payload)}']
+        if body is not None:
+            lines.append('Content-Type: application/json')
+        lines.extend(f'{name}: {value}' for name, value in headers.items())
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + payload)
+
+        try:
+            response = await self._read_response(method)
+        except BaseException:
+            # A half-read response leaves the connection unusable
+            await self.close()
+            raise
+        if response.headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return response
+
+    async def _read_response(self, method):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if method == 'HEAD' or status in (204, 304) or 100 <= status < 200:
+            body = b''
+        elif headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in headers:
+            body = await self._reader.readexactly(int(headers['content-length']))
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+        return HTTPResponse(status, headers, body)
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                # Skip trailers up to the blank line
+                while (await self._reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
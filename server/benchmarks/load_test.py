@@ -0,0 +1,236 @@
+"""Load test a running server with a dispatcher and tablet traffic mix, reporting JSON.
+
+Start the server under test, e.g. one of
+
+    python manage.py runserver --noreload 8000
+    uvicorn eld_trip_planner.asgi:application --port 8001
+    gunicorn eld_trip_planner.wsgi --workers 4 --bind 127.0.0.1:8002
+
+then run
+
+    python benchmarks/load_test.py --url http://127.0.0.1:8000/api/v1/ --users 200 --duration 60 \\
+        --label sqlite-runserver --output results/runserver.json
+    python benchmarks/load_test.py --url http://127.0.0.1:8001/api/v1/async/ --compare results/runserver.json
+
+Each virtual user keeps one keep-alive connection and picks every request from
+``--mix`` (by default 5% trip creation by dispatchers, 60% log polling and 35%
+detail polling by tablets). Tablets send the ETag they last saw for a URL, as
+the frontend does, so 304s are successes. Trips come from seeded lanes between
+freight hubs (synthetic.hub_trips). ``--seed-trips`` of them are created before
+the clock starts, and trips created during the run join the polled pool. The
+first ``--warmup`` seconds are not recorded.
+
+The report has throughput, p50/p95/p99 latency, status counts and error rates
+overall and per request kind. It also records the commit, ``--label`` and the
+options, so reports from different commits or settings profiles can be put
+side by side with ``--compare``.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.bench_concurrency import percentile, seed_trips  # noqa: E402
+from benchmarks.http_client import HTTPConnection  # noqa: E402
+from benchmarks.synthetic import hub_trips  # noqa: E402
+
+DEFAULT_MIX = 'create=5,logs=60,detail=35'
+KINDS = ('create', 'logs', 'detail')
+CONNECTION_ERRORS = (OSError, asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError)
+
+
+def parse_mix(text):
+    """{'create': weight, ...} from 'create=5,logs=60,detail=35'; kinds left out get no traffic"""
+    mix = {}
+    for part in text.split(','):
+        kind, _, weight = part.partition('=')
+        kind = kind.strip()
+        if kind not in KINDS:
+            raise argparse.ArgumentTypeError(f"Unknown request kind '{kind}' (expected one of {', '.join(KINDS)})")
+        mix[kind] = float(weight)
+    if sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError('The mix needs a positive weight')
+    return mix
+
+
+class KindStats:
+    __slots__ = ('latencies', 'statuses', 'errors')
+
+    def __init__(self):
+        self.latencies = []
+        self.statuses = {}
+        self.errors = {}
+
+    def summary(self, seconds):
+        latencies = sorted(self.latencies)
+        requests = len(latencies)
+        failed = sum(self.errors.values())
+        return {
+            'requests': requests,
+            'requests_per_second': requests / seconds if seconds else None,
+            'latency_ms': {
+                name: percentile(latencies, fraction) * 1000
+                for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+            } if latencies else {},
+            'statuses': dict(sorted(self.statuses.items())),
+            'errors': dict(sorted(self.errors.items())),
+            'error_rate': failed / requests if requests else None,
+        }
+
+
+async def virtual_user(url, mix, trip_ids, trips_to_create, rng, warmup_end, deadline, think, stats):
+    connection = HTTPConnection(url)
+    kinds, weights = list(mix), list(mix.values())
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            kind = rng.choices(kinds, weights)[0]
+            headers = body = None
+            if kind == 'create':
+                method, path, body = 'POST', '/trip-plans/', rng.choice(trips_to_create)
+            else:
+                trip_id = rng.choice(trip_ids)
+                method = 'GET'
+                path = f'/trip-plans/{trip_id}/logs/' if kind == 'logs' else f'/trip-plans/{trip_id}/'
+                if path in etags:
+                    headers = {'If-None-Match': etags[path]}
+
+            start = time.perf_counter()
+            try:
+                response = await connection.request(method, path, body=body, headers=headers)
+            except CONNECTION_ERRORS as exc:
+                error, response = type(exc).__name__, None
+            else:
+                error = str(response.status) if response.status >= 400 else None
+            elapsed = time.perf_counter() - start
+
+            if start >= warmup_end:
+                kind_stats = stats[kind]
+                kind_stats.latencies.append(elapsed)
+                if response is not None:
+                    kind_stats.statuses[response.status] = kind_stats.statuses.get(response.status, 0) + 1
+                if error is not None:
+                    kind_stats.errors[error] = kind_stats.errors.get(error, 0) + 1
+
+            if response is not None and error is None:
+                if kind == 'create':
+                    trip_ids.append(response.json()['trip_id'])
+                elif 'etag' in response.headers:
+                    etags[path] = response.headers['etag']
+            if think:
+                await asyncio.sleep(rng.expovariate(1 / think))
+    finally:
+        await connection.close()
+
+
+async def run(args):
+    trip_ids = await seed_trips(args.url, hub_trips(args.seed_trips, seed=args.seed))
+    trips_to_create = hub_trips(500, seed=args.seed + 1)
+    stats = {kind: KindStats() for kind in args.mix}
+
+    started_at = datetime.now(timezone.utc).isoformat(timespec='seconds')
+    start = time.perf_counter()
+    warmup_end = start + args.warmup
+    deadline = warmup_end + args.duration
+    await asyncio.gather(*(
+        virtual_user(args.url, args.mix, trip_ids, trips_to_create, random.Random(args.seed + index),
+                     warmup_end, deadline, args.think_ms / 1000, stats)
+        for index in range(args.users)
+    ))
+    # Requests still in flight at the deadline finish a little after it
+    seconds = max(time.perf_counter(), deadline) - warmup_end
+
+    overall = KindStats()
+    for kind_stats in stats.values():
+        overall.latencies.extend(kind_stats.latencies)
+        for status, count in kind_stats.statuses.items():
+            overall.statuses[status] = overall.statuses.get(status, 0) + count
+        for error, count in kind_stats.errors.items():
+            overall.errors[error] = overall.errors.get(error, 0) + count
+
+    return {
+        'label': args.label,
+        'commit': _commit(),
+        'started_at': started_at,
+        'url': args.url,
+        'python': platform.python_version(),
+        'options': {
+            'users': args.users, 'duration': args.duration, 'warmup': args.warmup, 'think_ms': args.think_ms,
+            'mix': args.mix, 'seed': args.seed, 'seed_trips': args.seed_trips,
+        },
+        'seconds': seconds,
+        'overall': overall.summary(seconds),
+        'kinds': {kind: kind_stats.summary(seconds) for kind, kind_stats in stats.items()},
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, previous=None, file=sys.stderr):
+    overall = report['overall']
+    print(f"{report['label'] or report['url']} @ {report['commit'] or '?'}: {overall['requests']} requests "
+          f"from {report['options']['users']} users in {report['seconds']:.1f}s "
+          f"({overall['requests_per_second']:.0f} req/s), error rate {overall['error_rate'] or 0:.2%}", file=file)
+    print(f"{'':>8} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}", file=file)
+    rows = [('all', overall)] + list(report['kinds'].items())
+    previous_rows = dict([('all', previous['overall'])] + list(previous['kinds'].items())) if previous else {}
+    for kind, summary in rows:
+        if not summary['latency_ms']:
+            continue
+        latency = summary['latency_ms']
+        print(f"{kind:>8} {summary['requests_per_second']:>8.0f} {latency['p50']:>9.1f} {latency['p95']:>9.1f} "
+              f"{latency['p99']:>9.1f} {summary['error_rate']:>7.2%}", file=file)
+        before = previous_rows.get(kind)
+        if before and before['latency_ms']:
+            print(f"{'vs':>8} {_change(summary['requests_per_second'], before['requests_per_second']):>8} "
+                  + ' '.join(f"{_change(latency[p], before['latency_ms'][p]):>9}" for p in ('p50', 'p95', 'p99')),
+                  file=file)
+
+
+def _change(value, before):
+    return f'{(value / before - 1) * 100:+.0f}%' if before else '-'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', required=True, help='API base URL, e.g. http://127.0.0.1:8000/api/v1/')
+    parser.add_argument('--users', type=int, default=100, help='concurrent virtual users (default: 100)')
+    parser.add_argument('--duration', type=float, default=30, help='seconds measured, after the warmup')
+    parser.add_argument('--warmup', type=float, default=5, help='seconds of load before measuring')
+    parser.add_argument('--think-ms', type=float, default=0,
+                        help='mean pause between a user\'s requests (exponential; 0 for back-to-back)')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(DEFAULT_MIX),
+                        help=f'request kind weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--seed-trips', type=int, default=50, help='trips created up front for polling')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', help='name of the setup under test, e.g. the settings profile')
+    parser.add_argument('--output', type=Path, help='write the JSON report here (default: stdout)')
+    parser.add_argument('--compare', type=Path, help='an earlier report to print changes against')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    # The summary goes to stderr so stdout can be piped as JSON
+    print_report(report, json.loads(args.compare.read_text()) if args.compare else None)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(report, indent=2) + '\n')
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,216 @@
+"""Benchmark suite for the planner and API, gated against a stored baseline.
+
+    python benchmarks/suite.py                    # run everything, compare with benchmarks/baseline.json
+    python benchmarks/suite.py -k plan -k logs    # only benchmarks whose names contain a pattern
+    python benchmarks/suite.py --save-baseline    # record the results as the new baseline
+    python benchmarks/suite.py --threshold 15 --json results.json
+
+Each benchmark is timed like timeit: the number of calls per run grows until a
+run takes MIN_RUN_SECONDS, and the fastest of ``--repeat`` runs is kept. The
+exit status is 1 when any benchmark is more than ``--threshold`` percent slower
+than its baseline, even after being timed again ``--confirm`` times. A baseline
+is the median of 1 + ``--confirm`` timings, so one lucky run cannot set it.
+Timings depend on the machine, so record the baseline on the machine that runs
+the gate (the baseline notes which one it came from).
+Inputs come from the seeded generators in synthetic.py. API benchmarks go
+through the Django test client against a throwaway SQLite database.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import best_of, setup_django, test_database  # noqa: E402
+from benchmarks.synthetic import random_trip_of_length, segments_for_days  # noqa: E402
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'baseline.json'
+MIN_RUN_SECONDS = 0.02
+
+# (name, setup) pairs; setup returns the function that is timed
+BENCHMARKS = []
+
+
+def benchmark(name):
+    def register(setup):
+        BENCHMARKS.append((name, setup))
+        return setup
+    return register
+
+
+def _engine():
+    # No lane cache, so every call plans the route
+    from trip_planner.engine import PlanningEngine
+    return PlanningEngine()
+
+
+# Pickup-to-dropoff km of the planned trips
+TRIP_LENGTHS_KM = {'short': (150, 400), 'medium': (1000, 1800), 'transcontinental': (3500, 4500)}
+
+for _name, _km in TRIP_LENGTHS_KM.items():
+    @benchmark(f'plan.{_name}')
+    def _plan(km=_km):
+        engine, trip_data = _engine(), random_trip_of_length(*km, seed=1)
+        return lambda: engine.plan(**trip_data)
+
+
+for _days in (1, 10, 60):
+    @benchmark(f'logs.generate_{_days}_days')
+    def _generate_log_sheets(days=_days):
+        from trip_planner.models import Trip
+        from trip_planner.services import TripPlanningService
+
+        service = TripPlanningService()
+        service.engine = _engine()
+        segments = segments_for_days(days, seed=1)
+        return lambda: service._build_log_sheets(Trip(), service.engine.log_days(segments))
+
+
+@benchmark('render.trip_payload')
+def _render_trip_payload():
+    from trip_planner.models import Trip
+    from trip_planner.payloads import trip_payload
+    from trip_planner.renderers import ORJSONRenderer
+
+    plan = _engine().plan(**random_trip_of_length(*TRIP_LENGTHS_KM['transcontinental'], seed=1))
+    trip = Trip(total_distance_km=plan.total_distance_km, estimated_days=plan.estimated_days)
+    return lambda: ORJSONRenderer().render(trip_payload(trip, plan.segments))
+
+
+@benchmark('render.trip_serializer')
+def _render_trip_serializer():
+    from trip_planner.models import Trip
+    from trip_planner.renderers import ORJSONRenderer
+    from trip_planner.serializers import TripSerializer
+
+    trip = _stored_trip()
+    return lambda: ORJSONRenderer().render(TripSerializer(Trip.objects.prefetch_related('segments').get(id=trip.id)).data)
+
+
+@benchmark('render.logs_payload')
+def _render_logs_payload():
+    from trip_planner.payloads import trip_logs_payload
+    from trip_planner.renderers import ORJSONRenderer
+
+    trip = _stored_trip()
+    return lambda: ORJSONRenderer().render(trip_logs_payload(trip.id))
+
+
+@benchmark('api.create')
+def _api_create():
+    from django.test import Client
+
+    client, body = Client(), json.dumps(random_trip_of_length(*TRIP_LENGTHS_KM['medium'], seed=2))
+    return lambda: client.post('/api/v1/trip-plans/', body, content_type='application/json')
+
+
+for _kind, _path in (('detail', '/api/v1/trip-plans/{}/'), ('logs', '/api/v1/trip-plans/{}/logs/')):
+    @benchmark(f'api.{_kind}')
+    def _api_read(path=_path):
+        # The rendered response cache is switched off (see main), so each call reads and renders the trip
+        from django.test import Client
+
+        client, url = Client(), path.format(_stored_trip().id)
+        return lambda: client.get(url)
+
+
+def _stored_trip():
+    from trip_planner.services import TripPlanningService
+    return TripPlanningService().plan_trip(random_trip_of_length(*TRIP_LENGTHS_KM['transcontinental'], seed=1))
+
+
+def time_benchmark(func, repeat):
+    """Seconds per call: the fastest of ``repeat`` runs, each long enough to time reliably"""
+    number = 1
+    while best_of(1, func, number) * number < MIN_RUN_SECONDS and number < 1 << 20:
+        number *= 2
+    return best_of(repeat, func, number)
+
+
+def compare(results, baseline, threshold):
+    """(name, seconds, baseline seconds or None, change in percent or None, regressed) for each result"""
+    rows = []
+    for name, seconds in results.items():
+        previous = baseline.get(name)
+        change = None if previous is None else (seconds / previous - 1) * 100
+        rows.append((name, seconds, previous, change, change is not None and change > threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-k', dest='patterns', action='append', default=[],
+                        help='run benchmarks whose names contain this (repeatable)')
+    parser.add_argument('--repeat', type=int, default=15)
+    parser.add_argument('--threshold', type=float, default=25.0, help='percent slowdown that fails the run')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--json', type=Path, help='also write the results here')
+    parser.add_argument('--confirm', type=int, default=2,
+                        help='times a benchmark that looks regressed is timed again before it fails the run')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.test.utils import override_settings
+
+    selected = [(name, setup) for name, setup in BENCHMARKS
+                if not args.patterns or any(pattern in name for pattern in args.patterns)]
+    results = {}
+    uncached = {
+        'CACHES': {**settings.CACHES, 'uncached': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}},
+        'TRIP_PLANNER_RESPONSE_CACHE': {'CACHE_ALIAS': 'uncached'},
+        'TRIP_PLANNER_LANE_CACHE': {'BACKEND': None},
+    }
+    baseline = json.loads(args.baseline.read_text()) if args.baseline.exists() else {'benchmarks': {}}
+    limit = 1 + args.threshold / 100
+    with test_database(), override_settings(**uncached):
+        for name, setup in selected:
+            func = setup()
+            if args.save_baseline:
+                results[name] = statistics.median(time_benchmark(func, args.repeat) for _ in range(1 + args.confirm))
+                print(f'{name:<28} {results[name] * 1000:>10.3f} ms', file=sys.stderr)
+                continue
+
+            results[name] = time_benchmark(func, args.repeat)
+            previous = baseline['benchmarks'].get(name)
+            # A noisy neighbour can slow a whole run down, so a slowdown has to show up every time
+            for _ in range(args.confirm):
+                if previous is None or results[name] <= previous * limit:
+                    break
+                results[name] = min(results[name], time_benchmark(func, args.repeat))
+            print(f'{name:<28} {results[name] * 1000:>10.3f} ms', file=sys.stderr)
+
+    machine = {'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count()}
+    if args.json:
+        args.json.write_text(json.dumps({'machine': machine, 'benchmarks': results}, indent=2) + '\n')
+    if args.save_baseline:
+        stored = json.loads(args.baseline.read_text())['benchmarks'] if args.baseline.exists() else {}
+        args.baseline.write_text(json.dumps({'machine': machine, 'benchmarks': {**stored, **results}},
+                                            indent=2, sort_keys=True) + '\n')
+        print(f'Saved {len(results)} results to {args.baseline}')
+        return
+
+    if baseline.get('machine') and baseline['machine'] != machine:
+        print(f"Baseline was recorded on {baseline['machine']}; timings may not be comparable", file=sys.stderr)
+
+    print(f"{'benchmark':<28} {'ms':>10} {'baseline ms':>12} {'change':>8}")
+    rows = compare(results, baseline['benchmarks'], args.threshold)
+    for name, seconds, previous, change, regressed in rows:
+        previous_ms = '-' if previous is None else f'{previous * 1000:.3f}'
+        change_text = 'new' if change is None else f'{change:+.1f}%'
+        print(f"{name:<28} {seconds * 1000:>10.3f} {previous_ms:>12} {change_text:>8}{'  REGRESSED' if regressed else ''}")
+
+    regressions = [row[0] for row in rows if row[4]]
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) more than {args.threshold:g}% slower than the baseline: "
+              f"{', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
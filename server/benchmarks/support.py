@@ -0,0 +1,57 @@
+"""Helpers for benchmarks that need Django and a database."""
+import gc
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django():
+    if str(SERVER_DIR) not in sys.path:
+        sys.path.insert(0, str(SERVER_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'eld_trip_planner.settings')
+
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database(on_disk=False):
+    """Create a throwaway migrated test database, like the test runner does.
+
+    SQLite test databases live in memory unless ``on_disk`` is set; write benchmarks
+    need a real file so journaling and locking behave as in a deployment.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    with tempfile.TemporaryDirectory() as directory:
+        if on_disk and connection.vendor == 'sqlite':
+            connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(directory) / 'benchmark.sqlite3')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+
+def best_of(repeat, func, number=1):
+    """Fastest of ``repeat`` timings of ``number`` calls, with the cyclic GC disabled like timeit"""
+    timings = []
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            timings.append((time.perf_counter() - start) / number)
+    finally:
+        gc.enable()
+    return min(timings)
@@ -0,0 +1,147 @@
+"""Seeded synthetic trip inputs for benchmarks."""
+import random
+from typing import Dict, List
+
+# Rough bounding box of the continental United States
+LAT_RANGE = (25.0, 49.0)
+LNG_RANGE = (-124.0, -67.0)
+
+
+# Freight hubs and rough relative shares of the loads that start or end there
+HUBS = (
+    ('Chicago', 41.8781, -87.6298, 10), ('Dallas', 32.7767, -96.7970, 9), ('Atlanta', 33.7490, -84.3880, 8),
+    ('Los Angeles', 34.0522, -118.2437, 9), ('Houston', 29.7604, -95.3698, 7), ('Memphis', 35.1495, -90.0490, 5),
+    ('Indianapolis', 39.7684, -86.1581, 5), ('Columbus', 39.9612, -82.9988, 4), ('Newark', 40.7357, -74.1724, 6),
+    ('Kansas City', 39.0997, -94.5786, 4), ('Denver', 39.7392, -104.9903, 3), ('Phoenix', 33.4484, -112.0740, 4),
+    ('Seattle', 47.6062, -122.3321, 3), ('Charlotte', 35.2271, -80.8431, 4), ('Jacksonville', 30.3322, -81.6557, 3),
+    ('Salt Lake City', 40.7608, -111.8910, 2), ('Minneapolis', 44.9778, -93.2650, 3), ('Nashville', 36.1627, -86.7816, 4),
+)
+HUB_RADIUS_DEGREES = 0.5
+
+
+def random_location(rng: random.Random) -> Dict:
+    return {
+        'lat': round(rng.uniform(*LAT_RANGE), 6),
+        'lng': round(rng.uniform(*LNG_RANGE), 6),
+    }
+
+
+def random_trips(count: int, seed: int = 0) -> List[Dict]:
+    """Trip create payloads with endpoints spread uniformly over the continental US"""
+    rng = random.Random(seed)
+    return [
+        {
+            'current_location': random_location(rng),
+            'pickup_location': random_location(rng),
+            'dropoff_location': random_location(rng),
+            'current_cycle_used_hours': rng.randint(0, 70),
+        }
+        for _ in range(count)
+    ]
+
+
+def hub_trips(count: int, seed: int = 0) -> List[Dict]:
+    """Trip create payloads along lanes between freight hubs, weighted by hub volume.
+
+    Pickups and dropoffs fall within HUB_RADIUS_DEGREES of their hubs, and the
+    driver starts near the pickup hub, so lanes repeat the way dispatch traffic does.
+    """
+    rng = random.Random(seed)
+    weights = [hub[3] for hub in HUBS]
+
+    def near(hub):
+        return {
+            'lat': round(hub[1] + rng.uniform(-HUB_RADIUS_DEGREES, HUB_RADIUS_DEGREES), 6),
+            'lng': round(hub[2] + rng.uniform(-HUB_RADIUS_DEGREES, HUB_RADIUS_DEGREES), 6),
+        }
+
+    trips = []
+    for _ in range(count):
+        origin, destination = rng.choices(HUBS, weights)[0], rng.choices(HUBS, weights)[0]
+        while destination is origin:
+            destination = rng.choices(HUBS, weights)[0]
+        trips.append({
+            'current_location': near(origin),
+            'pickup_location': near(origin),
+            'dropoff_location': near(destination),
+            'current_cycle_used_hours': rng.randint(0, 60),
+        })
+    return trips
+
+
+def random_trip_of_length(min_km: float, max_km: float, seed: int = 0) -> Dict:
+    """Trip create payload whose pickup-to-dropoff leg is between ``min_km`` and ``max_km`` long"""
+    from trip_planner.road_graph import haversine_km
+
+    rng = random.Random(seed)
+    while True:
+        trip = random_trips(1, seed=rng.randrange(2 ** 32))[0]
+        pickup, dropoff = trip['pickup_location'], trip['dropoff_location']
+        if min_km <= haversine_km(pickup['lat'], pickup['lng'], dropoff['lat'], dropoff['lng']) <= max_km:
+            return trip
+
+
+def segments_for_days(days: int, seed: int = 0) -> List:
+    """PlannedSegments driven over ``days`` duty days, two 5-hour drives a day (restarts add off-duty days)"""
+    from trip_planner.engine import PlannedSegment
+
+    rng = random.Random(seed)
+    location = random_location(rng)
+    segments = []
+    for _ in range(days * 2):
+        next_location = random_location(rng)
+        segments.append(PlannedSegment('drive', location, next_location, 300, 500.0))
+        location = next_location
+    return segments
+
+
+def random_multi_stop_trip(stop_count: int, seed: int = 0, region_degrees: float = 6.0) -> Dict:
+    """Multi-stop create payload with paired pickups and dropoffs clustered in one region, like an LTL route"""
+    rng = random.Random(seed)
+    centre = random_location(rng)
+
+    def nearby():
+        return {
+            'lat': round(min(max(centre['lat'] + rng.uniform(-region_degrees, region_degrees) / 2, -90), 90), 6),
+            'lng': round(centre['lng'] + rng.uniform(-region_degrees, region_degrees), 6),
+        }
+
+    stops = []
+    for shipment in range(stop_count // 2):
+        stops.append({'type': 'pickup', 'location': nearby(), 'shipment': str(shipment)})
+        stops.append({'type': 'dropoff', 'location': nearby(), 'shipment': str(shipment)})
+    if stop_count % 2:
+        stops.append({'type': 'dropoff', 'location': nearby()})
+    rng.shuffle(stops)
+    return {'current_location': nearby(), 'stops': stops, 'current_cycle_used_hours': rng.randint(0, 70)}
+
+
+def synthetic_road_network(spacing_degrees: float = 0.25, seed: int = 0):
+    """Jittered grid of road nodes over the continental US with detouring edges.
+
+    Returns ``(nodes, edges)`` for road_graph.build_road_graph: roughly 85% of the
+    grid and diagonal links exist, each 0-40% longer than the straight line, so
+    routes detour like real roads do.
+    """
+    from trip_planner.road_graph import haversine_km
+
+    rng = random.Random(seed)
+    rows = int((LAT_RANGE[1] - LAT_RANGE[0]) / spacing_degrees) + 1
+    columns = int((LNG_RANGE[1] - LNG_RANGE[0]) / spacing_degrees) + 1
+    jitter = spacing_degrees * 0.3
+    nodes = [
+        (LAT_RANGE[0] + row * spacing_degrees + rng.uniform(-jitter, jitter),
+         LNG_RANGE[0] + column * spacing_degrees + rng.uniform(-jitter, jitter))
+        for row in range(rows) for column in range(columns)
+    ]
+
+    edges = []
+    for row in range(rows):
+        for column in range(columns):
+            node = row * columns + column
+            for row_step, column_step in ((0, 1), (1, 0), (1, 1)):
+                other_row, other_column = row + row_step, column + column_step
+                if other_row < rows and 0 <= other_column < columns and rng.random() < 0.85:
+                    other = other_row * columns + other_column
+                    edges.append((node, other, haversine_km(*nodes[node], *nodes[other]) * rng.uniform(1.0, 1.4)))
+    return nodes, edges
@@ -0,0 +1,172 @@
+"""Concurrent plan_trip write throughput against the configured database.
+
+Each thread plans and stores trips through TripPlanningService as fast as it can,
+like concurrent create requests. Run it once per settings profile to compare:
+
+    python benchmarks/write_throughput.py --threads 1 4 16
+    python benchmarks/write_throughput.py --threads 1 4 16 --sqlite-defaults   # without SQLITE_PRAGMAS
+    DJANGO_SETTINGS_MODULE=eld_trip_planner.settings_production DJANGO_SECRET_KEY=bench \\
+        python benchmarks/write_throughput.py --threads 1 4 16
+
+With ``--batch`` it instead stores already planned batches of trips from one
+thread, once with the bulk inserts of TripPlanningService.save_plans and once
+with one INSERT per trip, segment and log sheet, and reports both rates:
+
+    python benchmarks/write_throughput.py --batch 1 10 100
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.support import setup_django, test_database  # noqa: E402
+from benchmarks.synthetic import random_trips  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run(threads, seconds, seed):
+    """Plan trips from ``threads`` threads for ``seconds`` and return throughput, latency and errors"""
+    from django.db import DatabaseError, connection
+    from trip_planner.services import TripPlanningService
+
+    latencies, errors = [], {}
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(threads + 1)
+    deadline = [0.0]
+
+    def writer(index):
+        trips = random_trips(10000, seed=seed + index)
+        service = TripPlanningService()
+        mine, my_errors = [], {}
+        try:
+            # Open the connection before timing starts, as a long-running worker would have it
+            connection.ensure_connection()
+            start_barrier.wait()
+            for trip_data in trips:
+                if time.perf_counter() >= deadline[0]:
+                    break
+                started = time.perf_counter()
+                try:
+                    service.plan_trip(trip_data)
+                except DatabaseError as exc:
+                    message = str(exc).split('\n')[0]
+                    my_errors[message] = my_errors.get(message, 0) + 1
+                    continue
+                mine.append(time.perf_counter() - started)
+        finally:
+            connection.close()
+            with lock:
+                latencies.extend(mine)
+                for message, count in my_errors.items():
+                    errors[message] = errors.get(message, 0) + count
+
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    deadline[0] = time.perf_counter() + seconds
+    start_barrier.wait()
+    started = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'threads': threads,
+        'trips': len(latencies),
+        'trips_per_second': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'errors': errors,
+    }
+
+
+def save_row_by_row(service, planned_trips):
+    """What save_plans stores, written with one INSERT per row instead of one per table"""
+    from django.db import transaction
+    from trip_planner.geohash import location_geohash
+    from trip_planner.models import RouteSegment, Trip
+
+    with transaction.atomic():
+        for trip_data, plan in planned_trips:
+            trip = Trip(total_distance_km=plan.total_distance_km, estimated_days=plan.estimated_days,
+                        pickup_geohash=location_geohash(trip_data['pickup_location']), **trip_data)
+            log_sheets = service._build_log_sheets(trip, plan.log_days)
+            trip.save(force_insert=True)
+            for i, segment in enumerate(plan.segments):
+                RouteSegment.objects.create(trip=trip, sequence_order=i, **segment.as_dict())
+            for log_sheet in log_sheets:
+                log_sheet.save(force_insert=True)
+
+
+def run_batches(batch_size, rounds, seed):
+    """Trips per second storing ``rounds`` planned batches with save_plans and with save_row_by_row"""
+    from trip_planner.services import TripPlanningService
+
+    service = TripPlanningService()
+    trips = random_trips(batch_size, seed=seed)
+    planned_trips = list(zip(trips, service.plan(trips)))
+    result = {'batch': batch_size}
+    for name, save in (('bulk', service.save_plans), ('per_row', lambda batch: save_row_by_row(service, batch))):
+        save(planned_trips)  # warm up
+        started = time.perf_counter()
+        for _ in range(rounds):
+            save(planned_trips)
+        result[f'{name}_trips_per_second'] = rounds * batch_size / (time.perf_counter() - started)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sqlite-defaults', action='store_true',
+                        help="Ignore the SQLite OPTIONS in settings (rollback journal, deferred transactions)")
+    parser.add_argument('--batch', type=int, nargs='+',
+                        help='Compare bulk and per-row inserts for batches of these sizes instead')
+    parser.add_argument('--rounds', type=int, default=20, help='Batches stored per insert method with --batch')
+    parser.add_argument('--json', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import connection
+    if args.sqlite_defaults:
+        connection.settings_dict['OPTIONS'] = {}
+
+    results = []
+    with test_database(on_disk=True):
+        print(f"{connection.vendor} ({connection.settings_dict['NAME']}) options: {connection.settings_dict['OPTIONS']}")
+        if args.batch:
+            print(f"{'batch':>7} {'bulk/s':>9} {'rows/s':>9} {'speedup':>8}")
+            for batch_size in args.batch:
+                result = run_batches(batch_size, args.rounds, args.seed)
+                results.append(result)
+                bulk, per_row = result['bulk_trips_per_second'], result['per_row_trips_per_second']
+                print(f"{batch_size:>7} {bulk:>9.1f} {per_row:>9.1f} {bulk / per_row:>7.2f}x")
+        else:
+            print(f"{'threads':>7} {'trips':>7} {'trips/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+            for threads in args.threads:
+                result = run(threads, args.seconds, args.seed)
+                results.append(result)
+                p50, p99 = result['p50_ms'] or 0, result['p99_ms'] or 0
+                print(f"{threads:>7} {result['trips']:>7} {result['trips_per_second']:>8.1f} "
+                      f"{p50:>8.1f} {p99:>8.1f} {sum(result['errors'].values()):>7}")
+                for message, count in result['errors'].items():
+                    print(f"{'':>7} {count} x {message}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps({'vendor': connection.vendor, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
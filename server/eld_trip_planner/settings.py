@@ -43,6 +43,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its timings cover the whole stack; it removes itself unless instrumentation is enabled
+    'trip_planner.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -76,14 +78,56 @@ WSGI_APPLICATION = 'eld_trip_planner.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Run on every new SQLite connection. WAL lets readers proceed while a trip is being
+# written, and busy_timeout makes concurrent writers wait for the lock instead of failing
+# with "database is locked". mmap_size is in bytes; a negative cache_size is in KiB.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64000,
+}
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+            # Take the write lock when a transaction starts, so busy_timeout applies; a deferred
+            # transaction that upgrades from read to write fails immediately if another writer holds it
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
 
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Rendered trip responses are invalidated by other processes (e.g. manage.py regenerate_logs),
+# so they need a cache shared between processes; point 'responses' at Redis/Memcached when scaling out.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'response_cache',
+        'TIMEOUT': None,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Road distances and routes from an external routing server, kept across restarts
+    'routing': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'var' / 'routing_cache',
+        'TIMEOUT': 7 * 24 * 3600,
+        'OPTIONS': {'MAX_ENTRIES': 500000},
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -136,9 +180,75 @@ CORS_ALLOW_ALL_ORIGINS = True
 # Rest Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'trip_planner.renderers.ORJSONRenderer',
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
 }
+
+# Cache of planned route segments for repeated current/pickup/dropoff lanes.
+# Set 'BACKEND' to 'django' to share entries through CACHES[CACHE_ALIAS], or None to disable.
+TRIP_PLANNER_LANE_CACHE = {
+    'BACKEND': 'local',
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 3600,
+    'PRECISION': 4,
+}
+
+# Stored rendered JSON (with ETags) for the trip detail and logs endpoints
+TRIP_PLANNER_RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'responses',
+}
+
+# Road routing for drive legs: 'haversine' (great-circle lines), 'road_graph' with a file
+# built by `manage.py build_road_graph`, or 'osrm' with a self-hosted OSRM server at URL
+TRIP_PLANNER_ROUTING = {
+    'BACKEND': 'haversine',
+    'GRAPH_PATH': None,
+    'SNAP_RADIUS_KM': 25,
+    'URL': None,
+    'TIMEOUT': 2.0,
+    'FAILURE_THRESHOLD': 5,
+    'RESET_TIMEOUT': 30,
+    'CACHE_ALIAS': 'routing',
+}
+
+# Stop ordering for multi-stop trips (POST /trip-plans/multi-stop/)
+TRIP_PLANNER_OPTIMIZER = {
+    'TIME_BUDGET': 0.5,
+    'MAX_STOPS': 50,
+}
+
+# What-if comparisons (POST /trip-plans/scenarios/)
+TRIP_PLANNER_SCENARIOS = {
+    'MAX_SCENARIOS': 100,
+}
+
+# Analytics exports (GET /api/v1/exports/<kind>/ and `manage.py export_logs`)
+TRIP_PLANNER_EXPORT = {
+    'CHUNK_SIZE': 500,
+}
+
+# Background planning queue (POST /trip-plans/jobs/), run with `manage.py run_planning_workers`
+TRIP_PLANNER_JOBS = {
+    'CONCURRENCY': 2,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,
+    'LEASE_TIMEOUT': 600,
+}
+
+# Per-stage request timings: Server-Timing headers and GET /api/v1/metrics/ (Prometheus).
+# PROFILE_THRESHOLD_MS keeps cProfile output in var/profiles for requests slower than it.
+TRIP_PLANNER_INSTRUMENTATION = {
+    'ENABLED': False,
+    'PROFILE_THRESHOLD_MS': None,
+    'PROFILE_SAMPLE_RATE': 1.0,
+}
+
+# Pool the async (ASGI) create endpoint plans trips in, off the event loop.
+# 'thread' shares the lane cache with the rest of the process; 'process' sidesteps the GIL.
+TRIP_PLANNER_ASYNC = {
+    'PLANNING_EXECUTOR': 'thread',
+    'PLANNING_WORKERS': 4,
+}
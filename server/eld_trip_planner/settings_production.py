@@ -0,0 +1,70 @@
+"""
+Production settings: PostgreSQL, pooled connections and DEBUG off.
+
+Everything deployment-specific comes from the environment:
+
+    DJANGO_SETTINGS_MODULE=eld_trip_planner.settings_production
+    DJANGO_SECRET_KEY=...                  required
+    DJANGO_ALLOWED_HOSTS=api.example.com   comma separated
+    POSTGRES_DB / POSTGRES_USER / POSTGRES_PASSWORD / POSTGRES_HOST / POSTGRES_PORT
+    DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE    psycopg connection pool size (DB_POOL_MAX_SIZE=0 disables the pool)
+    DB_CONN_MAX_AGE                        persistent connection lifetime when the pool is disabled
+    INSTRUMENTATION_ENABLED=true           Server-Timing headers and /api/v1/metrics/
+    PROFILE_THRESHOLD_MS / PROFILE_SAMPLE_RATE   profile sampled requests slower than the threshold
+
+Requires ``psycopg[pool]``. ``docker compose up -d db`` starts a matching local
+Postgres for running the test suite against.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+
+
+def env(name, default=None):
+    value = os.environ.get(name, default)
+    if value is None:
+        raise ImproperlyConfigured(f"Set the {name} environment variable")
+    return value
+
+
+DEBUG = env('DJANGO_DEBUG', 'false').lower() == 'true'
+
+SECRET_KEY = env('DJANGO_SECRET_KEY')
+
+ALLOWED_HOSTS = [host.strip() for host in env('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if host.strip()]
+
+POOL_MAX_SIZE = int(env('DB_POOL_MAX_SIZE', '20'))
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': env('POSTGRES_DB', 'trip_planner'),
+        'USER': env('POSTGRES_USER', 'trip_planner'),
+        'PASSWORD': env('POSTGRES_PASSWORD', ''),
+        'HOST': env('POSTGRES_HOST', 'localhost'),
+        'PORT': env('POSTGRES_PORT', '5432'),
+        # Drop connections the server closed (e.g. after a failover) instead of failing a request
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+}
+
+if POOL_MAX_SIZE > 0:
+    # A pool shared by the process's threads; Django requires CONN_MAX_AGE = 0 with it
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(env('DB_POOL_MIN_SIZE', '2')),
+        'max_size': POOL_MAX_SIZE,
+        'timeout': 10,
+    }
+else:
+    # One persistent connection per thread, reused across requests
+    DATABASES['default']['CONN_MAX_AGE'] = int(env('DB_CONN_MAX_AGE', '600'))
+
+TRIP_PLANNER_INSTRUMENTATION = {
+    'ENABLED': env('INSTRUMENTATION_ENABLED', 'false').lower() == 'true',
+    'PROFILE_THRESHOLD_MS': float(env('PROFILE_THRESHOLD_MS')) if os.environ.get('PROFILE_THRESHOLD_MS') else None,
+    'PROFILE_SAMPLE_RATE': float(env('PROFILE_SAMPLE_RATE', '1.0')),
+}
@@ -20,4 +20,6 @@ from django.urls import path, include
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('trip_planner.urls')),
+    # Async views for ASGI deployments (uvicorn eld_trip_planner.asgi:application)
+    path('api/v1/async/', include('trip_planner.async_urls')),
 ]
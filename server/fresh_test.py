@@ -42,7 +42,7 @@ try:
         print(f"Day {log.day_number}:")
         print(f"  Summary: driving={log.summary['driving_hours']}h, on_duty={log.summary['on_duty_hours']}h, rest={log.summary['rest_hours']}h")
         print(f"  Graph Points:")
-        for point in log.graph_points:
+        for point in log.get_graph_points():
             print(f"    {point['time']} - {point['status']}")
         print()
         
@@ -19,6 +19,6 @@ for log in trip.logs.all():
     print(f"=== Day {log.day_number} ===")
     print(f"Summary: {json.dumps(log.summary, indent=2)}")
     print("Graph Points:")
-    for point in log.graph_points:
+    for point in log.get_graph_points():
         print(f"  {point['time']} - {point['status']}")
     print()
\ No newline at end of file
@@ -27,8 +27,9 @@ if trips.exists():
     print(f"Total log sheets for trip: {logs.count()}")
     
     for log in logs:
-        print(f"Day {log.day_number}: {len(log.graph_points)} graph points")
-        for point in log.graph_points:
+        graph_points = log.get_graph_points()
+        print(f"Day {log.day_number}: {len(graph_points)} graph points")
+        for point in graph_points:
             print(f"  {point}")
 else:
     print("No trips found. Creating a test trip...")
@@ -51,6 +52,7 @@ else:
     print(f"Generated log sheets: {logs.count()}")
     
     for log in logs:
-        print(f"Day {log.day_number}: {len(log.graph_points)} graph points")
-        for point in log.graph_points:
+        graph_points = log.get_graph_points()
+        print(f"Day {log.day_number}: {len(graph_points)} graph points")
+        for point in graph_points:
             print(f"  {point}")
\ No newline at end of file
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class TripPlannerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'trip_planner'
+
+    def ready(self):
+        # Connects the post_delete receiver that drops a deleted trip's stored responses
+        from . import response_cache  # noqa: F401
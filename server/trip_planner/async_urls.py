@@ -0,0 +1,9 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('trip-plans/', async_views.create_trip_plan, name='async_create_trip_plan'),
+    path('trip-plans/jobs/<uuid:job_id>/', async_views.get_trip_plan_job, name='async_get_trip_plan_job'),
+    path('trip-plans/<uuid:trip_id>/', async_views.get_trip_plan, name='async_get_trip_plan'),
+    path('trip-plans/<uuid:trip_id>/logs/', async_views.get_trip_logs, name='async_get_trip_logs'),
+]
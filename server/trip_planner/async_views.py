@@ -0,0 +1,112 @@
+"""Async versions of the create, detail and logs endpoints for ASGI deployments.
+
+Reads use Django's async ORM and the async cache API. Planning is CPU-bound,
+so it runs in a bounded pool (TRIP_PLANNER_ASYNC) rather than on the event
+loop, and only the final write goes through ``sync_to_async``.
+"""
+import asyncio
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from .engine import PlanningEngine
+from .jobs import await_job, job_payload, jobs_config
+from .lane_cache import get_lane_cache
+from .payloads import atrip_detail_payload, atrip_logs_payload, trip_payload
+from .renderers import ORJSONRenderer
+from .response_cache import arendered_response, conditional_response
+from .routing import get_router
+from .serializers import TripCreateSerializer
+from .services import TripPlanningService
+
+DEFAULT_ASYNC = {
+    'PLANNING_EXECUTOR': 'thread',  # 'thread' or 'process'
+    'PLANNING_WORKERS': 4,
+}
+
+_planning_executor = None
+
+
+def get_planning_executor():
+    """The pool planning runs in, built from TRIP_PLANNER_ASYNC on first use"""
+    global _planning_executor
+    if _planning_executor is None:
+        config = {**DEFAULT_ASYNC, **getattr(settings, 'TRIP_PLANNER_ASYNC', {})}
+        workers = config['PLANNING_WORKERS']
+        if config['PLANNING_EXECUTOR'] == 'process':
+            # Same setup as regenerate_logs: fresh interpreters with Django configured
+            _planning_executor = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=django.setup
+            )
+        else:
+            _planning_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='trip-planning')
+    return _planning_executor
+
+
+def _plan(trip_data):
+    # Same engine as TripPlanningService, so both paths route alike and share lane cache entries
+    return PlanningEngine(lane_cache=get_lane_cache(), router=get_router()).plan(**trip_data)
+
+
+def _json_response(data, status_code):
+    return HttpResponse(ORJSONRenderer().render(data), content_type='application/json', status=status_code)
+
+
+@csrf_exempt
+@require_POST
+async def create_trip_plan(request):
+    try:
+        data = json.loads(request.body)
+    except ValueError as exc:
+        return _json_response({'detail': f'JSON parse error - {exc}'}, status.HTTP_400_BAD_REQUEST)
+
+    serializer = TripCreateSerializer(data=data)
+    if not serializer.is_valid():
+        return _json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+
+    trip_data = serializer.validated_data
+    loop = asyncio.get_running_loop()
+    plan = await loop.run_in_executor(get_planning_executor(), _plan, dict(trip_data))
+    trip = (await sync_to_async(TripPlanningService().save_plans)([(trip_data, plan)]))[0]
+
+    return _json_response(trip_payload(trip, plan.segments), status.HTTP_201_CREATED)
+
+
+@require_GET
+async def get_trip_plan_job(request, job_id):
+    # ?wait=<seconds> long-polls without holding a worker thread
+    try:
+        wait = min(float(request.GET.get('wait', 0)), jobs_config()['MAX_WAIT'])
+    except ValueError:
+        return _json_response({'wait': ['A number of seconds is required.']}, status.HTTP_400_BAD_REQUEST)
+
+    job = await await_job(job_id, max(wait, 0))
+    if job is None:
+        return _json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+    return _json_response(job_payload(job), status.HTTP_200_OK)
+
+
+@require_GET
+async def get_trip_plan(request, trip_id):
+    return await _rendered_trip_response(request, 'detail', trip_id, atrip_detail_payload)
+
+
+@require_GET
+async def get_trip_logs(request, trip_id):
+    return await _rendered_trip_response(request, 'logs', trip_id, atrip_logs_payload)
+
+
+async def _rendered_trip_response(request, kind, trip_id, abuild_payload):
+    rendered = await arendered_response(kind, trip_id, abuild_payload)
+    if rendered is None:
+        # Same body DRF gives the sync views
+        return _json_response({'detail': 'Not found.'}, status.HTTP_404_NOT_FOUND)
+    return conditional_response(request, rendered)
@@ -0,0 +1,574 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import geometry
+from .hos import ON_DUTY_TYPES, HosClock, HosState
+from .instrumentation import stage
+
+
+class PlannedSegment(NamedTuple):
+    type: str
+    start_location: Dict
+    end_location: Dict
+    duration_minutes: int
+    distance_km: Optional[float] = None
+
+    def as_dict(self) -> Dict:
+        data = {
+            'type': self.type,
+            'start_location': self.start_location,
+            'end_location': self.end_location,
+            'duration_minutes': self.duration_minutes,
+        }
+        if self.distance_km is not None:
+            data['distance_km'] = self.distance_km
+        return data
+
+
+@dataclass(frozen=True)
+class PlannedLogDay:
+    day_number: int
+    graph_points: Tuple[Dict, ...]
+    summary: Dict
+
+
+@dataclass(frozen=True)
+class TripPlan:
+    segments: Tuple[PlannedSegment, ...]
+    log_days: Tuple[PlannedLogDay, ...]
+    total_distance_km: float
+    estimated_days: int
+
+
+@dataclass(frozen=True)
+class Replan:
+    """Remainder of a trip replanned from the driver's reported position"""
+    kept_segments: int                   # leading segments left as they are
+    segments: Tuple[PlannedSegment, ...]  # replace all segments after the kept ones
+    first_day: int                       # log days from this one on are replaced
+    log_days: Tuple[PlannedLogDay, ...]
+    total_distance_km: float
+    estimated_days: int
+    from_start: bool                     # nothing was kept, so every log day is planned again
+
+
+class PlanningEngine:
+    """Plans routes and HOS log days from plain inputs without touching the database.
+
+    Log days can be generated from any ordered sequence of objects exposing
+    ``type``, ``start_location``, ``end_location`` and ``duration_minutes``, so
+    the same code serves freshly planned segments and stored ``RouteSegment`` rows.
+
+    With a ``router`` (see routing.py) legs follow its road routes; legs it
+    cannot route, and all legs without one, follow great-circle lines. Log days
+    follow an HosClock (see hos.py) through the segments.
+    """
+
+    PICKUP_DURATION = 60  # minutes
+    DROPOFF_DURATION = 60  # minutes
+    REFUEL_DURATION = 30  # minutes
+    FUEL_INTERVAL_KM = 1609  # ~1000 miles
+    AVERAGE_SPEED_KMH = 100
+    MAX_DRIVING_HOURS = 11
+    STOP_DURATIONS = {'pickup': PICKUP_DURATION, 'dropoff': DROPOFF_DURATION}
+
+    def __init__(self, lane_cache=None, router=None):
+        # Optional LaneCache used to reuse segment plans for repeated lanes
+        self.lane_cache = lane_cache
+        self.router = router
+        # Lane cache entries are only shared by engines that route alike
+        self.routing = 'haversine' if router is None else router.identity()
+
+    def plan(self, current_location: Dict, pickup_location: Dict, dropoff_location: Dict,
+             current_cycle_used_hours: int) -> TripPlan:
+        with stage('route'):
+            segments = self.trip_segments(current_location, pickup_location, dropoff_location,
+                                          current_cycle_used_hours)
+        with stage('hos'):
+            log_days = self.log_days(segments, current_cycle_used_hours)
+        return TripPlan(
+            segments=segments,
+            log_days=log_days,
+            total_distance_km=self.total_distance(segments),
+            estimated_days=self.estimate_days(segments),
+        )
+
+    def trip_segments(self, current_location: Dict, pickup_location: Dict, dropoff_location: Dict,
+                      current_cycle_used_hours: int) -> Tuple[PlannedSegment, ...]:
+        """Route segments of a trip, from the lane cache when there is one"""
+        if self.lane_cache is None:
+            return self.route_segments(current_location, pickup_location, dropoff_location)
+        key = self.lane_cache.key(current_location, pickup_location, dropoff_location, current_cycle_used_hours,
+                                  self.routing)
+        segments = self.lane_cache.get(key)
+        if segments is None:
+            stops = _trip_stops(pickup_location, dropoff_location)
+            segments, fell_back = self._routed_segments(current_location, stops)
+            if not fell_back:
+                self.lane_cache.set(key, segments)
+        return segments
+
+    def plan_many(self, trips_data: List[Dict]) -> List[TripPlan]:
+        """Plan several trips, computing the route geometry of all of them in one vectorized pass"""
+        segments_by_trip = [None] * len(trips_data)
+        keys = [None] * len(trips_data)
+        misses = []
+
+        with stage('route'):
+            for i, trip_data in enumerate(trips_data):
+                if self.lane_cache is not None:
+                    keys[i] = self.lane_cache.key(**trip_data, routing=self.routing)
+                    segments_by_trip[i] = self.lane_cache.get(keys[i])
+                if segments_by_trip[i] is None:
+                    misses.append(i)
+
+            missed = [trips_data[i] for i in misses]
+            if self.router is None:
+                computed = [(segments, False) for segments in self.route_segments_many(missed)]
+            else:
+                computed = [
+                    self._routed_segments(t['current_location'], _trip_stops(t['pickup_location'], t['dropoff_location']))
+                    for t in missed
+                ]
+            for i, (segments, fell_back) in zip(misses, computed):
+                segments_by_trip[i] = segments
+                if self.lane_cache is not None and not fell_back:
+                    self.lane_cache.set(keys[i], segments)
+
+        with stage('hos'):
+            log_days_by_trip = [
+                self.log_days(segments, trip_data['current_cycle_used_hours'])
+                for trip_data, segments in zip(trips_data, segments_by_trip)
+            ]
+
+        return [
+            TripPlan(
+                segments=segments,
+                log_days=log_days,
+                total_distance_km=self.total_distance(segments),
+                estimated_days=self.estimate_days(segments),
+            )
+            for segments, log_days in zip(segments_by_trip, log_days_by_trip)
+        ]
+
+    def route_segments_many(self, trips_data: List[Dict]) -> List[Tuple[PlannedSegment, ...]]:
+        """Vectorized equivalent of calling route_segments for each trip"""
+        # Road routes are per-leg graph searches, so only great-circle legs are vectorized
+        if not geometry.available() or len(trips_data) < 2 or self.router is not None:
+            return [
+                self.route_segments(t['current_location'], t['pickup_location'], t['dropoff_location'])
+                for t in trips_data
+            ]
+
+        np = geometry.np
+        # Two legs per trip: current -> pickup, then pickup -> dropoff
+        leg_starts = []
+        leg_ends = []
+        for t in trips_data:
+            leg_starts.extend((t['current_location'], t['pickup_location']))
+            leg_ends.extend((t['pickup_location'], t['dropoff_location']))
+
+        start_lat = np.array([location['lat'] for location in leg_starts], dtype=np.float64)
+        start_lng = np.array([location['lng'] for location in leg_starts], dtype=np.float64)
+        end_lat = np.array([location['lat'] for location in leg_ends], dtype=np.float64)
+        end_lng = np.array([location['lng'] for location in leg_ends], dtype=np.float64)
+
+        distance_km = geometry.haversine_km(start_lat, start_lng, end_lat, end_lng)
+        drive_hours = distance_km / self.AVERAGE_SPEED_KMH
+
+        leg_index, start_km, segment_km = geometry.split_legs(distance_km, self.FUEL_INTERVAL_KM)
+        leg_distance = distance_km[leg_index]
+        progress_start = start_km / leg_distance
+        progress_end = (start_km + segment_km) / leg_distance
+        duration_minutes = ((segment_km / leg_distance) * drive_hours[leg_index] * 60).astype(np.int64)
+
+        piece_start = geometry.interpolate(start_lat[leg_index], start_lng[leg_index],
+                                           end_lat[leg_index], end_lng[leg_index], progress_start)
+        piece_end = geometry.interpolate(start_lat[leg_index], start_lng[leg_index],
+                                         end_lat[leg_index], end_lng[leg_index], progress_end)
+
+        # Back to Python scalars once, then assemble segments leg by leg
+        pieces = zip(
+            piece_start[0].tolist(), piece_start[1].tolist(), piece_end[0].tolist(), piece_end[1].tolist(),
+            duration_minutes.tolist(), segment_km.tolist(),
+        )
+        pieces_per_leg = np.bincount(leg_index, minlength=len(distance_km)).tolist()
+        leg_hours = drive_hours.tolist()
+
+        results = []
+        for trip_number, t in enumerate(trips_data):
+            segments = []
+            for leg_number, stop_type, duration in (
+                (2 * trip_number, 'pickup', self.PICKUP_DURATION),
+                (2 * trip_number + 1, 'dropoff', self.DROPOFF_DURATION),
+            ):
+                stop_location = leg_ends[leg_number]
+                for piece_number in range(pieces_per_leg[leg_number]):
+                    lat1, lng1, lat2, lng2, minutes, km = next(pieces)
+                    segment_end = {'lat': lat2, 'lng': lng2}
+                    segments.append(PlannedSegment('drive', {'lat': lat1, 'lng': lng1}, segment_end, minutes, km))
+                    if piece_number < pieces_per_leg[leg_number] - 1:
+                        segments.append(PlannedSegment('refuel', segment_end, segment_end, self.REFUEL_DURATION))
+
+                if leg_hours[leg_number] > self.MAX_DRIVING_HOURS:
+                    segments.append(PlannedSegment('rest', stop_location, stop_location, 10 * 60))
+                elif leg_hours[leg_number] > 8:
+                    segments.append(PlannedSegment('break', stop_location, stop_location, 30))
+
+                segments.append(PlannedSegment(stop_type, stop_location, stop_location, duration))
+            results.append(tuple(segments))
+
+        return results
+
+    def route_segments(self, current_location: Dict, pickup_location: Dict,
+                       dropoff_location: Dict) -> Tuple[PlannedSegment, ...]:
+        return self.stop_segments(current_location, _trip_stops(pickup_location, dropoff_location))
+
+    def stop_segments(self, current_location: Dict, stops: Iterable[Dict]) -> Tuple[PlannedSegment, ...]:
+        """Drive from stop to stop in the given order, with the stop's on-duty event at each one.
+
+        Each stop is a dict with ``type`` (``pickup`` or ``dropoff``) and ``location``.
+        """
+        return self._routed_segments(current_location, stops)[0]
+
+    def _routed_segments(self, current_location: Dict,
+                         stops: Iterable[Dict]) -> Tuple[Tuple[PlannedSegment, ...], bool]:
+        """stop_segments, and whether the router left any leg to a great-circle line"""
+        segments = []
+        fell_back = False
+        previous_location = current_location
+        for stop in stops:
+            location = stop['location']
+            route = self.router.route(previous_location, location) if self.router is not None else None
+            # The router may do better next time (e.g. once an OSRM server is back)
+            fell_back = fell_back or (route is None and self.router is not None)
+            distance = self.distance(previous_location, location) if route is None else route.distance_km
+            segments.extend(self.drive_segments(
+                start_location=previous_location,
+                end_location=location,
+                distance_km=distance,
+                drive_hours=distance / self.AVERAGE_SPEED_KMH,
+                route=route,
+            ))
+            segments.append(PlannedSegment(stop['type'], location, location, self.STOP_DURATIONS[stop['type']]))
+            previous_location = location
+
+        return tuple(segments), fell_back
+
+    def plan_stops(self, current_location: Dict, stops: Iterable[Dict], current_cycle_used_hours: int) -> TripPlan:
+        """Plan a trip through any number of stops, visited in the given order"""
+        with stage('route'):
+            segments = self.stop_segments(current_location, stops)
+        with stage('hos'):
+            log_days = self.log_days(segments, current_cycle_used_hours)
+        return TripPlan(
+            segments=segments,
+            log_days=log_days,
+            total_distance_km=self.total_distance(segments),
+            estimated_days=self.estimate_days(segments),
+        )
+
+    def replan(self, segments: Iterable, current_location: Dict, elapsed_minutes: int,
+               current_cycle_used_hours: float = 0,
+               reported_cycle_used_hours: Optional[float] = None) -> Optional[Replan]:
+        """Replan a trip's remaining stops from ``current_location``, ``elapsed_minutes`` into it.
+
+        Time is measured on the trip's log clock, which includes HOS breaks and
+        rests, for a trip that started with ``current_cycle_used_hours`` used.
+        Segments finished by then are kept; a drive in progress is cut short at
+        the current location and other segments in progress are finished as
+        planned. Log days are regenerated from the day of the last kept
+        segment, resuming the HOS clock where that day started.
+        ``reported_cycle_used_hours`` is the driver's cycle as of now; the
+        resumed clock takes it, less the on-duty time of the day so far.
+        Returns None if the trip is already over.
+        """
+        segments = list(segments)
+        timeline = []
+        self.log_days(segments, current_cycle_used_hours, timeline=timeline)
+
+        # The first segment not finished yet
+        current = next((i for i, state in enumerate(timeline)
+                        if state.minute + (segments[i].duration_minutes or 0) > elapsed_minutes), None)
+        if current is None:
+            return None
+
+        kept, replaced = current, []
+        started = timeline[current].minute
+        in_progress = started < elapsed_minutes
+        if in_progress:
+            segment = segments[current]
+            if segment.type == 'drive':
+                ratio = (elapsed_minutes - started) / segment.duration_minutes
+                replaced.append(PlannedSegment(
+                    'drive', segment.start_location, current_location, elapsed_minutes - started,
+                    (segment.distance_km or 0) * ratio,
+                ))
+            else:
+                kept += 1
+
+        stops = [
+            {'type': segment.type, 'location': segment.end_location}
+            for segment in segments[current + 1 if in_progress else current:]
+            if segment.type in self.STOP_DURATIONS
+        ]
+        replaced.extend(self.stop_segments(current_location, stops))
+        updated = segments[:kept] + replaced
+
+        # Days before the one the last unchanged (or cut short) segment is in stay as they are
+        last = current if in_progress else current - 1
+        if last >= 0:
+            first_day = timeline[last].day_number
+            first_segment = next(i for i, state in enumerate(timeline) if state.day_number == first_day)
+            resume = timeline[first_segment]
+            if reported_cycle_used_hours is not None:
+                # The day is replayed from its start, so the report goes back by what was worked since then
+                worked = sum(segment.duration_minutes or 0 for segment in updated[first_segment:last]
+                             if segment.type in ON_DUTY_TYPES)
+                if updated[last].type in ON_DUTY_TYPES:
+                    worked += elapsed_minutes - started if in_progress else updated[last].duration_minutes or 0
+                resume = resume._replace(cycle=max(0, int(reported_cycle_used_hours * 60) - worked))
+            log_days = self.log_days(updated[first_segment:], resume=resume)
+        else:
+            if reported_cycle_used_hours is not None:
+                current_cycle_used_hours = reported_cycle_used_hours
+            first_day, log_days = 1, self.log_days(updated, current_cycle_used_hours)
+        return Replan(
+            kept_segments=kept,
+            segments=tuple(replaced),
+            first_day=first_day,
+            log_days=log_days,
+            total_distance_km=self.total_distance(updated),
+            estimated_days=self.estimate_days(updated),
+            from_start=last < 0,
+        )
+
+    def drive_segments(self, start_location: Dict, end_location: Dict,
+                       distance_km: float, drive_hours: float, route=None) -> List[PlannedSegment]:
+        segments = []
+
+        # For simplicity, create one drive segment and add refuel stops every 1000 miles
+        current_distance = 0
+        while current_distance < distance_km:
+            # Check if we need a fuel stop
+            segment_distance = min(distance_km - current_distance, self.FUEL_INTERVAL_KM)
+            segment_hours = (segment_distance / distance_km) * drive_hours
+
+            # Calculate current and end locations for this segment
+            progress_start = current_distance / distance_km
+            progress_end = (current_distance + segment_distance) / distance_km
+
+            if route is None:
+                segment_start = self.interpolate(start_location, end_location, progress_start)
+                segment_end = self.interpolate(start_location, end_location, progress_end)
+            else:
+                segment_start = route.point_at(current_distance)
+                segment_end = route.point_at(current_distance + segment_distance)
+
+            segments.append(PlannedSegment(
+                'drive', segment_start, segment_end, int(segment_hours * 60), segment_distance
+            ))
+
+            current_distance += segment_distance
+
+            # Add refuel stop if not at destination and segment was full fuel interval
+            if current_distance < distance_km and segment_distance >= self.FUEL_INTERVAL_KM:
+                segments.append(PlannedSegment('refuel', segment_end, segment_end, self.REFUEL_DURATION))
+
+        # Add mandatory rest breaks based on driving hours
+        if drive_hours > self.MAX_DRIVING_HOURS:
+            segments.append(PlannedSegment('rest', end_location, end_location, 10 * 60))  # 10 hours mandatory rest
+        elif drive_hours > 8:
+            # Add 30-minute break after 8 hours
+            segments.append(PlannedSegment('break', end_location, end_location, 30))
+
+        return segments
+
+    def distance(self, location1: Dict, location2: Dict) -> float:
+        # Haversine formula for great circle distance
+        lat1, lon1 = math.radians(location1['lat']), math.radians(location1['lng'])
+        lat2, lon2 = math.radians(location2['lat']), math.radians(location2['lng'])
+
+        dlat = lat2 - lat1
+        dlon = lon2 - lon1
+
+        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
+        c = 2 * math.asin(math.sqrt(a))
+
+        # Earth's radius in kilometers
+        r = 6371
+        return c * r
+
+    def interpolate(self, start: Dict, end: Dict, ratio: float) -> Dict:
+        return {
+            'lat': start['lat'] + (end['lat'] - start['lat']) * ratio,
+            'lng': start['lng'] + (end['lng'] - start['lng']) * ratio,
+        }
+
+    def format_location(self, location: Dict) -> str:
+        """Format location dict into readable string"""
+        if not location:
+            return "UNKNOWN"
+
+        # If location has city/state info, use that
+        if 'city' in location and 'state' in location:
+            return f"{location['city']}, {location['state']}"
+
+        # Otherwise format coordinates
+        lat = location.get('lat', 0)
+        lng = location.get('lng', 0)
+        return f"{lat:.2f}, {lng:.2f}"
+
+    def total_distance(self, segments: Iterable) -> float:
+        return sum(s.distance_km for s in segments if s.distance_km)
+
+    def estimate_days(self, segments: Iterable) -> int:
+        total_hours = sum(
+            (s.duration_minutes or 0) / 60
+            for s in segments
+        )
+        return math.ceil(total_hours / 24)
+
+    def log_days(self, segments: Iterable, current_cycle_used_hours: float = 0,
+                 resume: Optional[HosState] = None, timeline: Optional[List] = None,
+                 departure_minute: int = 0, sleeper_split: bool = False) -> Tuple[PlannedLogDay, ...]:
+        """Generate HOS log days for segments driven in order, starting with ``current_cycle_used_hours`` used.
+
+        The trip leaves ``departure_minute`` minutes after midnight of the first
+        calendar day. Log days are duty days, so like every later day the first
+        one starts at 00:00 on its graph; timeline minutes stay on the calendar.
+        With ``sleeper_split`` rests are split 7/3 in the sleeper berth (see hos.py).
+        ``timeline``, if given, receives the HosState each segment starts in (after
+        any break or rest it waits for). Passing one of those states as ``resume``
+        continues the trip from that segment: ``segments`` then start with it and
+        the days match the full plan's from its day onward.
+        """
+        segments = list(segments)
+        if not segments:
+            return (PlannedLogDay(
+                day_number=1,
+                graph_points=(
+                    {'time': '06:00', 'status': 'off-duty'},
+                    {'time': '08:00', 'status': 'on-duty'},
+                    {'time': '18:00', 'status': 'off-duty'}
+                ),
+                summary={
+                    'driving_hours': 0,
+                    'on_duty_hours': 10,
+                    'rest_hours': 14
+                }
+            ),)
+
+        log_days = []
+        if resume is None:
+            clock = HosClock(current_cycle_used_hours, departure_minute, sleeper_split)
+        else:
+            clock = HosClock.restore(resume)
+
+        # Graph points for current day - start off-duty
+        graph_points = [{'time': '00:00', 'status': 'off-duty'}]
+
+        for index, segment in enumerate(segments):
+            segment_type = segment.type
+            segment_duration = segment.duration_minutes or 0
+
+            # A resumed segment already waited for whatever it needed
+            if resume is None or index > 0:
+                if clock.needs_break(segment_type, segment_duration):
+                    # Insert mandatory 30-minute break
+                    self._add_graph_point(graph_points, clock.minute, clock.day_start, 'break')
+                    clock.take_break()
+
+                restart = clock.needs_restart(segment_type, segment_duration)
+                if restart or clock.needs_rest(segment_type, segment_duration):
+                    # End current day - go off-duty, or into the sleeper berth for a split rest
+                    rest_status = 'sleeper' if clock.sleeper_split and not restart else 'off-duty'
+                    self._add_graph_point(graph_points, clock.minute, clock.day_start, rest_status)
+                    log_days.append(self._log_day(clock.day_number, graph_points, clock.driving, clock.on_duty))
+
+                    if restart:
+                        # 70-hour cycle used up: the 34-hour restart takes a whole off-duty day
+                        clock.restart()
+                        log_days.append(self._log_day(clock.day_number - 1, [{'time': '00:00', 'status': 'off-duty'}],
+                                                      0, 0))
+                    else:
+                        clock.rest()
+
+                    # New day starts off-duty
+                    graph_points = [{'time': '00:00', 'status': 'off-duty'}]
+
+            if timeline is not None:
+                timeline.append(clock.snapshot())
+
+            # Process the current segment
+            if segment_type == 'rest':
+                location = self.format_location(segment.start_location)
+                self._add_graph_point(graph_points, clock.minute, clock.day_start, 'rest', location, "REST")
+
+            elif segment_type == 'drive':
+                start_location = self.format_location(segment.start_location)
+                end_location = self.format_location(segment.end_location)
+                annotation = f"DRIVING {start_location} TO {end_location}"
+                self._add_graph_point(graph_points, clock.minute, clock.day_start, 'driving', start_location, annotation)
+
+            elif segment_type in ['pickup', 'dropoff', 'refuel']:
+                # On-duty activities
+                location = self.format_location(segment.start_location)
+                self._add_graph_point(graph_points, clock.minute, clock.day_start, 'on-duty', location,
+                                      segment_type.upper())
+
+            elif segment_type == 'break':
+                location = self.format_location(segment.start_location)
+                self._add_graph_point(graph_points, clock.minute, clock.day_start, 'break', location, "BREAK")
+
+            clock.record(segment_type, segment_duration)
+
+        # End final day - go off-duty
+        self._add_graph_point(graph_points, clock.minute, clock.day_start, 'off-duty')
+        log_days.append(self._log_day(clock.day_number, graph_points, clock.driving, clock.on_duty))
+
+        return tuple(log_days)
+
+    def _add_graph_point(self, graph_points, current_time_minutes, current_day_start, status, location=None, annotation=None):
+        # Convert absolute time to time within the current day
+        time_in_day = (current_time_minutes - current_day_start) % 1440
+        hours = time_in_day // 60
+        minutes = time_in_day % 60
+        time_str = f"{hours:02d}:{minutes:02d}"
+
+        # Avoid duplicate consecutive status entries
+        if not graph_points or graph_points[-1]['status'] != status:
+            point = {
+                'time': time_str,
+                'status': status
+            }
+
+            # Add location if provided
+            if location:
+                point['location'] = location
+
+            # Add annotation if provided
+            if annotation:
+                point['annotation'] = annotation
+
+            graph_points.append(point)
+
+    def _log_day(self, day_number, graph_points, daily_driving_minutes, daily_on_duty_minutes) -> PlannedLogDay:
+        driving_hours = round(daily_driving_minutes / 60, 1)
+        on_duty_hours = round(daily_on_duty_minutes / 60, 1)
+        rest_hours = round(24 - on_duty_hours, 1)
+
+        return PlannedLogDay(
+            day_number=day_number,
+            graph_points=tuple(graph_points),
+            summary={
+                'driving_hours': driving_hours,
+                'on_duty_hours': on_duty_hours,
+                'rest_hours': rest_hours
+            }
+        )
+
+
+def _trip_stops(pickup_location: Dict, dropoff_location: Dict) -> Tuple[Dict, Dict]:
+    return {'type': 'pickup', 'location': pickup_location}, {'type': 'dropoff', 'location': dropoff_location}
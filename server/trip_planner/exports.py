@@ -0,0 +1,297 @@
+"""Streaming exports of stored trips, route segments and log sheets.
+
+Rows are produced trip by trip in (created_at, id) order, optionally limited
+to a created_at range (``since`` inclusive, ``until`` exclusive). Trips are
+read with ``.iterator()``, which uses a server-side cursor on PostgreSQL, and
+segments or log sheets are read for CHUNK_SIZE trips at a time. Memory
+therefore depends on the chunk size and not on the size of the export. Log
+sheets come out with the same ``graph_points`` the logs endpoint returns.
+
+Formats are NDJSON (one JSON object per line), CSV (nested values as JSON
+text) and Parquet (nested values as JSON strings; needs pyarrow). All of them
+are written in blocks of about BUFFER_BYTES, so callers can stream them to a
+file or an HTTP response.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time
+from typing import Dict, Iterator, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .log_encoding import stored_graph_points
+from .models import LogSheet, RouteSegment, Trip
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - pyarrow is optional
+    pyarrow = None
+
+DEFAULT_EXPORT = {
+    'CHUNK_SIZE': 500,  # trips whose segments or log sheets are read per query
+    'BUFFER_BYTES': 256 * 1024,  # size of the blocks output is written in
+    'PARQUET_ROW_GROUP': 10000,  # rows per Parquet row group, which are held in memory until written
+}
+
+CONTENT_TYPES = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv; charset=utf-8',
+    'parquet': 'application/vnd.apache.parquet',
+}
+FORMATS = tuple(CONTENT_TYPES)
+
+# Columns of each kind of row, with their Parquet types; 'json' columns hold nested values
+COLUMNS = {
+    'trips': (
+        ('trip_id', 'string'), ('created_at', 'timestamp'), ('current_location', 'json'),
+        ('pickup_location', 'json'), ('dropoff_location', 'json'), ('current_cycle_used_hours', 'int'),
+        ('stops', 'json'), ('total_distance_km', 'float'), ('estimated_days', 'int'),
+    ),
+    'segments': (
+        ('trip_id', 'string'), ('trip_created_at', 'timestamp'), ('sequence_order', 'int'), ('type', 'string'),
+        ('start_location', 'json'), ('end_location', 'json'), ('duration_minutes', 'int'), ('distance_km', 'float'),
+    ),
+    'logs': (
+        ('trip_id', 'string'), ('trip_created_at', 'timestamp'), ('day', 'int'), ('summary', 'json'),
+        ('graph_points', 'json'),
+    ),
+}
+KINDS = tuple(COLUMNS)
+
+
+def export_config() -> Dict:
+    return {**DEFAULT_EXPORT, **getattr(settings, 'TRIP_PLANNER_EXPORT', {})}
+
+
+def parquet_available() -> bool:
+    return pyarrow is not None
+
+
+def parse_bound(value: str) -> Optional[datetime]:
+    """An aware datetime from an ISO 8601 date or datetime; dates mean their midnight. None if invalid"""
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def export_rows(kind: str, since=None, until=None, chunk_size: Optional[int] = None) -> Iterator[Tuple]:
+    """Tuples in COLUMNS[kind] order for every trip created in [since, until)"""
+    chunk_size = chunk_size or export_config()['CHUNK_SIZE']
+    trips = Trip.objects.order_by('created_at', 'id')
+    if since is not None:
+        trips = trips.filter(created_at__gte=since)
+    if until is not None:
+        trips = trips.filter(created_at__lt=until)
+
+    if kind == 'trips':
+        for row in trips.values_list(
+            'id', 'created_at', 'current_location', 'pickup_location', 'dropoff_location',
+            'current_cycle_used_hours', 'stops', 'total_distance_km', 'estimated_days',
+        ).iterator(chunk_size=chunk_size):
+            yield (str(row[0]),) + row[1:]
+        return
+
+    if kind == 'logs':
+        # As text, for _json_value to decode
+        trips = trips.annotate(strings=Cast('log_strings', TextField())).values_list('id', 'created_at', 'strings')
+    else:
+        trips = trips.values_list('id', 'created_at')
+    for batch in _batches(trips.iterator(chunk_size=chunk_size), chunk_size):
+        if kind == 'segments':
+            yield from _segment_rows(batch)
+        else:
+            yield from _log_rows(batch)
+
+
+def export_chunks(kind: str, export_format: str, rows) -> Iterator[bytes]:
+    """Encode rows from export_rows in blocks of about BUFFER_BYTES"""
+    config = export_config()
+    columns = [name for name, _ in COLUMNS[kind]]
+    if export_format == 'ndjson':
+        return _ndjson_chunks(columns, rows, config['BUFFER_BYTES'])
+    if export_format == 'csv':
+        return _csv_chunks(COLUMNS[kind], rows, config['BUFFER_BYTES'])
+    if export_format == 'parquet':
+        if pyarrow is None:
+            raise ValueError('Parquet exports need pyarrow')
+        return _parquet_chunks(COLUMNS[kind], rows, config['PARQUET_ROW_GROUP'])
+    raise ValueError(f"Unknown export format '{export_format}'")
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _segment_rows(trips):
+    created = {trip_id: created_at for trip_id, created_at in trips}
+    rows = RouteSegment.objects.filter(trip_id__in=list(created)).order_by('trip_id', 'sequence_order').values_list(
+        'trip_id', 'sequence_order', 'type', 'start_location', 'end_location', 'duration_minutes', 'distance_km'
+    )
+    by_trip = _group_by_trip(rows)
+    for trip_id, created_at in trips:
+        trip = str(trip_id)
+        for row in by_trip.get(trip_id, ()):
+            yield (trip, created_at) + row[1:]
+
+
+def _log_rows(trips):
+    # Log sheets far outnumber trips, so they skip the ORM's per-value converters (a json.loads
+    # per JSON column and a UUID per row) and are matched to trips by their ids as stored
+    queryset = LogSheet.objects.filter(trip_id__in=[trip[0] for trip in trips]).order_by(
+        'trip_id', 'day_number'
+    ).values_list('trip_id', 'day_number', 'graph_points', 'points', 'summary')
+    connection, pk = connections[queryset.db], Trip._meta.pk
+    db_ids = {trip_id: pk.get_db_prep_value(trip_id, connection) for trip_id, _, _ in trips}
+    rows = _raw_rows(queryset, connection)
+    by_trip = _group_by_trip(rows)
+    for trip_id, created_at, strings in trips:
+        trip, strings = str(trip_id), _json_value(strings)
+        for _, day_number, graph_points, points, summary in by_trip.get(db_ids[trip_id], ()):
+            if points is None:
+                graph_points = _json_value(graph_points)
+            else:
+                points, graph_points = bytes(points), None
+            yield trip, created_at, day_number, _json_value(summary), stored_graph_points(graph_points, points, strings)
+
+
+def _raw_rows(queryset, connection):
+    """The queryset's rows as the database driver returns them"""
+    sql, params = queryset.query.get_compiler(connection=connection).as_sql()
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def _json_value(value):
+    # Backends that decode JSON themselves hand over Python values
+    if isinstance(value, (str, bytes)):
+        return orjson.loads(value) if orjson is not None else json.loads(value)
+    return value
+
+
+def _group_by_trip(rows) -> Dict:
+    by_trip = {}
+    for row in rows:
+        by_trip.setdefault(row[0], []).append(row)
+    return by_trip
+
+
+def _ndjson_chunks(columns: Sequence[str], rows, buffer_bytes: int) -> Iterator[bytes]:
+    if orjson is not None:
+        def encode(record):
+            return orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+    else:
+        def encode(record):
+            return json.dumps(record, default=_json_default, separators=(',', ':')).encode() + b'\n'
+
+    lines, size = [], 0
+    for row in rows:
+        line = encode(dict(zip(columns, row)))
+        lines.append(line)
+        size += len(line)
+        if size >= buffer_bytes:
+            yield b''.join(lines)
+            lines, size = [], 0
+    if lines:
+        yield b''.join(lines)
+
+
+def _csv_chunks(columns, rows, buffer_bytes: int) -> Iterator[bytes]:
+    nested = [index for index, (_, column_type) in enumerate(columns) if column_type == 'json']
+    timestamps = [index for index, (_, column_type) in enumerate(columns) if column_type == 'timestamp']
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for row in rows:
+        row = list(row)
+        for index in nested:
+            row[index] = _json_text(row[index])
+        for index in timestamps:
+            row[index] = row[index].isoformat()
+        writer.writerow(row)
+        if buffer.tell() >= buffer_bytes:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+class _Drain(io.RawIOBase):
+    """Write-only file that hands over what has been written so far, for streaming Parquet"""
+
+    def __init__(self):
+        super().__init__()
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def take(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _parquet_chunks(columns, rows, row_group: int) -> Iterator[bytes]:
+    types = {'string': pyarrow.string(), 'json': pyarrow.string(), 'int': pyarrow.int64(),
+             'float': pyarrow.float64(), 'timestamp': pyarrow.timestamp('us', tz='UTC')}
+    schema = pyarrow.schema([(name, types[column_type]) for name, column_type in columns])
+    nested = [index for index, (_, column_type) in enumerate(columns) if column_type == 'json']
+
+    sink = _Drain()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    for batch in _batches(rows, row_group):
+        values = [list(column) for column in zip(*batch)]
+        for index in nested:
+            values[index] = [_json_text(value) for value in values[index]]
+        writer.write_table(pyarrow.Table.from_arrays(values, schema=schema))
+        yield sink.take()
+    writer.close()
+    yield sink.take()
+
+
+def _json_text(value) -> Optional[str]:
+    if value is None:
+        return None
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, separators=(',', ':'))
+
+
+def _json_default(value):
+    # Datetimes are the only non-JSON values in export rows
+    return value.isoformat()
@@ -0,0 +1,115 @@
+"""Geohash encoding and radius covers for the trip pickup index.
+
+Geohash cells are nested and numbered in Z-order, so all points in one cell share
+a prefix and a cell is a contiguous range of an ordinary text index.
+``covering_ranges`` turns a circle into a handful of such ranges.
+"""
+import math
+from typing import Dict, List, Optional, Tuple
+
+GEOHASH_PRECISION = 9  # ~5 m cells
+MAX_COVER_CELLS = 64
+KM_PER_DEGREE_LAT = 6371 * math.pi / 180
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _bits(precision: int) -> Tuple[int, int]:
+    """(latitude bits, longitude bits) of a geohash with ``precision`` characters"""
+    total = 5 * precision
+    return total // 2, total - total // 2
+
+
+def _cell_index(value: float, low: float, span: float, bits: int) -> int:
+    return min(int((value - low) / span * (1 << bits)), (1 << bits) - 1)
+
+
+def _interleave(lat_index: int, lng_index: int, precision: int) -> int:
+    """Z-order value of a cell; geohash bits alternate longitude, latitude, longitude..."""
+    lat_bits, lng_bits = _bits(precision)
+    value = 0
+    for bit in range(5 * precision):
+        if bit % 2 == 0:
+            lng_bits -= 1
+            value = (value << 1) | ((lng_index >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((lat_index >> lat_bits) & 1)
+    return value
+
+
+def _to_geohash(value: int, precision: int) -> str:
+    return ''.join(BASE32[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def encode_geohash(lat: float, lng: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_bits, lng_bits = _bits(precision)
+    lat_index = _cell_index(max(-90.0, min(90.0, float(lat))), -90, 180, lat_bits)
+    lng_index = _cell_index((float(lng) + 180) % 360 - 180, -180, 360, lng_bits)
+    return _to_geohash(_interleave(lat_index, lng_index, precision), precision)
+
+
+def location_geohash(location: Optional[Dict]) -> str:
+    """Geohash of a ``{'lat', 'lng'}`` location, or '' if it has no usable coordinates"""
+    try:
+        return encode_geohash(location['lat'], location['lng'])
+    except (KeyError, TypeError, ValueError):
+        return ''
+
+
+def covering_ranges(lat: float, lng: float, radius_km: float,
+                    max_cells: int = MAX_COVER_CELLS) -> List[Tuple[str, Optional[str]]]:
+    """Geohash ranges ``[start, end)`` (end None for "to the last cell") covering the circle's bounding box.
+
+    Uses the finest precision at which the box needs no more than ``max_cells`` cells.
+    """
+    lat_delta = radius_km / KM_PER_DEGREE_LAT
+    lat_low, lat_high = max(-90.0, lat - lat_delta), min(90.0, lat + lat_delta)
+    # Longitude degrees shrink towards the poles; take the box's widest latitude
+    widest_cos = math.cos(math.radians(max(abs(lat_low), abs(lat_high))))
+    lng_delta = 360.0 if widest_cos <= 0 else radius_km / (KM_PER_DEGREE_LAT * widest_cos)
+
+    best = None
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        cells = _box_cells(lat_low, lat_high, lng - lng_delta, lng + lng_delta, precision, max_cells)
+        if cells is None:
+            break
+        best = (cells, precision)
+    if best is None:
+        # The box is wider than the coarsest cells allow; scan every indexed trip
+        return [(BASE32[0], None)]
+    cells, precision = best
+
+    ranges = []
+    for value in sorted(cells):
+        if ranges and ranges[-1][1] == value:
+            ranges[-1][1] = value + 1
+        else:
+            ranges.append([value, value + 1])
+    return [
+        (_to_geohash(start, precision), _to_geohash(end, precision) if end < 1 << (5 * precision) else None)
+        for start, end in ranges
+    ]
+
+
+def _box_cells(lat_low, lat_high, lng_low, lng_high, precision, max_cells):
+    """Z-order values of the cells a lat/lng box touches, or None if there are more than ``max_cells``"""
+    lat_bits, lng_bits = _bits(precision)
+    lat_indexes = range(_cell_index(lat_low, -90, 180, lat_bits), _cell_index(lat_high, -90, 180, lat_bits) + 1)
+
+    lng_cells = 1 << lng_bits
+    if lng_high - lng_low >= 360:
+        lng_indexes = range(lng_cells)
+    else:
+        # Index unwrapped so a box crossing the antimeridian stays one run of cells
+        first = math.floor((lng_low + 180) / 360 * lng_cells)
+        last = math.floor((lng_high + 180) / 360 * lng_cells)
+        lng_indexes = [index % lng_cells for index in range(first, min(last, first + lng_cells - 1) + 1)]
+
+    if len(lat_indexes) * len(lng_indexes) > max_cells:
+        return None
+    return {
+        _interleave(lat_index, lng_index, precision)
+        for lat_index in lat_indexes
+        for lng_index in lng_indexes
+    }
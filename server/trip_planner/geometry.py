@@ -0,0 +1,59 @@
+"""Vectorized great-circle and route-splitting kernels for planning many trips at once.
+
+Every function works on whole NumPy arrays so bulk planning pays for one pass of
+array arithmetic instead of a dict lookup and scalar trig call per leg. The
+arithmetic mirrors ``PlanningEngine.distance``, ``drive_segments`` and
+``interpolate`` operation for operation, so both paths produce the same plans up
+to last-digit rounding differences between NumPy's and ``math``'s trig functions.
+"""
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - NumPy is optional
+    np = None
+
+EARTH_RADIUS_KM = 6371
+
+
+def available() -> bool:
+    return np is not None
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km between arrays of points given in degrees"""
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(a, dtype=np.float64)) for a in (lat1, lng1, lat2, lng2))
+
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlng / 2) ** 2
+    return 2 * np.arcsin(np.sqrt(a)) * EARTH_RADIUS_KM
+
+
+def split_legs(distance_km, interval_km: float):
+    """Split every leg into fuel-interval pieces.
+
+    Returns flat arrays ``(leg_index, start_km, segment_km)`` with one entry per
+    piece, ordered by leg and then by position along the leg.
+    """
+    distance_km = np.asarray(distance_km, dtype=np.float64)
+
+    # A leg of length d has one piece per k >= 0 with k * interval < d
+    counts = np.ceil(distance_km / interval_km)
+    counts[counts * interval_km < distance_km] += 1
+    counts[(counts > 0) & ((counts - 1) * interval_km >= distance_km)] -= 1
+    counts = counts.astype(np.int64)
+
+    leg_index = np.repeat(np.arange(len(distance_km)), counts)
+    first_piece = np.cumsum(counts) - counts
+    piece_number = np.arange(len(leg_index)) - first_piece[leg_index]
+
+    start_km = piece_number * float(interval_km)
+    segment_km = np.minimum(distance_km[leg_index] - start_km, interval_km)
+    return leg_index, start_km, segment_km
+
+
+def interpolate(start_lat, start_lng, end_lat, end_lng, ratio):
+    """Points at ``ratio`` of the way along straight lat/lng lines"""
+    lat = start_lat + (end_lat - start_lat) * ratio
+    lng = start_lng + (end_lng - start_lng) * ratio
+    return lat, lng
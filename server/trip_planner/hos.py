@@ -0,0 +1,158 @@
+"""Hours-of-service clock for property-carrying drivers.
+
+``HosClock`` holds a driver's HOS counters and is advanced one duty event at
+a time, in constant time per event. The engine asks it before each route
+segment whether the segment has to wait for a 30-minute break, a 10-hour rest
+(new log day) or a 34-hour restart. Then it records the segment. Building the
+log graph is left to the engine.
+
+    daily driving      at most 11 hours between 10-hour rests
+    daily on duty      at most 14 hours of on-duty time between 10-hour rests
+    log day            a duty day never runs past 24 hours on the log clock
+    30-minute break    after 8 hours of driving without an interruption
+    70 hours / 8 days  on-duty time in the cycle, starting from the hours used
+                       before the trip; a 34-hour restart (the 10-hour rest
+                       plus a whole off-duty day) sets it back to zero
+    sleeper split      optionally, the 10-hour rest is split 7/3: 7 hours in the
+                       sleeper berth end the duty day and the 3 hours are owed
+                       until the next 30-minute break, which they replace (or
+                       are added to the next rest if no break comes first)
+
+Cycle hours only come off with a restart, so the 8-day window is never rolled
+forward. That is conservative for trips that last longer than the window.
+
+``snapshot()`` captures the counters as an ``HosState`` tuple, and
+``HosClock.restore`` resumes from one. This is how a replan or a what-if
+branch continues from any point of a trip without replaying it.
+"""
+from typing import List, NamedTuple, Sequence, Tuple
+
+MAX_DRIVING_MINUTES = 11 * 60
+MAX_ON_DUTY_MINUTES = 14 * 60
+MAX_DAY_MINUTES = 24 * 60
+DRIVING_BEFORE_BREAK_MINUTES = 8 * 60
+BREAK_MINUTES = 30
+REST_MINUTES = 10 * 60
+MAX_CYCLE_MINUTES = 70 * 60
+RESTART_MINUTES = 34 * 60
+SPLIT_SLEEPER_MINUTES = 7 * 60
+SPLIT_OFF_DUTY_MINUTES = 3 * 60
+
+ON_DUTY_TYPES = frozenset(('drive', 'pickup', 'dropoff', 'refuel'))
+# Segment types that end a run of continuous driving
+INTERRUPTION_TYPES = frozenset(('pickup', 'dropoff', 'refuel', 'rest', 'break'))
+
+
+class HosState(NamedTuple):
+    minute: int           # log clock, minutes since midnight on the first log day
+    day_number: int
+    day_start: int        # log clock minute the current duty day started
+    driving: int          # driving minutes in the current duty day
+    on_duty: int          # on-duty minutes (driving included) in the current duty day
+    since_break: int      # driving minutes since the last interruption
+    cycle: int            # on-duty minutes in the 70-hour cycle
+    sleeper_split: bool   # rests are split 7/3
+    split_owed: bool      # the 3-hour part of the last split rest is still to be taken
+
+
+class HosClock:
+    __slots__ = HosState._fields
+
+    def __init__(self, cycle_used_hours: float = 0, departure_minute: int = 0, sleeper_split: bool = False):
+        # The first duty day, and its 24-hour window, start when the trip departs
+        self.minute = departure_minute
+        self.day_number = 1
+        self.day_start = departure_minute
+        self.driving = 0
+        self.on_duty = 0
+        self.since_break = 0
+        self.cycle = int(cycle_used_hours * 60)
+        self.sleeper_split = sleeper_split
+        self.split_owed = False
+
+    @classmethod
+    def restore(cls, state: HosState) -> 'HosClock':
+        clock = cls.__new__(cls)
+        (clock.minute, clock.day_number, clock.day_start, clock.driving, clock.on_duty,
+         clock.since_break, clock.cycle, clock.sleeper_split, clock.split_owed) = state
+        return clock
+
+    def snapshot(self) -> HosState:
+        return HosState(self.minute, self.day_number, self.day_start, self.driving, self.on_duty,
+                        self.since_break, self.cycle, self.sleeper_split, self.split_owed)
+
+    def needs_break(self, segment_type: str, minutes: int) -> bool:
+        """True if a drive of ``minutes`` has to wait for a 30-minute break first"""
+        return segment_type == 'drive' and minutes > 0 and self.since_break >= DRIVING_BEFORE_BREAK_MINUTES
+
+    def needs_rest(self, segment_type: str, minutes: int) -> bool:
+        """True if the segment would break a daily limit, so the duty day has to end before it"""
+        if segment_type == 'drive' and self.driving + minutes > MAX_DRIVING_MINUTES:
+            return True
+        if segment_type in ON_DUTY_TYPES and self.on_duty + minutes > MAX_ON_DUTY_MINUTES:
+            return True
+        return self.minute - self.day_start + minutes > MAX_DAY_MINUTES
+
+    def needs_restart(self, segment_type: str, minutes: int) -> bool:
+        """True if the segment would take the cycle past 70 hours"""
+        return segment_type in ON_DUTY_TYPES and self.cycle + minutes > MAX_CYCLE_MINUTES
+
+    def take_break(self):
+        """Take the 30-minute break, or the owed part of a split rest in its place"""
+        self.minute += SPLIT_OFF_DUTY_MINUTES if self.split_owed else BREAK_MINUTES
+        self.since_break = 0
+        self.split_owed = False
+
+    def rest(self):
+        """End the duty day with a 10-hour rest (or the sleeper part of a split one); the next day starts after it"""
+        if not self.sleeper_split:
+            self._start_day(REST_MINUTES, 1)
+            return
+        owed = SPLIT_OFF_DUTY_MINUTES if self.split_owed else 0
+        self._start_day(owed + SPLIT_SLEEPER_MINUTES, 1)
+        self.split_owed = True
+
+    def restart(self):
+        """End the duty day with a 34-hour restart, which also logs a whole off-duty day"""
+        self._start_day(RESTART_MINUTES, 2)
+        self.cycle = 0
+        self.split_owed = False
+
+    def record(self, segment_type: str, minutes: int):
+        self.minute += minutes
+        if segment_type == 'drive':
+            self.driving += minutes
+            self.since_break += minutes
+        elif segment_type in INTERRUPTION_TYPES:
+            self.since_break = 0
+        if segment_type in ON_DUTY_TYPES:
+            self.on_duty += minutes
+            self.cycle += minutes
+
+    def _start_day(self, off_minutes: int, days: int):
+        self.minute += off_minutes
+        self.day_start = self.minute
+        self.day_number += days
+        self.driving = self.on_duty = self.since_break = 0
+
+
+def violations(states: Sequence[HosState], segments: Sequence) -> List[Tuple[int, str]]:
+    """(day number, rule) for every segment that runs past a limit, given the state each one started in.
+
+    The planner rests before any segment that would break a limit, so these are
+    segments too long to fit in any duty day, such as drives over 11 hours.
+    """
+    found = []
+    for state, segment in zip(states, segments):
+        minutes = segment.duration_minutes or 0
+        if segment.type == 'drive':
+            if state.driving + minutes > MAX_DRIVING_MINUTES:
+                found.append((state.day_number, '11-hour driving'))
+            if state.since_break + minutes > DRIVING_BEFORE_BREAK_MINUTES:
+                found.append((state.day_number, '30-minute break'))
+        if segment.type in ON_DUTY_TYPES:
+            if state.on_duty + minutes > MAX_ON_DUTY_MINUTES:
+                found.append((state.day_number, '14-hour on duty'))
+            if state.cycle + minutes > MAX_CYCLE_MINUTES:
+                found.append((state.day_number, '70-hour cycle'))
+    return found
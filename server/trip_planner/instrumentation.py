@@ -0,0 +1,305 @@
+"""Per-request stage timings, Prometheus metrics and slow-request profiles.
+
+Code on the planning path marks its stages with ``stage(name)``:
+
+    validate     request validation
+    route        route segments (lane cache, router or great-circle legs)
+    hos          HOS log days
+    log_sheets   encoding log days into LogSheet rows
+    db_write     inserting the trip, its segments and log sheets
+    serialize    building the response payload
+    render       encoding it to JSON
+
+With TRIP_PLANNER_INSTRUMENTATION['ENABLED'], ``InstrumentationMiddleware``
+records the time and queries of each stage of a request and of the whole
+request. They are returned in a ``Server-Timing`` header and added to this
+process's totals, which ``GET /api/v1/metrics/`` serves in the Prometheus text
+format. Totals are per process, so scrape every worker. When disabled the
+middleware removes itself and ``stage()`` returns a shared no-op context
+manager after one context variable lookup.
+
+With PROFILE_THRESHOLD_MS set, a PROFILE_SAMPLE_RATE share of requests run
+under cProfile (or pyinstrument, if installed and chosen), and those slower
+than the threshold leave a profile in PROFILE_DIR. Async requests are timed
+but not profiled, and planning that async views hand to their pool is not
+broken down into stages.
+"""
+import cProfile
+import random
+import threading
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connection
+
+try:
+    import pyinstrument
+except ImportError:  # pragma: no cover - pyinstrument is optional
+    pyinstrument = None
+
+DEFAULT_INSTRUMENTATION = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,  # add the Server-Timing header to responses
+    'PROFILE_THRESHOLD_MS': None,  # keep profiles of requests slower than this; None disables profiling
+    'PROFILE_SAMPLE_RATE': 1.0,  # share of requests run under the profiler
+    'PROFILER': 'cprofile',  # or 'pyinstrument'
+    'PROFILE_DIR': None,  # defaults to var/profiles next to manage.py
+}
+
+# Upper bounds (seconds) of the request duration histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_timings: ContextVar[Optional['RequestTimings']] = ContextVar('trip_planner_timings', default=None)
+_NO_STAGE = nullcontext()
+
+
+def instrumentation_config() -> Dict:
+    return {**DEFAULT_INSTRUMENTATION, **getattr(settings, 'TRIP_PLANNER_INSTRUMENTATION', {})}
+
+
+class RequestTimings:
+    """Seconds, queries and entries of each stage of one request, in the order the stages first ran"""
+
+    __slots__ = ('stages', 'queries', 'seconds')
+
+    def __init__(self):
+        self.stages = {}
+        self.queries = 0
+        self.seconds = 0.0
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def add(self, name: str, seconds: float, queries: int):
+        totals = self.stages.get(name)
+        if totals is None:
+            self.stages[name] = [seconds, queries, 1]
+        else:
+            totals[0] += seconds
+            totals[1] += queries
+            totals[2] += 1
+
+    def server_timing(self) -> str:
+        metrics = [_server_timing_metric(name, seconds, queries) for name, (seconds, queries, _) in self.stages.items()]
+        metrics.append(_server_timing_metric('total', self.seconds, self.queries))
+        return ', '.join(metrics)
+
+
+class _Stage:
+    __slots__ = ('timings', 'name', 'queries', 'start', 'wrapper')
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.queries = 0
+        # Queries run in the calling thread, so the wrapper goes on its connection
+        self.wrapper = connection.execute_wrapper(self._count_query)
+        self.wrapper.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.wrapper.__exit__(*exc_info)
+        self.timings.add(self.name, seconds, self.queries)
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+
+def stage(name: str):
+    """Context manager timing a stage of the current request; a no-op outside instrumented requests"""
+    timings = _timings.get()
+    if timings is None:
+        return _NO_STAGE
+    return _Stage(timings, name)
+
+
+class Metrics:
+    """Process-wide request and stage totals, rendered in the Prometheus text format"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = {}  # (view, method, status) -> count
+            self.durations = {}  # view -> [bucket counts..., +Inf count, sum]
+            self.stages = {}  # (view, stage) -> [seconds, queries, count]
+            self.queries = {}  # view -> queries
+
+    def observe(self, view: str, method: str, status: int, timings: RequestTimings):
+        with self.lock:
+            key = (view, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.durations.get(view)
+            if histogram is None:
+                histogram = self.durations[view] = [0] * (len(DURATION_BUCKETS) + 1) + [0.0]
+            histogram[bisect_left(DURATION_BUCKETS, timings.seconds)] += 1
+            histogram[-1] += timings.seconds
+            self.queries[view] = self.queries.get(view, 0) + timings.queries
+            for name, (seconds, queries, count) in timings.stages.items():
+                totals = self.stages.setdefault((view, name), [0.0, 0, 0])
+                totals[0] += seconds
+                totals[1] += queries
+                totals[2] += count
+
+    def render(self) -> str:
+        with self.lock:
+            lines = [
+                '# HELP trip_planner_requests_total Requests handled, by view, method and status.',
+                '# TYPE trip_planner_requests_total counter',
+            ]
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'trip_planner_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+            lines += [
+                '# HELP trip_planner_request_duration_seconds Request duration, by view.',
+                '# TYPE trip_planner_request_duration_seconds histogram',
+            ]
+            for view, histogram in sorted(self.durations.items()):
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ('+Inf',), histogram):
+                    cumulative += count
+                    lines.append(f'trip_planner_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} '
+                                 f'{cumulative}')
+                lines.append(f'trip_planner_request_duration_seconds_sum{{view="{view}"}} {histogram[-1]}')
+                lines.append(f'trip_planner_request_duration_seconds_count{{view="{view}"}} {cumulative}')
+
+            lines += [
+                '# HELP trip_planner_request_queries_total Database queries, by view.',
+                '# TYPE trip_planner_request_queries_total counter',
+            ]
+            for view, queries in sorted(self.queries.items()):
+                lines.append(f'trip_planner_request_queries_total{{view="{view}"}} {queries}')
+
+            for metric, index, kind, help_text in (
+                ('stage_seconds_total', 0, 'counter', 'Time spent in each planning stage, by view.'),
+                ('stage_queries_total', 1, 'counter', 'Database queries issued in each planning stage, by view.'),
+                ('stage_calls_total', 2, 'counter', 'Times each planning stage ran, by view.'),
+            ):
+                lines += [f'# HELP trip_planner_{metric} {help_text}', f'# TYPE trip_planner_{metric} {kind}']
+                for (view, name), totals in sorted(self.stages.items()):
+                    lines.append(f'trip_planner_{metric}{{view="{view}",stage="{name}"}} {totals[index]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+
+
+class InstrumentationMiddleware:
+    """Times requests and their stages; removed from the stack unless TRIP_PLANNER_INSTRUMENTATION is enabled"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = instrumentation_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        if config['PROFILER'] not in ('cprofile', 'pyinstrument'):
+            raise ImproperlyConfigured(f"Unknown profiler '{config['PROFILER']}'")
+        if config['PROFILER'] == 'pyinstrument' and pyinstrument is None:
+            raise ImproperlyConfigured("TRIP_PLANNER_INSTRUMENTATION['PROFILER'] = 'pyinstrument' needs pyinstrument")
+
+        self.get_response = get_response
+        self.server_timing = config['SERVER_TIMING']
+        self.profile_threshold = config['PROFILE_THRESHOLD_MS']
+        self.profile_sample_rate = config['PROFILE_SAMPLE_RATE']
+        self.profiler = config['PROFILER']
+        self.profile_dir = Path(config['PROFILE_DIR'] or Path(settings.BASE_DIR) / 'var' / 'profiles')
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        profiler = self._start_profiler()
+        try:
+            with connection.execute_wrapper(timings.count_query):
+                start = time.perf_counter()
+                response = self.get_response(request)
+                timings.seconds = time.perf_counter() - start
+        finally:
+            _timings.reset(token)
+            if profiler is not None:
+                self._stop_profiler(profiler, request, timings)
+        self._record(request, response, timings)
+        return response
+
+    async def __acall__(self, request):
+        # Queries run in sync_to_async threads here, so only the stages count them
+        timings = RequestTimings()
+        token = _timings.set(timings)
+        try:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            timings.seconds = time.perf_counter() - start
+        finally:
+            _timings.reset(token)
+        timings.queries = sum(queries for _, queries, _ in timings.stages.values())
+        self._record(request, response, timings)
+        return response
+
+    def _record(self, request, response, timings):
+        metrics.observe(_view_name(request), request.method, response.status_code, timings)
+        if self.server_timing:
+            response['Server-Timing'] = timings.server_timing()
+
+    def _start_profiler(self):
+        if self.profile_threshold is None or random.random() >= self.profile_sample_rate:
+            return None
+        if self.profiler == 'pyinstrument':
+            profiler = pyinstrument.Profiler()
+            profiler.start()
+            return profiler
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger or coverage tool) owns the hook
+            return None
+        return profiler
+
+    def _stop_profiler(self, profiler, request, timings):
+        if self.profiler == 'pyinstrument':
+            profiler.stop()
+        else:
+            profiler.disable()
+        milliseconds = timings.seconds * 1000
+        if milliseconds < self.profile_threshold:
+            return
+
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        name = f"{stamp}-{_view_name(request)}-{milliseconds:.0f}ms"
+        if self.profiler == 'pyinstrument':
+            (self.profile_dir / f'{name}.html').write_text(profiler.output_html())
+        else:
+            profiler.dump_stats(self.profile_dir / f'{name}.prof')
+
+
+def _view_name(request) -> str:
+    match = getattr(request, 'resolver_match', None)
+    return (match.url_name or match.view_name) if match is not None else 'unmatched'
+
+
+def _server_timing_metric(name, seconds, queries) -> str:
+    return f'{name};dur={seconds * 1000:.3f};desc="{queries} queries"'
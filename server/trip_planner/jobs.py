@@ -0,0 +1,266 @@
+"""Database-backed queue for planning trips in the background.
+
+Jobs are rows in PlanningJob, so no broker is needed: the API inserts a queued
+row, and ``PlanningWorkerPool`` threads (``manage.py run_planning_workers``)
+claim rows with a conditional UPDATE, plan the trip in memory, then store it
+and record the outcome in one short transaction. Claiming with ``UPDATE ...
+WHERE status = 'queued'`` rather than ``SELECT ... FOR UPDATE SKIP LOCKED``
+keeps it working on SQLite too.
+"""
+import asyncio
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from .models import PlanningJob
+from .services import TripPlanningService
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOBS = {
+    'CONCURRENCY': 2,         # worker threads per run_planning_workers process
+    'POLL_INTERVAL': 1.0,     # seconds an idle worker waits before polling again
+    'MAX_ATTEMPTS': 3,
+    'RETRY_BACKOFF': 5,       # seconds before the first retry, doubled for each later one
+    'LEASE_TIMEOUT': 600,     # seconds before a running job whose worker died is requeued
+    'MAX_WAIT': 30,           # longest a status request may long-poll, in seconds
+    'METRICS_WINDOW': 1000,   # most recent finished jobs the timing metrics cover
+}
+
+
+def jobs_config() -> Dict:
+    return {**DEFAULT_JOBS, **getattr(settings, 'TRIP_PLANNER_JOBS', {})}
+
+
+class JobLeaseLost(Exception):
+    """The job was requeued (its lease expired) while this worker was still running it"""
+
+
+def submit_job(trip_data: Dict) -> PlanningJob:
+    """Queue validated trip data for planning"""
+    return PlanningJob.objects.create(
+        trip_data=trip_data,
+        max_attempts=jobs_config()['MAX_ATTEMPTS'],
+        available_at=timezone.now(),
+    )
+
+
+def claim_job(worker: str) -> Optional[PlanningJob]:
+    """Mark the oldest ready job as running for ``worker`` and return it, or None if none is ready"""
+    now = timezone.now()
+    candidates = list(
+        PlanningJob.objects
+        .filter(status=PlanningJob.QUEUED, available_at__lte=now)
+        .order_by('available_at')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in candidates:
+        # Another worker may claim the same row first; only one UPDATE can match
+        claimed = PlanningJob.objects.filter(id=job_id, status=PlanningJob.QUEUED).update(
+            status=PlanningJob.RUNNING, worker=worker, started_at=now, attempts=F('attempts') + 1,
+        )
+        if claimed:
+            return PlanningJob.objects.get(id=job_id)
+    return None
+
+
+def run_job(job: PlanningJob) -> PlanningJob:
+    """Plan and store the job's trip, recording success, a retry or the final failure"""
+    try:
+        # Planning needs no database, so it runs before the transaction takes the write lock
+        service = TripPlanningService()
+        plan = service.plan([job.trip_data])[0]
+        with transaction.atomic():
+            trip = service.save_plans([(job.trip_data, plan)])[0]
+            job.status = PlanningJob.SUCCEEDED
+            job.trip = trip
+            job.error = ''
+            job.finished_at = timezone.now()
+            # The trip is only kept if this worker still holds the job
+            updated = PlanningJob.objects.filter(
+                id=job.id, status=PlanningJob.RUNNING, worker=job.worker
+            ).update(status=job.status, trip=trip, error=job.error, finished_at=job.finished_at)
+            if not updated:
+                raise JobLeaseLost(job.id)
+    except JobLeaseLost:
+        logger.warning("Planning job %s was requeued while %s was running it", job.id, job.worker)
+        job.refresh_from_db()
+    except Exception as exc:
+        logger.exception("Planning job %s failed (attempt %s of %s)", job.id, job.attempts, job.max_attempts)
+        _record_failure(job, f"{type(exc).__name__}: {exc}")
+    return job
+
+
+def _record_failure(job: PlanningJob, error: str):
+    now = timezone.now()
+    job.error = error
+    if job.attempts < job.max_attempts:
+        job.status = PlanningJob.QUEUED
+        job.available_at = now + timedelta(seconds=jobs_config()['RETRY_BACKOFF'] * 2 ** (job.attempts - 1))
+    else:
+        job.status = PlanningJob.FAILED
+        job.finished_at = now
+    PlanningJob.objects.filter(id=job.id, status=PlanningJob.RUNNING, worker=job.worker).update(
+        status=job.status, error=job.error, available_at=job.available_at, finished_at=job.finished_at,
+    )
+
+
+def requeue_stale_jobs() -> int:
+    """Return running jobs whose lease expired (their worker died) to the queue, or fail them if out of attempts"""
+    now = timezone.now()
+    stale = PlanningJob.objects.filter(
+        status=PlanningJob.RUNNING, started_at__lt=now - timedelta(seconds=jobs_config()['LEASE_TIMEOUT'])
+    )
+    error = 'Worker lease expired'
+    failed = stale.filter(attempts__gte=F('max_attempts')).update(
+        status=PlanningJob.FAILED, error=error, finished_at=now
+    )
+    requeued = stale.update(status=PlanningJob.QUEUED, error=error, available_at=now)
+    return failed + requeued
+
+
+def wait_for_job(job_id, timeout: float, poll_interval: float = 0.25) -> Optional[PlanningJob]:
+    """Fetch a job, polling until it finishes or ``timeout`` seconds pass"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = PlanningJob.objects.filter(id=job_id).first()
+        if job is None or job.status in PlanningJob.FINISHED_STATUSES or time.monotonic() >= deadline:
+            return job
+        time.sleep(min(poll_interval, max(0, deadline - time.monotonic())))
+
+
+async def await_job(job_id, timeout: float, poll_interval: float = 0.25) -> Optional[PlanningJob]:
+    """Async version of wait_for_job that frees the event loop between polls"""
+    deadline = time.monotonic() + timeout
+    while True:
+        job = await PlanningJob.objects.filter(id=job_id).afirst()
+        if job is None or job.status in PlanningJob.FINISHED_STATUSES or time.monotonic() >= deadline:
+            return job
+        await asyncio.sleep(min(poll_interval, max(0, deadline - time.monotonic())))
+
+
+def job_payload(job: PlanningJob) -> Dict:
+    """Status response for a job, including its queue and service time so far"""
+    now = timezone.now()
+    started_at, finished_at = job.started_at, job.finished_at
+    return {
+        'job_id': str(job.id),
+        'status': job.status,
+        'trip_id': str(job.trip_id) if job.trip_id else None,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'error': job.error or None,
+        'created_at': job.created_at.isoformat(),
+        'started_at': started_at.isoformat() if started_at else None,
+        'finished_at': finished_at.isoformat() if finished_at else None,
+        # started_at is the start of the latest attempt, so queue time includes retry backoff
+        'queue_seconds': ((started_at or now) - job.created_at).total_seconds(),
+        'service_seconds': ((finished_at or now) - started_at).total_seconds() if started_at else None,
+    }
+
+
+def queue_metrics() -> Dict:
+    """Queue depth by status plus queue and service time percentiles over recent finished jobs"""
+    now = timezone.now()
+    counts = dict(PlanningJob.objects.order_by().values_list('status').annotate(Count('id')))
+    queued = PlanningJob.objects.filter(status=PlanningJob.QUEUED)
+    oldest = queued.order_by('created_at').values_list('created_at', flat=True).first()
+
+    recent = list(
+        PlanningJob.objects
+        .filter(status__in=PlanningJob.FINISHED_STATUSES, started_at__isnull=False)
+        .order_by('-finished_at')
+        .values_list('created_at', 'started_at', 'finished_at')[:jobs_config()['METRICS_WINDOW']]
+    )
+    queue_times = sorted((started - created).total_seconds() for created, started, _ in recent)
+    service_times = sorted((finished - started).total_seconds() for _, started, finished in recent)
+
+    return {
+        **{status: counts.get(status, 0) for status, _ in PlanningJob.STATUS_CHOICES},
+        'ready': queued.filter(available_at__lte=now).count(),
+        'oldest_queued_seconds': (now - oldest).total_seconds() if oldest else None,
+        'recent_jobs': len(recent),
+        'queue_seconds': _summary(queue_times),
+        'service_seconds': _summary(service_times),
+    }
+
+
+def _summary(sorted_values) -> Optional[Dict]:
+    if not sorted_values:
+        return None
+
+    def percentile(fraction):
+        return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+    return {
+        'mean': sum(sorted_values) / len(sorted_values),
+        'p50': percentile(0.50),
+        'p95': percentile(0.95),
+        'max': sorted_values[-1],
+    }
+
+
+class PlanningWorkerPool:
+    """Threads that claim and run planning jobs until stopped"""
+
+    def __init__(self, concurrency: Optional[int] = None, poll_interval: Optional[float] = None,
+                 name: Optional[str] = None):
+        config = jobs_config()
+        self.concurrency = concurrency or config['CONCURRENCY']
+        self.poll_interval = config['POLL_INTERVAL'] if poll_interval is None else poll_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self.stop_event = threading.Event()
+        self.processed = 0
+        self._processed_lock = threading.Lock()
+
+    def run(self, burst: bool = False):
+        """Run the workers until ``stop()``, or with ``burst`` until no job is ready"""
+        threads = [
+            threading.Thread(target=self._work, args=(f"{self.name}/{index}", burst), daemon=True)
+            for index in range(self.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.processed
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _work(self, worker, burst):
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    job = claim_job(worker)
+                except DatabaseError:
+                    # e.g. SQLite busy with another writer; the job stays queued for the next poll
+                    logger.exception("Worker %s could not claim a job", worker)
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                if job is None:
+                    if burst:
+                        return
+                    requeue_stale_jobs()
+                    self.stop_event.wait(self.poll_interval)
+                    continue
+                try:
+                    run_job(job)
+                except DatabaseError:
+                    # Could not even record the failure; the lease timeout requeues the job
+                    logger.exception("Worker %s lost track of planning job %s", worker, job.id)
+                    continue
+                with self._processed_lock:
+                    self.processed += 1
+        finally:
+            # Each thread has its own database connection
+            connection.close()
@@ -0,0 +1,140 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+DEFAULT_LANE_CACHE = {
+    'BACKEND': 'local',  # 'local', 'django' or None to disable
+    'MAX_ENTRIES': 1024,
+    'TIMEOUT': 3600,  # seconds
+    'PRECISION': 4,  # decimal places kept from lat/lng, ~11 m
+    'CACHE_ALIAS': 'default',
+    'KEY_PREFIX': 'trip_planner:lane',
+}
+
+
+class LaneCache:
+    """Bounded LRU/TTL cache of planned route segments keyed on quantized lanes.
+
+    With the ``django`` backend entries live in one of Django's configured caches
+    so they can be shared between workers; expiry and eviction are then handled
+    by that cache and only hits and misses are counted here.
+    """
+
+    def __init__(self, backend: str = 'local', max_entries: int = 1024, timeout: float = 3600,
+                 precision: int = 4, cache_alias: str = 'default', key_prefix: str = 'trip_planner:lane'):
+        if backend not in ('local', 'django'):
+            raise ValueError(f"Unknown lane cache backend '{backend}'")
+        self.backend = backend
+        self.max_entries = max_entries
+        self.timeout = timeout
+        self.precision = precision
+        self.cache_alias = cache_alias
+        self.key_prefix = key_prefix
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, current_location: Dict, pickup_location: Dict, dropoff_location: Dict,
+            current_cycle_used_hours: int, routing: str = 'haversine') -> str:
+        """Key of a lane planned by engines with the given routing (PlanningEngine.routing)"""
+        lane = ':'.join(
+            self._quantize(location) for location in (current_location, pickup_location, dropoff_location)
+        )
+        return f"{self.key_prefix}:{routing}:{lane}:{current_cycle_used_hours}"
+
+    def get(self, key: str):
+        """Look up a lane, counting the hit or miss"""
+        value = self._get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key: str, value):
+        self._set(key, value)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': self.backend,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'size': len(self._entries) if self.backend == 'local' else None,
+                'max_entries': self.max_entries,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def _quantize(self, location: Dict) -> str:
+        point = f"{round(location['lat'], self.precision)},{round(location['lng'], self.precision)}"
+        # City/state labels end up in the planned segments, so they are part of the lane too
+        if 'city' in location and 'state' in location:
+            point += f",{location['city']},{location['state']}"
+        return point
+
+    def _get(self, key: str):
+        if self.backend == 'django':
+            return caches[self.cache_alias].get(key)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.evictions += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def _set(self, key: str, value):
+        if self.backend == 'django':
+            caches[self.cache_alias].set(key, value, self.timeout)
+            return
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.timeout, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+
+_lane_cache = None
+_lane_cache_lock = threading.Lock()
+
+
+def get_lane_cache() -> Optional[LaneCache]:
+    """Return the process-wide lane cache configured by TRIP_PLANNER_LANE_CACHE, if enabled"""
+    global _lane_cache
+    config = {**DEFAULT_LANE_CACHE, **getattr(settings, 'TRIP_PLANNER_LANE_CACHE', {})}
+    if not config['BACKEND']:
+        return None
+
+    with _lane_cache_lock:
+        if _lane_cache is None:
+            _lane_cache = LaneCache(
+                backend=config['BACKEND'],
+                max_entries=config['MAX_ENTRIES'],
+                timeout=config['TIMEOUT'],
+                precision=config['PRECISION'],
+                cache_alias=config['CACHE_ALIAS'],
+                key_prefix=config['KEY_PREFIX'],
+            )
+        return _lane_cache
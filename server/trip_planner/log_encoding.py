@@ -0,0 +1,156 @@
+"""Compact binary storage for log sheet graph points.
+
+A day's graph points are stored as one blob of parallel arrays instead of a
+JSON list of dicts:
+
+    version   uint8     FORMAT_VERSION
+    count     uint16    number of points
+    minutes   int16[n]  minute of the day ("HH:MM")
+    status    uint8[n]  index into STATUSES
+    location  int16[n]  index into the trip's string table, or NO_STRING
+    annotation int16[n] index into the string table, NO_STRING, or a DRIVING reference
+
+Location and annotation strings are interned in ``Trip.log_strings``, one table
+per trip, so a location shared by several points and days is stored once. The
+drive annotation ``"DRIVING <location> TO <end>"`` is stored as a reference to
+the end location (``DRIVING_BASE - index``) rather than as its own string.
+
+Points the format cannot reproduce exactly (other keys, key order or statuses)
+are left as JSON in ``LogSheet.graph_points`` instead.
+"""
+import re
+import struct
+from typing import Dict, Iterable, List, Optional, Sequence
+
+FORMAT_VERSION = 1
+
+# Codes are stored in the database: only ever append to this tuple
+STATUSES = ('off-duty', 'on-duty', 'driving', 'break', 'rest', 'sleeper')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+NO_STRING = -1
+DRIVING_BASE = -2
+MAX_STRINGS = 32767
+
+_HEADER = struct.Struct('<BH')
+_TIME = re.compile(r'\d\d:\d\d\Z')
+_KEY_ORDERS = {
+    ('time', 'status'),
+    ('time', 'status', 'location'),
+    ('time', 'status', 'annotation'),
+    ('time', 'status', 'location', 'annotation'),
+}
+
+
+def _format_time(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+_TIMES = [_format_time(minute) for minute in range(24 * 60)]
+
+
+class StringTable:
+    """Per-trip list of interned location and annotation strings"""
+
+    def __init__(self, strings: Iterable[str] = ()):
+        self.strings = list(strings)
+        self._indexes = {value: index for index, value in enumerate(self.strings)}
+
+    def intern(self, value: str) -> int:
+        index = self._indexes.get(value)
+        if index is None:
+            index = self._indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def encode_graph_points(points: Sequence[Dict], table: StringTable) -> Optional[bytes]:
+    """Pack points into the binary format, or return None if they cannot be reproduced exactly"""
+    count = len(points)
+    if count > 0xFFFF:
+        return None
+
+    minutes, statuses, locations, annotations = [], [], [], []
+    for point in points:
+        if not isinstance(point, dict) or tuple(point) not in _KEY_ORDERS:
+            return None
+
+        time, status = point['time'], point['status']
+        if not isinstance(time, str) or not _TIME.match(time) or status not in STATUS_CODES:
+            return None
+        minute = int(time[:2]) * 60 + int(time[3:])
+        if _format_time(minute) != time:
+            return None
+
+        location = point.get('location')
+        annotation = point.get('annotation')
+        if not all(value is None or isinstance(value, str) for value in (location, annotation)):
+            return None
+
+        location_index = NO_STRING if location is None else table.intern(location)
+        if annotation is None:
+            annotation_index = NO_STRING
+        else:
+            end = _driving_end(annotation, location)
+            annotation_index = DRIVING_BASE - table.intern(end) if end is not None else table.intern(annotation)
+
+        minutes.append(minute)
+        statuses.append(STATUS_CODES[status])
+        locations.append(location_index)
+        annotations.append(annotation_index)
+
+    if len(table.strings) > MAX_STRINGS:
+        return None
+    return _HEADER.pack(FORMAT_VERSION, count) + struct.pack(
+        f'<{count}h{count}B{count}h{count}h', *minutes, *statuses, *locations, *annotations
+    )
+
+
+def decode_graph_points(data, strings: Sequence[str]) -> List[Dict]:
+    """Rebuild the JSON graph points a blob from encode_graph_points was made from"""
+    version, count = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown graph point format version {version}")
+
+    values = struct.unpack_from(f'<{count}h{count}B{count}h{count}h', data, _HEADER.size)
+    points = []
+    for minute, status, location, annotation in zip(
+        values[:count], values[count:2 * count], values[2 * count:3 * count], values[3 * count:]
+    ):
+        point = {
+            'time': _TIMES[minute] if minute < len(_TIMES) else _format_time(minute),
+            'status': STATUSES[status],
+        }
+        if location != NO_STRING:
+            point['location'] = strings[location]
+        if annotation <= DRIVING_BASE:
+            point['annotation'] = f"DRIVING {point['location']} TO {strings[DRIVING_BASE - annotation]}"
+        elif annotation != NO_STRING:
+            point['annotation'] = strings[annotation]
+        points.append(point)
+    return points
+
+
+def log_sheet_points(points: Sequence[Dict], table: StringTable) -> Dict:
+    """LogSheet field values for a day's points: the binary encoding when possible, JSON otherwise"""
+    encoded = encode_graph_points(points, table)
+    if encoded is None:
+        return {'points': None, 'graph_points': list(points)}
+    return {'points': encoded, 'graph_points': None}
+
+
+def stored_graph_points(graph_points, points, strings: Sequence[str]) -> List[Dict]:
+    """The API's graph_points for a stored LogSheet row"""
+    if points is None:
+        return graph_points
+    return decode_graph_points(points, strings)
+
+
+def _driving_end(annotation: str, location: Optional[str]) -> Optional[str]:
+    """The end location of a "DRIVING <location> TO <end>" annotation, if it is one"""
+    if location is None:
+        return None
+    prefix = f"DRIVING {location} TO "
+    if annotation.startswith(prefix):
+        return annotation[len(prefix):]
+    return None
@@ -0,0 +1,46 @@
+import csv
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.road_graph import DEFAULT_CELL_DEGREES, WITNESS_SETTLE_LIMIT, build_road_graph
+
+
+class Command(BaseCommand):
+    help = 'Build the road graph file used by the road_graph routing backend from node and edge CSV files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('nodes', help='CSV with id,lat,lng columns, e.g. the nodes of an OSM extract')
+        parser.add_argument('edges', help='CSV with from,to and optional distance_km columns (node ids)')
+        parser.add_argument('output', help='Graph file to write (TRIP_PLANNER_ROUTING["GRAPH_PATH"])')
+        parser.add_argument('--cell-degrees', type=float, default=DEFAULT_CELL_DEGREES,
+                            help=f'Size of the node lookup grid cells (default: {DEFAULT_CELL_DEGREES})')
+        parser.add_argument('--witness-settle-limit', type=int, default=WITNESS_SETTLE_LIMIT,
+                            help='Witness search size; larger builds slower but adds fewer shortcuts')
+
+    def handle(self, *args, **options):
+        node_ids = {}
+        nodes = []
+        with open(options['nodes'], newline='') as nodes_file:
+            for row in csv.DictReader(nodes_file):
+                node_ids[row['id']] = len(nodes)
+                nodes.append((float(row['lat']), float(row['lng'])))
+
+        edges = []
+        with open(options['edges'], newline='') as edges_file:
+            for line, row in enumerate(csv.DictReader(edges_file), start=2):
+                try:
+                    u, v = node_ids[row['from']], node_ids[row['to']]
+                except KeyError as exc:
+                    raise CommandError(f"{options['edges']} line {line}: unknown node {exc}")
+                distance = row.get('distance_km')
+                edges.append((u, v, float(distance) if distance else None))
+
+        self.stdout.write(f"Contracting {len(nodes)} nodes and {len(edges)} edges...")
+        start = time.perf_counter()
+        stats = build_road_graph(options['output'], nodes, edges, cell_degrees=options['cell_degrees'],
+                                 witness_settle_limit=options['witness_settle_limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}: {stats['nodes']} nodes, {stats['road_edges']} road edges, "
+            f"{stats['shortcuts']} shortcuts in {time.perf_counter() - start:.1f}s"
+        ))
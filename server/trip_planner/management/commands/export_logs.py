@@ -0,0 +1,64 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.exports import FORMATS, KINDS, export_chunks, export_rows, parquet_available, parse_bound
+
+
+class Command(BaseCommand):
+    help = 'Stream log sheets (or trips or route segments) as NDJSON, CSV or Parquet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=KINDS, default='logs', help='Rows to export (default: logs)')
+        parser.add_argument('--format', choices=FORMATS, default='ndjson', help='Output format (default: ndjson)')
+        parser.add_argument('--since', help='Only trips created on or after this date/datetime (ISO 8601)')
+        parser.add_argument('--until', help='Only trips created before this date/datetime (ISO 8601)')
+        parser.add_argument('--output', help='File to write; standard output by default')
+        parser.add_argument('--chunk-size', type=int, help='Trips whose rows are read per query (default: 500)')
+
+    def handle(self, *args, **options):
+        kind, export_format = options['kind'], options['format']
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if export_format == 'parquet' and not parquet_available():
+            raise CommandError('Parquet exports need pyarrow (pip install pyarrow)')
+        if export_format == 'parquet' and not options['output']:
+            raise CommandError('Parquet exports need --output')
+        bounds = {}
+        for option in ('since', 'until'):
+            if options[option]:
+                bounds[option] = parse_bound(options[option])
+                if bounds[option] is None:
+                    raise CommandError(f"Invalid --{option} value '{options[option]}'")
+
+        count = 0
+
+        def counted(rows):
+            nonlocal count
+            for row in rows:
+                count += 1
+                yield row
+
+        start = time.perf_counter()
+        rows = counted(export_rows(kind, chunk_size=options['chunk_size'], **bounds))
+        if options['output']:
+            with open(Path(options['output']), 'wb') as output:
+                for chunk in export_chunks(kind, export_format, rows):
+                    output.write(chunk)
+        else:
+            # Bytes straight to the terminal or pipe; text when stdout was replaced (e.g. by call_command)
+            output = getattr(self.stdout._out, 'buffer', None)
+            for chunk in export_chunks(kind, export_format, rows):
+                if output is None:
+                    self.stdout.write(chunk.decode(), ending='')
+                else:
+                    output.write(chunk)
+            if output is not None:
+                output.flush()
+        elapsed = time.perf_counter() - start
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Exported {count} {kind} rows as {export_format} in {elapsed:.1f}s "
+            f"({count / elapsed if elapsed else 0:.0f} rows/s)"
+        ))
@@ -0,0 +1,126 @@
+import json
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, time
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from trip_planner.models import Trip
+from trip_planner.services import TripPlanningService
+
+
+def _regenerate_chunk(trip_ids):
+    return len(trip_ids), TripPlanningService().regenerate_log_sheets_bulk(trip_ids)
+
+
+class Command(BaseCommand):
+    help = 'Regenerate log sheets for stored trips from their route segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only trips created on or after this date/datetime (ISO 8601)')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes; 1 regenerates in this process (default: CPU count)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Trips per chunk (default: 500)')
+        parser.add_argument('--checkpoint', help='File recording the last fully regenerated trip id')
+        parser.add_argument('--resume', action='store_true', help='Continue after the trip id in --checkpoint')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        workers = options['workers']
+        if chunk_size < 1 or workers < 1:
+            raise CommandError('--chunk-size and --workers must be positive')
+        if options['resume'] and not options['checkpoint']:
+            raise CommandError('--resume requires --checkpoint')
+
+        trip_ids = Trip.objects.order_by('id').values_list('id', flat=True)
+        if options['since']:
+            trip_ids = trip_ids.filter(created_at__gte=self._parse_since(options['since']))
+
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else None
+        if options['resume'] and checkpoint.exists():
+            last_trip_id = json.loads(checkpoint.read_text())['last_trip_id']
+            trip_ids = trip_ids.filter(id__gt=last_trip_id)
+            self.stdout.write(f"Resuming after trip {last_trip_id}")
+
+        chunks = self._chunks(trip_ids, chunk_size)
+
+        if workers == 1:
+            results = ((chunk, _regenerate_chunk(chunk)) for chunk in chunks)
+        else:
+            results = self._run_in_pool(chunks, workers)
+
+        total_trips = total_logs = 0
+        for chunk, (trips, logs) in results:
+            total_trips += trips
+            total_logs += logs
+            if checkpoint:
+                checkpoint.write_text(json.dumps({'last_trip_id': str(chunk[-1])}))
+            self.stdout.write(f"Regenerated {total_trips} trips ({total_logs} log sheets)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: regenerated {total_logs} log sheets for {total_trips} trips"
+        ))
+
+    def _chunks(self, trip_ids, chunk_size):
+        """Stream trip ids in id order, one keyset-paginated query per chunk.
+
+        Short per-chunk queries rather than one long-lived cursor: on SQLite an open
+        read cursor holds a shared lock that would block the workers' commits.
+        """
+        chunk = list(trip_ids[:chunk_size])
+        while chunk:
+            yield chunk
+            chunk = list(trip_ids.filter(id__gt=chunk[-1])[:chunk_size])
+
+    def _run_in_pool(self, chunks, workers):
+        """Yield (chunk, result) in chunk order while keeping a bounded number of chunks in flight.
+
+        Results are released in order so the checkpoint never skips past a chunk
+        that has not finished yet.
+        """
+        # Fresh interpreters rather than forks so no database connection is shared;
+        # django.setup must run before the worker unpickles anything from this module
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+            pending = {}
+            finished = {}
+            next_to_submit = next_to_yield = 0
+            exhausted = False
+
+            while True:
+                while not exhausted and len(pending) + len(finished) < workers * 2:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    pending[pool.submit(_regenerate_chunk, chunk)] = (next_to_submit, chunk)
+                    next_to_submit += 1
+
+                if not pending and not finished:
+                    return
+
+                if pending:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        index, chunk = pending.pop(future)
+                        finished[index] = (chunk, future.result())
+
+                while next_to_yield in finished:
+                    yield finished.pop(next_to_yield)
+                    next_to_yield += 1
+
+    def _parse_since(self, value):
+        since = parse_datetime(value)
+        if since is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f"Invalid --since value '{value}'")
+            since = datetime.combine(day, time.min)
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
@@ -0,0 +1,34 @@
+import signal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from trip_planner.jobs import PlanningWorkerPool
+
+
+class Command(BaseCommand):
+    help = 'Run background workers that plan queued trip plan jobs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int,
+                            help="Worker threads (default: TRIP_PLANNER_JOBS['CONCURRENCY'])")
+        parser.add_argument('--poll-interval', type=float,
+                            help="Seconds an idle worker waits between polls (default: TRIP_PLANNER_JOBS['POLL_INTERVAL'])")
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is ready instead of polling')
+
+    def handle(self, *args, **options):
+        if options['concurrency'] is not None and options['concurrency'] < 1:
+            raise CommandError('--concurrency must be positive')
+
+        pool = PlanningWorkerPool(concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+
+        # Finish the jobs in progress, then exit
+        def stop(signum, frame):
+            self.stdout.write('Stopping after the current jobs...')
+            pool.stop()
+
+        signal.signal(signal.SIGINT, stop)
+        signal.signal(signal.SIGTERM, stop)
+
+        self.stdout.write(f"Starting {pool.concurrency} planning workers ({pool.name})")
+        processed = pool.run(burst=options['burst'])
+        self.stdout.write(self.style.SUCCESS(f"Done: processed {processed} jobs"))
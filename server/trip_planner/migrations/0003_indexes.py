@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+LOCATION_COLUMNS = ['current_location', 'pickup_location', 'dropoff_location']
+
+
+def create_location_gin_indexes(apps, schema_editor):
+    # GIN indexes only exist on PostgreSQL (jsonb); SQLite deployments skip them
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in LOCATION_COLUMNS:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS trip_{column}_gin_idx '
+            f'ON trip_planner_trip USING gin ({column} jsonb_path_ops)'
+        )
+
+
+def drop_location_gin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for column in LOCATION_COLUMNS:
+        schema_editor.execute(f'DROP INDEX IF EXISTS trip_{column}_gin_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0002_planningjob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='routesegment',
+            index=models.Index(fields=['trip', 'sequence_order'], name='route_segment_trip_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['created_at'], name='trip_created_at_idx'),
+        ),
+        migrations.RunPython(create_location_gin_indexes, drop_location_gin_indexes),
+    ]
@@ -0,0 +1,189 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:43
+
+import re
+import struct
+from itertools import groupby
+from operator import attrgetter
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 500
+
+# Format version 1 of trip_planner.log_encoding, copied so that later changes
+# to the encoder do not change what this migration writes or reads.
+FORMAT_VERSION = 1
+STATUSES = ('off-duty', 'on-duty', 'driving', 'break', 'rest', 'sleeper')
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+NO_STRING = -1
+DRIVING_BASE = -2
+MAX_STRINGS = 32767
+
+_HEADER = struct.Struct('<BH')
+_TIME = re.compile(r'\d\d:\d\d\Z')
+_KEY_ORDERS = {
+    ('time', 'status'),
+    ('time', 'status', 'location'),
+    ('time', 'status', 'annotation'),
+    ('time', 'status', 'location', 'annotation'),
+}
+
+
+def _format_time(minute):
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+class StringTable:
+    def __init__(self):
+        self.strings = []
+        self._indexes = {}
+
+    def intern(self, value):
+        index = self._indexes.get(value)
+        if index is None:
+            index = self._indexes[value] = len(self.strings)
+            self.strings.append(value)
+        return index
+
+
+def _driving_end(annotation, location):
+    if location is None:
+        return None
+    prefix = f"DRIVING {location} TO "
+    if annotation.startswith(prefix):
+        return annotation[len(prefix):]
+    return None
+
+
+def _encode(points, table):
+    count = len(points)
+    if count > 0xFFFF:
+        return None
+
+    minutes, statuses, locations, annotations = [], [], [], []
+    for point in points:
+        if not isinstance(point, dict) or tuple(point) not in _KEY_ORDERS:
+            return None
+
+        time, status = point['time'], point['status']
+        if not isinstance(time, str) or not _TIME.match(time) or status not in STATUS_CODES:
+            return None
+        minute = int(time[:2]) * 60 + int(time[3:])
+        if _format_time(minute) != time:
+            return None
+
+        location = point.get('location')
+        annotation = point.get('annotation')
+        if not all(value is None or isinstance(value, str) for value in (location, annotation)):
+            return None
+
+        location_index = NO_STRING if location is None else table.intern(location)
+        if annotation is None:
+            annotation_index = NO_STRING
+        else:
+            end = _driving_end(annotation, location)
+            annotation_index = DRIVING_BASE - table.intern(end) if end is not None else table.intern(annotation)
+
+        minutes.append(minute)
+        statuses.append(STATUS_CODES[status])
+        locations.append(location_index)
+        annotations.append(annotation_index)
+
+    if len(table.strings) > MAX_STRINGS:
+        return None
+    return _HEADER.pack(FORMAT_VERSION, count) + struct.pack(
+        f'<{count}h{count}B{count}h{count}h', *minutes, *statuses, *locations, *annotations
+    )
+
+
+def _decode(data, strings):
+    version, count = _HEADER.unpack_from(data)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unknown graph point format version {version}")
+
+    values = struct.unpack_from(f'<{count}h{count}B{count}h{count}h', data, _HEADER.size)
+    points = []
+    for minute, status, location, annotation in zip(
+        values[:count], values[count:2 * count], values[2 * count:3 * count], values[3 * count:]
+    ):
+        point = {'time': _format_time(minute), 'status': STATUSES[status]}
+        if location != NO_STRING:
+            point['location'] = strings[location]
+        if annotation <= DRIVING_BASE:
+            point['annotation'] = f"DRIVING {point['location']} TO {strings[DRIVING_BASE - annotation]}"
+        elif annotation != NO_STRING:
+            point['annotation'] = strings[annotation]
+        points.append(point)
+    return points
+
+
+def log_sheet_points(points, table):
+    encoded = _encode(points, table)
+    if encoded is None:
+        return {'points': None, 'graph_points': list(points)}
+    return {'points': encoded, 'graph_points': None}
+
+
+def _trip_id_chunks(Trip):
+    trip_ids = Trip.objects.order_by('id').values_list('id', flat=True)
+    chunk = list(trip_ids[:CHUNK_SIZE])
+    while chunk:
+        yield chunk
+        chunk = list(trip_ids.filter(id__gt=chunk[-1])[:CHUNK_SIZE])
+
+
+def encode_graph_points(apps, schema_editor):
+    Trip = apps.get_model('trip_planner', 'Trip')
+    LogSheet = apps.get_model('trip_planner', 'LogSheet')
+
+    for trip_ids in _trip_id_chunks(Trip):
+        sheets = LogSheet.objects.filter(trip_id__in=trip_ids).order_by('trip_id', 'day_number')
+        trips, updated_sheets = [], []
+        for trip_id, trip_sheets in groupby(sheets, key=attrgetter('trip_id')):
+            table = StringTable()
+            for sheet in trip_sheets:
+                for name, value in log_sheet_points(sheet.graph_points, table).items():
+                    setattr(sheet, name, value)
+                updated_sheets.append(sheet)
+            trips.append(Trip(id=trip_id, log_strings=table.strings))
+        LogSheet.objects.bulk_update(updated_sheets, ['points', 'graph_points'], batch_size=CHUNK_SIZE)
+        Trip.objects.bulk_update(trips, ['log_strings'], batch_size=CHUNK_SIZE)
+
+
+def decode_graph_points_to_json(apps, schema_editor):
+    Trip = apps.get_model('trip_planner', 'Trip')
+    LogSheet = apps.get_model('trip_planner', 'LogSheet')
+
+    for trip_ids in _trip_id_chunks(Trip):
+        strings = dict(Trip.objects.filter(id__in=trip_ids).values_list('id', 'log_strings'))
+        sheets = list(LogSheet.objects.filter(trip_id__in=trip_ids, points__isnull=False))
+        for sheet in sheets:
+            sheet.graph_points = _decode(sheet.points, strings[sheet.trip_id])
+            sheet.points = None
+        LogSheet.objects.bulk_update(sheets, ['points', 'graph_points'], batch_size=CHUNK_SIZE)
+        Trip.objects.filter(id__in=trip_ids).update(log_strings=[])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0003_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='logsheet',
+            name='points',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='trip',
+            name='log_strings',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AlterField(
+            model_name='logsheet',
+            name='graph_points',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.RunPython(encode_graph_points, decode_graph_points_to_json),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:47
+
+from django.db import migrations, models
+
+CHUNK_SIZE = 1000
+
+# The 9-character geohash of trip_planner.geohash, copied so that later changes
+# to the encoder do not change what this migration writes.
+GEOHASH_PRECISION = 9
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def _cell_index(value, low, span, bits):
+    return min(int((value - low) / span * (1 << bits)), (1 << bits) - 1)
+
+
+def encode_geohash(lat, lng, precision=GEOHASH_PRECISION):
+    total = 5 * precision
+    lat_bits, lng_bits = total // 2, total - total // 2
+    lat_index = _cell_index(max(-90.0, min(90.0, float(lat))), -90, 180, lat_bits)
+    lng_index = _cell_index((float(lng) + 180) % 360 - 180, -180, 360, lng_bits)
+
+    value = 0
+    for bit in range(total):
+        if bit % 2 == 0:
+            lng_bits -= 1
+            value = (value << 1) | ((lng_index >> lng_bits) & 1)
+        else:
+            lat_bits -= 1
+            value = (value << 1) | ((lat_index >> lat_bits) & 1)
+    return ''.join(BASE32[(value >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def location_geohash(location):
+    try:
+        return encode_geohash(location['lat'], location['lng'])
+    except (KeyError, TypeError, ValueError):
+        return ''
+
+
+def index_existing_pickups(apps, schema_editor):
+    Trip = apps.get_model('trip_planner', 'Trip')
+    trips = Trip.objects.order_by('id').only('id', 'pickup_location')
+    chunk = list(trips[:CHUNK_SIZE])
+    while chunk:
+        for trip in chunk:
+            trip.pickup_geohash = location_geohash(trip.pickup_location)
+        Trip.objects.bulk_update(chunk, ['pickup_geohash'])
+        chunk = list(trips.filter(id__gt=chunk[-1].id)[:CHUNK_SIZE])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0004_compact_graph_points'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='pickup_geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.RunPython(index_existing_pickups, migrations.RunPython.noop),
+    ]
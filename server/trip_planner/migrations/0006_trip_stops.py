@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('trip_planner', '0005_trip_pickup_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trip',
+            name='stops',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
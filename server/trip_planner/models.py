@@ -1,6 +1,8 @@
 import uuid
 from django.db import models
 
+from .log_encoding import stored_graph_points
+
 
 class Trip(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -8,9 +10,20 @@ class Trip(models.Model):
     current_location = models.JSONField()
     pickup_location = models.JSONField()
     dropoff_location = models.JSONField()
+    # Indexed for nearby-pickup queries (see spatial.py); '' if the pickup has no coordinates
+    pickup_geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)
     current_cycle_used_hours = models.IntegerField()
+    # Stops of multi-stop trips in visiting order; empty for single pickup/dropoff trips
+    stops = models.JSONField(default=list, blank=True)
     total_distance_km = models.FloatField(null=True, blank=True)
     estimated_days = models.IntegerField(null=True, blank=True)
+    # Location and annotation strings referenced by the trip's encoded log sheet points
+    log_strings = models.JSONField(default=list, blank=True)
+
+
+    class Meta:
+        # GIN indexes on the location JSON columns are added on PostgreSQL by migration 0003
+        indexes = [models.Index(fields=['created_at'], name='trip_created_at_idx')]
 
     def __str__(self):
         return f"Trip {self.id}"
@@ -36,6 +49,7 @@ class RouteSegment(models.Model):
 
     class Meta:
         ordering = ['sequence_order']
+        indexes = [models.Index(fields=['trip', 'sequence_order'], name='route_segment_trip_order_idx')]
 
     def __str__(self):
         return f"{self.trip.id} - {self.type} - {self.sequence_order}"
@@ -53,12 +67,52 @@ class LogSheet(models.Model):
 
     trip = models.ForeignKey(Trip, related_name='logs', on_delete=models.CASCADE)
     day_number = models.IntegerField()
-    graph_points = models.JSONField()
+    # Points are stored in the compact format from log_encoding; graph_points only holds
+    # the JSON of days that format cannot represent exactly
+    graph_points = models.JSONField(null=True, blank=True)
+    points = models.BinaryField(null=True, blank=True)
     summary = models.JSONField()
 
     class Meta:
         unique_together = ['trip', 'day_number']
         ordering = ['day_number']
 
+    def get_graph_points(self):
+        return stored_graph_points(self.graph_points, self.points, self.trip.log_strings)
+
     def __str__(self):
         return f"{self.trip.id} - Day {self.day_number}"
+
+
+class PlanningJob(models.Model):
+    """A trip plan request queued for a background planning worker"""
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+    FINISHED_STATUSES = (SUCCEEDED, FAILED)
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=QUEUED)
+    trip_data = models.JSONField()
+    trip = models.ForeignKey(Trip, related_name='+', null=True, blank=True, on_delete=models.SET_NULL)
+    attempts = models.IntegerField(default=0)
+    max_attempts = models.IntegerField(default=3)
+    error = models.TextField(blank=True, default='')
+    worker = models.CharField(max_length=100, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    available_at = models.DateTimeField()
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'available_at'], name='planning_job_ready_idx')]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
@@ -0,0 +1,278 @@
+"""Stop ordering for trips with many pickups and dropoffs.
+
+The trip starts at the driver's current location and visits every stop once
+without returning (an open path). A dropoff that shares a ``shipment`` with a
+pickup must come after it. Orders are built with nearest neighbour and then
+improved with 2-opt (reverse a run of stops) and Or-opt (move a run of up to
+three stops elsewhere) until no move shortens the path. While time budget is
+left the best order is then randomly perturbed and improved again, keeping the
+result when it is shorter (iterated local search), until ``PERTURBATIONS``
+attempts in a row fail to improve it. Distances are great-circle kilometres,
+computed for all pairs at once with the vectorized haversine kernel when NumPy
+is available, unless the caller passes a road distance matrix. Road distances
+need not be symmetric, so 2-opt prices the reversed run in its new direction.
+"""
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+
+from . import geometry
+from .engine import PlanningEngine
+
+DEFAULT_OPTIMIZER = {
+    'TIME_BUDGET': 0.5,  # seconds of local search per trip
+    'MAX_STOPS': 50,
+    'PERTURBATIONS': 50,  # consecutive non-improving restarts before the search stops early
+}
+
+OR_OPT_RUN_LENGTHS = (1, 2, 3)
+# Moves must save more than this many km, so rounding noise cannot make the search cycle
+EPSILON = 1e-6
+
+
+def optimizer_config() -> Dict:
+    return {**DEFAULT_OPTIMIZER, **getattr(settings, 'TRIP_PLANNER_OPTIMIZER', {})}
+
+
+@dataclass(frozen=True)
+class StopOrder:
+    order: Tuple[int, ...]        # indexes into the stops, in visiting order
+    distance_km: float
+    initial_distance_km: float    # of the nearest neighbour order (or the given one)
+    moves: int                    # improving 2-opt and Or-opt moves applied
+    restarts: int                 # perturbations tried after the first local optimum
+    seconds: float
+    converged: bool               # False if the time budget ran out first
+
+
+def distance_matrix(locations: Sequence[Dict]) -> List[List[float]]:
+    """Great-circle km between every pair of locations, as nested lists"""
+    if geometry.available() and len(locations) > 1:
+        np = geometry.np
+        lats = np.array([location['lat'] for location in locations], dtype=np.float64)
+        lngs = np.array([location['lng'] for location in locations], dtype=np.float64)
+        return geometry.haversine_km(lats[:, None], lngs[:, None], lats[None, :], lngs[None, :]).tolist()
+
+    engine = PlanningEngine()
+    return [[engine.distance(a, b) for b in locations] for a in locations]
+
+
+def precedence_pairs(stops: Sequence[Dict]) -> List[Tuple[int, int]]:
+    """(pickup index, dropoff index) for every shipment with both a pickup and a dropoff"""
+    pickups = {}
+    for index, stop in enumerate(stops):
+        if stop['type'] == 'pickup' and stop.get('shipment') is not None:
+            pickups[stop['shipment']] = index
+    return [
+        (pickups[stop['shipment']], index)
+        for index, stop in enumerate(stops)
+        if stop['type'] == 'dropoff' and stop.get('shipment') in pickups
+    ]
+
+
+def order_is_feasible(order: Sequence[int], pairs: Sequence[Tuple[int, int]]) -> bool:
+    position = {stop: index for index, stop in enumerate(order)}
+    return all(position[pickup] < position[dropoff] for pickup, dropoff in pairs)
+
+
+def optimize_stop_order(origin: Dict, stops: Sequence[Dict], time_budget: Optional[float] = None,
+                        initial_order: Optional[Sequence[int]] = None,
+                        perturbations: Optional[int] = None, seed: int = 0,
+                        distances: Optional[Sequence[Sequence[float]]] = None) -> StopOrder:
+    """Shortest order found for visiting ``stops`` from ``origin`` within ``time_budget`` seconds.
+
+    Local search starts from ``initial_order`` if given (it must already respect
+    pickup-before-dropoff), otherwise from the nearest neighbour order. Results
+    are reproducible for a given ``seed`` unless the time budget cuts the search short.
+    ``distances`` may supply the km matrix over ``[origin] + stops`` (e.g. road
+    distances from a router); it is computed from great-circle distances otherwise.
+    """
+    start = time.perf_counter()
+    config = optimizer_config()
+    time_budget = config['TIME_BUDGET'] if time_budget is None else time_budget
+    perturbations = config['PERTURBATIONS'] if perturbations is None else perturbations
+    deadline = start + time_budget
+
+    # Matrix index 0 is the origin and stop i is index i + 1
+    if distances is None:
+        distances = distance_matrix([origin] + [stop['location'] for stop in stops])
+    partner = [0] * (len(stops) + 1)
+    required_before = [[] for _ in range(len(stops) + 1)]
+    for pickup, dropoff in precedence_pairs(stops):
+        partner[pickup + 1], partner[dropoff + 1] = dropoff + 1, pickup + 1
+        required_before[dropoff + 1].append(pickup + 1)
+
+    if initial_order is None:
+        path = _nearest_neighbour(distances, required_before)
+    else:
+        path = [0] + [index + 1 for index in initial_order]
+    initial_distance = _path_distance(distances, path)
+
+    moves, converged = _local_search(path, distances, partner, required_before, deadline)
+    best, best_distance = path, _path_distance(distances, path)
+
+    rng = random.Random(seed)
+    restarts = failures = 0
+    # Perturbing needs at least two runs of stops to move around
+    while converged and failures < perturbations and len(path) > 3:
+        candidate = _perturb(best, required_before, rng)
+        candidate_moves, converged = _local_search(candidate, distances, partner, required_before, deadline)
+        moves += candidate_moves
+        restarts += 1
+        candidate_distance = _path_distance(distances, candidate)
+        if candidate_distance < best_distance - EPSILON:
+            best, best_distance, failures = candidate, candidate_distance, 0
+        else:
+            failures += 1
+
+    return StopOrder(
+        order=tuple(index - 1 for index in best[1:]),
+        distance_km=best_distance,
+        initial_distance_km=initial_distance,
+        moves=moves,
+        restarts=restarts,
+        seconds=time.perf_counter() - start,
+        converged=converged,
+    )
+
+
+def _local_search(path, distances, partner, required_before, deadline) -> Tuple[int, bool]:
+    """Apply 2-opt and Or-opt moves to ``path`` in place until none helps; returns (moves, finished in time)"""
+    moves = 0
+    while time.perf_counter() < deadline:
+        two_opt_moves = _two_opt(path, distances, partner, deadline)
+        or_opt_moves = _or_opt(path, distances, required_before, deadline)
+        moves += two_opt_moves + or_opt_moves
+        if not two_opt_moves and not or_opt_moves:
+            return moves, time.perf_counter() < deadline
+    return moves, False
+
+
+def _perturb(path, required_before, rng, attempts=20) -> List[int]:
+    """A copy of ``path`` with a random run of stops moved elsewhere, keeping pickups before dropoffs"""
+    last = len(path) - 1
+    for _ in range(attempts):
+        length = rng.randint(1, min(3, last - 1))
+        i = rng.randint(1, last - length + 1)
+        run = path[i:i + length]
+        rest = path[:i] + path[i + length:]
+        insert_at = rng.randint(1, len(rest))
+        candidate = rest[:insert_at] + run + rest[insert_at:]
+        if candidate != path and _respects_precedence(candidate, required_before):
+            return candidate
+    return list(path)
+
+
+def _path_distance(distances, path) -> float:
+    return sum(distances[a][b] for a, b in zip(path, path[1:]))
+
+
+def _nearest_neighbour(distances, required_before) -> List[int]:
+    path = [0]
+    visited = {0}
+    remaining = set(range(1, len(distances)))
+    while remaining:
+        row = distances[path[-1]]
+        ready = [i for i in remaining if all(p in visited for p in required_before[i])]
+        nearest = min(ready, key=row.__getitem__)
+        path.append(nearest)
+        visited.add(nearest)
+        remaining.remove(nearest)
+    return path
+
+
+def _two_opt(path, distances, partner, deadline) -> int:
+    """Reverse runs path[i:j + 1] wherever that shortens the path; returns the number of moves made"""
+    moves = 0
+    last = len(path) - 1
+    forward, backward = _run_lengths(path, distances)
+    for i in range(1, last):
+        if time.perf_counter() >= deadline:
+            break
+        for j in range(i + 1, last + 1):
+            a, b, c = path[i - 1], path[i], path[j]
+            # The edges at both ends change, and the run is driven backwards (road distances can be asymmetric)
+            delta = distances[a][c] - distances[a][b] + (backward[j] - backward[i]) - (forward[j] - forward[i])
+            if j < last:
+                d = path[j + 1]
+                delta += distances[b][d] - distances[c][d]
+            if delta < -EPSILON and _reversible(path, partner, i, j):
+                path[i:j + 1] = path[j:i - 1:-1]
+                forward, backward = _run_lengths(path, distances)
+                moves += 1
+    return moves
+
+
+def _run_lengths(path, distances):
+    """Prefix sums of the path's edge lengths driven forwards and backwards"""
+    forward, backward = [0.0], [0.0]
+    for a, b in zip(path, path[1:]):
+        forward.append(forward[-1] + distances[a][b])
+        backward.append(backward[-1] + distances[b][a])
+    return forward, backward
+
+
+def _reversible(path, partner, i, j) -> bool:
+    # Reversing a run swaps any pickup/dropoff pair that lies entirely inside it
+    run = path[i:j + 1]
+    members = set(run)
+    return not any(partner[stop] in members for stop in run)
+
+
+def _or_opt(path, distances, required_before, deadline) -> int:
+    """Move runs of 1-3 stops to a cheaper position without reversing them; returns the number of moves made"""
+    moves = 0
+    for length in OR_OPT_RUN_LENGTHS:
+        i = 1
+        while i + length <= len(path):
+            if time.perf_counter() >= deadline:
+                return moves
+            if _move_run(path, distances, required_before, i, length):
+                moves += 1
+            else:
+                i += 1
+    return moves
+
+
+def _move_run(path, distances, required_before, i, length) -> bool:
+    """Move path[i:i + length] to the best improving position that keeps pickups before dropoffs"""
+    last = len(path) - 1
+    first, end = path[i], path[i + length - 1]
+    before = path[i - 1]
+    after = path[i + length] if i + length <= last else None
+
+    removed = distances[before][first]
+    if after is not None:
+        removed += distances[end][after] - distances[before][after]
+
+    improving = []
+    for k in range(len(path)):
+        if i - 1 <= k < i + length:
+            continue
+        p = path[k]
+        q = path[k + 1] if k < last else None
+        added = distances[p][first]
+        if q is not None:
+            added += distances[end][q] - distances[p][q]
+        if added - removed < -EPSILON:
+            improving.append((added - removed, k))
+
+    run = path[i:i + length]
+    rest = path[:i] + path[i + length:]
+    for _, k in sorted(improving):
+        insert_at = k + 1 if k < i else k + 1 - length
+        candidate = rest[:insert_at] + run + rest[insert_at:]
+        if _respects_precedence(candidate, required_before):
+            path[:] = candidate
+            return True
+    return False
+
+
+def _respects_precedence(path, required_before) -> bool:
+    position = [0] * len(path)
+    for index, stop in enumerate(path):
+        position[stop] = index
+    return all(position[pickup] < position[stop] for stop in path for pickup in required_before[stop])
@@ -0,0 +1,222 @@
+"""Plain-dict builders for the trip endpoints.
+
+These produce exactly what TripSerializer, TripDetailSerializer and
+TripLogsSerializer produce (same keys, key order and value types) but read
+rows with ``values()``/``values_list()`` and skip DRF's per-field machinery,
+which dominates response time for trips with many segments and log days.
+"""
+from itertools import groupby
+from typing import Dict, Iterable, List, Optional
+
+from rest_framework import serializers
+
+from .log_encoding import stored_graph_points
+from .models import Trip, RouteSegment, LogSheet
+
+TRIP_DETAIL_COLUMNS = (
+    'id', 'created_at', 'current_location', 'pickup_location', 'dropoff_location',
+    'current_cycle_used_hours', 'stops', 'total_distance_km', 'estimated_days',
+)
+ROUTE_COLUMNS = ('type', 'start_location', 'end_location', 'duration_minutes', 'distance_km')
+LOG_COLUMNS = ('day_number', 'graph_points', 'points', 'summary')
+
+_datetime_field = serializers.DateTimeField()
+
+
+def _float(value):
+    return None if value is None else float(value)
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def route_payload(segments: Iterable) -> List[Dict]:
+    """Render (type, start_location, end_location, duration_minutes, distance_km) rows like RouteSegmentSerializer.
+
+    Engine PlannedSegments have the same field order, so they can be passed directly.
+    """
+    return [
+        {
+            'type': segment_type,
+            'start_location': start_location,
+            'end_location': end_location,
+            'duration_minutes': _int(duration_minutes),
+            'distance_km': _float(distance_km),
+        }
+        for segment_type, start_location, end_location, duration_minutes, distance_km in segments
+    ]
+
+
+def trip_payload(trip: Trip, segments: Iterable) -> Dict:
+    """Same output as TripSerializer for a trip whose segments are already in memory"""
+    return {
+        'trip_id': str(trip.id),
+        'total_distance_km': _float(trip.total_distance_km),
+        'estimated_days': _int(trip.estimated_days),
+        'route': route_payload(segments),
+    }
+
+
+def progress_payload(trip_id, replan) -> Dict:
+    """Response for a progress update: the replanned segments and log days, from where they start"""
+    return {
+        'trip_id': str(trip_id),
+        'total_distance_km': _float(replan.total_distance_km),
+        'estimated_days': _int(replan.estimated_days),
+        'replanned_from_segment': replan.kept_segments,
+        'replanned_from_day': replan.first_day,
+        'route': route_payload(replan.segments),
+        'logs': [
+            {'day': log_day.day_number, 'graph_points': list(log_day.graph_points), 'summary': log_day.summary}
+            for log_day in replan.log_days
+        ],
+    }
+
+
+def trip_detail_payloads(trips: Iterable[Dict]) -> List[Dict]:
+    """Same output as TripDetailSerializer(many=True) for rows of Trip.objects.values(*TRIP_DETAIL_COLUMNS)"""
+    trips = list(trips)
+    rows = (
+        RouteSegment.objects
+        .filter(trip_id__in=[trip['id'] for trip in trips])
+        .order_by('trip_id', 'sequence_order')
+        .values_list('trip_id', *ROUTE_COLUMNS)
+    )
+    routes = {
+        trip_id: route_payload(row[1:] for row in trip_rows)
+        for trip_id, trip_rows in groupby(rows, key=lambda row: row[0])
+    }
+    return [_trip_detail(trip, routes.get(trip['id'], [])) for trip in trips]
+
+
+def trip_detail_payload(trip_id) -> Optional[Dict]:
+    """Same output as TripDetailSerializer, or None if the trip does not exist"""
+    trip_query, route_query = _detail_queries(trip_id)
+    trip = trip_query.first()
+    if trip is None:
+        return None
+    return _trip_detail(trip, route_payload(route_query))
+
+
+async def atrip_detail_payload(trip_id) -> Optional[Dict]:
+    """Async ORM version of trip_detail_payload"""
+    trip_query, route_query = _detail_queries(trip_id)
+    trip = await trip_query.afirst()
+    if trip is None:
+        return None
+    return _trip_detail(trip, route_payload([row async for row in route_query]))
+
+
+def trip_logs_payload(trip_id) -> Optional[Dict]:
+    """Same output as TripLogsSerializer, or None if the trip does not exist"""
+    strings_query, logs_query = _logs_queries(trip_id)
+    strings = strings_query.first()
+    if strings is None:
+        return None
+    return {'trip_id': str(trip_id), 'logs': _logs(logs_query, strings)}
+
+
+async def atrip_logs_payload(trip_id) -> Optional[Dict]:
+    """Async ORM version of trip_logs_payload"""
+    strings_query, logs_query = _logs_queries(trip_id)
+    strings = await strings_query.afirst()
+    if strings is None:
+        return None
+    return {'trip_id': str(trip_id), 'logs': _logs([row async for row in logs_query], strings)}
+
+
+def optimization_payload(stop_order) -> Optional[Dict]:
+    """Summary of an optimizer.StopOrder for multi-stop responses"""
+    if stop_order is None:
+        return None
+    return {
+        'initial_distance_km': stop_order.initial_distance_km,
+        'distance_km': stop_order.distance_km,
+        'moves': stop_order.moves,
+        'restarts': stop_order.restarts,
+        'seconds': stop_order.seconds,
+        'converged': stop_order.converged,
+    }
+
+
+def scenarios_payload(segments: Iterable, results: Iterable) -> Dict:
+    """Response for the scenarios endpoint from scenarios.evaluate_scenarios results, best first"""
+    segments = list(segments)
+    return {
+        'total_distance_km': sum(segment.distance_km or 0 for segment in segments),
+        'segment_count': len(segments),
+        'scenarios': [
+            {
+                'rank': rank,
+                'departure_hour': result.departure_hour,
+                'current_cycle_used_hours': result.current_cycle_used_hours,
+                'sleeper_split': result.sleeper_split,
+                'total_duration_hours': round(result.duration_minutes / 60, 2),
+                'days': result.days,
+                'finish': {'day': result.finish_day, 'time': _clock_time(result.finish_minute)},
+                'violations': [{'day': day, 'rule': rule} for day, rule in result.violations],
+            }
+            for rank, result in enumerate(results, start=1)
+        ],
+    }
+
+
+def nearby_payload(match_count: int, matches: Iterable) -> Dict:
+    """Response for the nearby endpoint from spatial.nearby_trips results"""
+    return {
+        'count': match_count,
+        'results': [
+            {
+                'trip_id': str(row['id']),
+                'distance_km': round(distance_km, 3),
+                'created_at': _datetime_field.to_representation(row['created_at']),
+                'pickup_location': row['pickup_location'],
+                'dropoff_location': row['dropoff_location'],
+                'total_distance_km': _float(row['total_distance_km']),
+                'estimated_days': _int(row['estimated_days']),
+            }
+            for row, distance_km in matches
+        ],
+    }
+
+
+def _clock_time(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+def _detail_queries(trip_id):
+    return (
+        Trip.objects.filter(id=trip_id).values(*TRIP_DETAIL_COLUMNS),
+        RouteSegment.objects.filter(trip_id=trip_id).order_by('sequence_order').values_list(*ROUTE_COLUMNS),
+    )
+
+
+def _logs_queries(trip_id):
+    # The trip's string table doubles as the existence check
+    return (
+        Trip.objects.filter(id=trip_id).values_list('log_strings', flat=True),
+        LogSheet.objects.filter(trip_id=trip_id).order_by('day_number').values_list(*LOG_COLUMNS),
+    )
+
+
+def _logs(rows, strings) -> List[Dict]:
+    return [
+        {'day': day_number, 'graph_points': stored_graph_points(graph_points, points, strings), 'summary': summary}
+        for day_number, graph_points, points, summary in rows
+    ]
+
+
+def _trip_detail(trip: Dict, route: List[Dict]) -> Dict:
+    return {
+        'created_at': _datetime_field.to_representation(trip['created_at']),
+        'current_location': trip['current_location'],
+        'pickup_location': trip['pickup_location'],
+        'dropoff_location': trip['dropoff_location'],
+        'current_cycle_used_hours': _int(trip['current_cycle_used_hours']),
+        'stops': trip['stops'],
+        'total_distance_km': _float(trip['total_distance_km']),
+        'estimated_days': _int(trip['estimated_days']),
+        'route': route,
+        'trip_id': str(trip['id']),
+    }
@@ -0,0 +1,58 @@
+import math
+import re
+
+from rest_framework.renderers import JSONRenderer
+
+from .instrumentation import stage
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# orjson writes exponents as "1e16"/"1e-5" where the json module writes "1e+16"/"1e-05"
+_ORJSON_EXPONENT = re.compile(rb'\de')
+
+
+class ORJSONRenderer(JSONRenderer):
+    """JSONRenderer that encodes with orjson when it can produce identical bytes.
+
+    Anything orjson would render differently from the stdlib encoder - pretty
+    printing, ASCII-only output, float exponents or types it cannot encode -
+    falls back to JSONRenderer, so responses never change. That includes NaN and
+    infinity, which orjson writes as null: JSONRenderer rejects them with a
+    ValueError.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        with stage('render'):
+            return self._render(data, accepted_media_type, renderer_context)
+
+    def _render(self, data, accepted_media_type, renderer_context):
+        if (orjson is None or data is None or not self.compact or self.ensure_ascii
+                or self.get_indent(accepted_media_type, renderer_context or {}) is not None):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(
+                data, default=self.encoder_class().default, option=orjson.OPT_PASSTHROUGH_DATETIME
+            )
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if _ORJSON_EXPONENT.search(ret) or (b'null' in ret and _has_non_finite(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # Match JSONRenderer, which escapes these so the output is a strict javascript subset
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+def _has_non_finite(data) -> bool:
+    """Whether a NaN or infinite float is anywhere in plain JSON data"""
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(_has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite(value) for value in data)
+    return False
@@ -0,0 +1,140 @@
+"""Stored rendered JSON for the trip detail and logs endpoints.
+
+A trip's route and logs only change when they are regenerated, so each
+response body is rendered once, stored with its ETag in the cache named by
+TRIP_PLANNER_RESPONSE_CACHE['CACHE_ALIAS'], and reused until
+``invalidate_trip_responses`` drops it.
+
+Body keys carry the trip's current version token, read before the payload is
+built. Invalidation drops the token along with the bodies, so a body built from
+data that changed while it was rendering is stored under a token nobody reads
+again instead of outliving the change.
+"""
+import hashlib
+import uuid
+from typing import Callable, Iterable, Optional, Tuple
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags
+
+from .models import Trip
+from .renderers import ORJSONRenderer
+
+DEFAULT_RESPONSE_CACHE = {
+    'CACHE_ALIAS': 'default',
+    'TIMEOUT': None,  # keep until invalidated
+    'KEY_PREFIX': 'trip_planner:rendered',
+}
+
+KINDS = ('detail', 'logs')
+
+
+def _config():
+    return {**DEFAULT_RESPONSE_CACHE, **getattr(settings, 'TRIP_PLANNER_RESPONSE_CACHE', {})}
+
+
+def _version_key(config, trip_id) -> str:
+    return f"{config['KEY_PREFIX']}:version:{trip_id}"
+
+
+def _key(config, kind: str, trip_id, version: str) -> str:
+    return f"{config['KEY_PREFIX']}:{kind}:{trip_id}:{version}"
+
+
+def _version(cache, config, trip_id) -> str:
+    version_key = _version_key(config, trip_id)
+    version = cache.get(version_key)
+    if version is None:
+        cache.add(version_key, uuid.uuid4().hex, None)
+        version = cache.get(version_key)
+    return version
+
+
+async def _aversion(cache, config, trip_id) -> str:
+    version_key = _version_key(config, trip_id)
+    version = await cache.aget(version_key)
+    if version is None:
+        await cache.aadd(version_key, uuid.uuid4().hex, None)
+        version = await cache.aget(version_key)
+    return version
+
+
+def rendered_response(kind: str, trip_id, build_payload: Callable) -> Optional[Tuple[bytes, str]]:
+    """Return (body, etag) for a trip endpoint, rendering and storing it on first use.
+
+    ``build_payload(trip_id)`` returns the payload or None when the trip does not
+    exist; missing trips are not cached.
+    """
+    config = _config()
+    cache = caches[config['CACHE_ALIAS']]
+    key = _key(config, kind, trip_id, _version(cache, config, trip_id))
+
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    payload = build_payload(trip_id)
+    if payload is None:
+        return None
+
+    cached = _render(payload)
+    cache.set(key, cached, config['TIMEOUT'])
+    return cached
+
+
+async def arendered_response(kind: str, trip_id, abuild_payload: Callable) -> Optional[Tuple[bytes, str]]:
+    """Async version of rendered_response taking a coroutine function to build the payload"""
+    config = _config()
+    cache = caches[config['CACHE_ALIAS']]
+    key = _key(config, kind, trip_id, await _aversion(cache, config, trip_id))
+
+    cached = await cache.aget(key)
+    if cached is not None:
+        return cached
+
+    payload = await abuild_payload(trip_id)
+    if payload is None:
+        return None
+
+    cached = _render(payload)
+    await cache.aset(key, cached, config['TIMEOUT'])
+    return cached
+
+
+def conditional_response(request, rendered: Tuple[bytes, str]) -> HttpResponse:
+    """Respond with the stored body, or an empty 304 when the client already holds this version"""
+    body, etag = rendered
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (if_none_match.strip() == '*' or etag in parse_etags(if_none_match)):
+        return HttpResponseNotModified(headers={'ETag': etag})
+    return HttpResponse(body, content_type='application/json', headers={'ETag': etag})
+
+
+def _render(payload) -> Tuple[bytes, str]:
+    body = ORJSONRenderer().render(payload)
+    return body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+
+
+def invalidate_trip_responses(trip_ids: Iterable):
+    """Drop stored responses and version tokens for the given trips once the current transaction commits"""
+    config = _config()
+    version_keys = {_version_key(config, trip_id): trip_id for trip_id in trip_ids}
+    if version_keys:
+        transaction.on_commit(lambda: _drop(caches[config['CACHE_ALIAS']], config, version_keys))
+
+
+def _drop(cache, config, version_keys):
+    versions = cache.get_many(list(version_keys))
+    keys = [_key(config, kind, version_keys[version_key], version)
+            for version_key, version in versions.items() for kind in KINDS]
+    cache.delete_many(keys + list(version_keys))
+
+
+@receiver(post_delete, sender=Trip, dispatch_uid='trip_planner.response_cache.trip_deleted')
+def _trip_deleted(sender, instance, **kwargs):
+    invalidate_trip_responses([instance.pk])
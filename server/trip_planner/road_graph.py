@@ -0,0 +1,334 @@
+"""Offline road graph with contraction-hierarchy shortest paths.
+
+``build_road_graph`` turns nodes and undirected road edges (for example
+exported from an OpenStreetMap extract) into a single file that
+``RoadGraph`` memory-maps, so worker processes share one copy of it through
+the page cache and opening it costs nothing. Nodes are contracted at build time
+in order of importance, adding shortcut edges where a contracted node was on a
+shortest path; a query then runs two small Dijkstra searches that only move up
+that order, which settles a few hundred nodes even for continental trips.
+
+File layout (native byte order, every array 8-byte aligned)::
+
+    header    magic, version, node count, edge count, grid cell size in degrees
+    lat, lng  float32[nodes]
+    cell      int64[nodes]      grid cell of each node; nodes are numbered in cell order
+    rank      int32[nodes]      contraction order
+    offsets   int64[nodes + 1]  CSR index into the edge arrays
+    target    int32[edges]      upward edges: to a node contracted later
+    weight    float32[edges]    road km
+    via       int32[edges]      contracted node a shortcut skips, or -1 for a road edge
+"""
+import heapq
+import math
+import mmap
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+MAGIC = b'TPRG'
+FORMAT_VERSION = 1
+EARTH_RADIUS_KM = 6371
+DEFAULT_CELL_DEGREES = 0.1
+# Nodes a witness search may settle before a shortcut is added anyway; higher builds slower, smaller graphs
+WITNESS_SETTLE_LIMIT = 60
+
+_HEADER = struct.Struct('<4sIIId')
+_ALIGNMENT = 8
+_INFINITY = float('inf')
+
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * math.asin(math.sqrt(a)) * EARTH_RADIUS_KM
+
+
+def _grid(cell_degrees: float) -> Tuple[int, int]:
+    return math.ceil(180 / cell_degrees), math.ceil(360 / cell_degrees)
+
+
+def _cell(lat: float, lng: float, cell_degrees: float) -> Tuple[int, int]:
+    rows, columns = _grid(cell_degrees)
+    row = min(int((lat + 90) / cell_degrees), rows - 1)
+    column = int((lng + 180) / cell_degrees) % columns
+    return row, column
+
+
+def build_road_graph(path, nodes: Sequence[Tuple[float, float]], edges: Iterable[Tuple[int, int, Optional[float]]],
+                     cell_degrees: float = DEFAULT_CELL_DEGREES,
+                     witness_settle_limit: int = WITNESS_SETTLE_LIMIT) -> Dict:
+    """Contract the graph and write it to ``path``.
+
+    ``nodes`` are (lat, lng) pairs and ``edges`` (node index, node index, km)
+    triples, where a km of None means the great-circle distance. Edges can be
+    driven both ways; parallel edges keep the shortest. Returns build statistics.
+    """
+    node_count = len(nodes)
+    adjacency = [{} for _ in range(node_count)]
+    road_edges = 0
+    for u, v, km in edges:
+        if u == v:
+            continue
+        if km is None:
+            km = haversine_km(*nodes[u], *nodes[v])
+        if km < adjacency[u].get(v, (_INFINITY,))[0]:
+            road_edges += v not in adjacency[u]
+            adjacency[u][v] = adjacency[v][u] = (km, -1)
+
+    rank = _contract(adjacency, witness_settle_limit)
+    # After contraction each node's adjacency holds exactly its upward edges
+    edge_count = sum(len(neighbours) for neighbours in adjacency)
+
+    cells = [_cell(lat, lng, cell_degrees) for lat, lng in nodes]
+    columns = _grid(cell_degrees)[1]
+    order = sorted(range(node_count), key=lambda node: cells[node])
+    new_id = [0] * node_count
+    for new, old in enumerate(order):
+        new_id[old] = new
+
+    offsets, targets, weights, vias = array('q', [0]), array('i'), array('f'), array('i')
+    for old in order:
+        for neighbour, (km, via) in sorted(adjacency[old].items(), key=lambda item: new_id[item[0]]):
+            targets.append(new_id[neighbour])
+            weights.append(km)
+            vias.append(-1 if via < 0 else new_id[via])
+        offsets.append(len(targets))
+
+    arrays = (
+        array('f', (nodes[old][0] for old in order)),
+        array('f', (nodes[old][1] for old in order)),
+        array('q', (cells[old][0] * columns + cells[old][1] for old in order)),
+        array('i', (rank[old] for old in order)),
+        offsets, targets, weights, vias,
+    )
+    with open(path, 'wb') as output:
+        output.write(_HEADER.pack(MAGIC, FORMAT_VERSION, node_count, edge_count, cell_degrees))
+        for values in arrays:
+            _pad(output)
+            values.tofile(output)
+
+    return {'nodes': node_count, 'road_edges': road_edges, 'edges': edge_count,
+            'shortcuts': edge_count - road_edges}
+
+
+def _pad(output):
+    output.write(b'\0' * (-output.tell() % _ALIGNMENT))
+
+
+def _contract(adjacency: List[Dict], witness_settle_limit: int) -> List[int]:
+    """Contract every node, least important first, adding shortcuts in place; returns each node's rank"""
+    node_count = len(adjacency)
+    rank = [0] * node_count
+    contracted_neighbours = [0] * node_count
+
+    def priority(node):
+        # Edge difference plus already contracted neighbours, to spread contraction evenly
+        shortcuts = _shortcuts(adjacency, node, witness_settle_limit)
+        return len(shortcuts) - len(adjacency[node]) + contracted_neighbours[node], shortcuts
+
+    queue = [(priority(node)[0], node) for node in range(node_count)]
+    heapq.heapify(queue)
+    next_rank = 0
+    while queue:
+        _, node = heapq.heappop(queue)
+        current, shortcuts = priority(node)
+        # Lazy update: priorities go stale as neighbours are contracted
+        if queue and current > queue[0][0]:
+            heapq.heappush(queue, (current, node))
+            continue
+
+        for a, b, km in shortcuts:
+            if km < adjacency[a].get(b, (_INFINITY,))[0]:
+                adjacency[a][b] = adjacency[b][a] = (km, node)
+        for neighbour in adjacency[node]:
+            del adjacency[neighbour][node]
+            contracted_neighbours[neighbour] += 1
+        rank[node] = next_rank
+        next_rank += 1
+    return rank
+
+
+def _shortcuts(adjacency, node, witness_settle_limit) -> List[Tuple[int, int, float]]:
+    """Shortcuts needed to keep shortest paths between ``node``'s neighbours once it is removed"""
+    neighbours = list(adjacency[node].items())
+    shortcuts = []
+    for index, (a, (a_km, _)) in enumerate(neighbours):
+        others = neighbours[index + 1:]
+        if not others:
+            break
+        limit = a_km + max(b_km for _, (b_km, _) in others)
+        witnesses = _witness_search(adjacency, a, node, limit, {b for b, _ in others}, witness_settle_limit)
+        for b, (b_km, _) in others:
+            if witnesses.get(b, _INFINITY) > a_km + b_km:
+                shortcuts.append((a, b, a_km + b_km))
+    return shortcuts
+
+
+def _witness_search(adjacency, source, excluded, limit, targets, settle_limit) -> Dict[int, float]:
+    distances = {source: 0.0}
+    queue = [(0.0, source)]
+    remaining = set(targets)
+    settled = 0
+    while queue and remaining and settled < settle_limit:
+        km, node = heapq.heappop(queue)
+        if km > distances[node]:
+            continue
+        remaining.discard(node)
+        settled += 1
+        for neighbour, (edge_km, _) in adjacency[node].items():
+            total = km + edge_km
+            # Paths longer than the shortcut cannot be witnesses
+            if total <= limit and neighbour != excluded and total < distances.get(neighbour, _INFINITY):
+                distances[neighbour] = total
+                heapq.heappush(queue, (total, neighbour))
+    return distances
+
+
+class RoadGraph:
+    """Read-only, memory-mapped graph written by build_road_graph"""
+
+    def __init__(self, path):
+        if sys.byteorder != 'little':
+            raise ValueError('Road graph files are only supported on little-endian machines')
+        with open(path, 'rb') as graph_file:
+            self._mmap = mmap.mmap(graph_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+
+        magic, version, self.node_count, self.edge_count, self.cell_degrees = _HEADER.unpack_from(self._buffer)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"{path} is not a version {FORMAT_VERSION} road graph file")
+        self.columns = _grid(self.cell_degrees)[1]
+
+        offset = _HEADER.size
+        views = []
+        for typecode, length in (('f', self.node_count), ('f', self.node_count), ('q', self.node_count),
+                                 ('i', self.node_count), ('q', self.node_count + 1), ('i', self.edge_count),
+                                 ('f', self.edge_count), ('i', self.edge_count)):
+            offset += -offset % _ALIGNMENT
+            size = array(typecode).itemsize * length
+            views.append(self._buffer[offset:offset + size].cast(typecode))
+            offset += size
+        self.lat, self.lng, self.cell, self.rank, self.offsets, self.target, self.weight, self.via = views
+
+    def close(self):
+        for view in (self.lat, self.lng, self.cell, self.rank, self.offsets, self.target, self.weight, self.via):
+            view.release()
+        self._buffer.release()
+        self._mmap.close()
+
+    def nearest_node(self, lat: float, lng: float, max_km: float) -> Optional[Tuple[int, float]]:
+        """(node, km) of the closest node within ``max_km``, searching grid cells in rings outward"""
+        row, column = _cell(lat, lng, self.cell_degrees)
+        # Width in km of the narrowest cell within reach, so the rings never stop too early
+        widest_lat = min(abs(lat) + max_km / 111.0 + self.cell_degrees, 89.9)
+        cell_km = self.cell_degrees * 111.0 * math.cos(math.radians(widest_lat))
+        best, best_km = None, max_km
+        ring = 0
+        while (ring - 1) * cell_km <= best_km:
+            for cell_row, cell_column in self._ring(row, column, ring):
+                key = cell_row * self.columns + cell_column
+                for node in range(bisect_left(self.cell, key), bisect_right(self.cell, key)):
+                    km = haversine_km(lat, lng, self.lat[node], self.lng[node])
+                    if km <= best_km:
+                        best, best_km = node, km
+            ring += 1
+        return None if best is None else (best, best_km)
+
+    def _ring(self, row, column, ring):
+        rows = _grid(self.cell_degrees)[0]
+        if ring == 0:
+            yield row, column
+            return
+        for cell_row in range(row - ring, row + ring + 1):
+            if not 0 <= cell_row < rows:
+                continue
+            step = 1 if cell_row in (row - ring, row + ring) else 2 * ring
+            for cell_column in range(column - ring, column + ring + 1, step):
+                yield cell_row, cell_column % self.columns
+
+    def shortest_path(self, source: int, target: int) -> Optional[Tuple[float, List[int], List[float]]]:
+        """(km, nodes, cumulative km at each node) of the shortest path, or None if unreachable"""
+        km, meeting, forward_parents, backward_parents = self._search(source, target)
+        if meeting is None:
+            return None
+
+        hierarchy_path = []
+        node = meeting
+        while node is not None:
+            hierarchy_path.append(node)
+            node = forward_parents[node]
+        hierarchy_path.reverse()
+        node = backward_parents[meeting]
+        while node is not None:
+            hierarchy_path.append(node)
+            node = backward_parents[node]
+
+        nodes, cumulative = [source], [0.0]
+        for start, end in zip(hierarchy_path, hierarchy_path[1:]):
+            for next_node, edge_km in self._unpack(start, end):
+                nodes.append(next_node)
+                cumulative.append(cumulative[-1] + edge_km)
+        return km, nodes, cumulative
+
+    def _search(self, source, target):
+        """Bidirectional upward Dijkstra with stall-on-demand"""
+        offsets, targets, weights = self.offsets, self.target, self.weight
+        distances = ({source: 0.0}, {target: 0.0})
+        parents = ({source: None}, {target: None})
+        queues = ([(0.0, source)], [(0.0, target)])
+        best, meeting = _INFINITY, (source if source == target else None)
+        if meeting is not None:
+            best = 0.0
+
+        while queues[0] or queues[1]:
+            direction = 0 if queues[0] and (not queues[1] or queues[0][0][0] <= queues[1][0][0]) else 1
+            queue, own, other, parent = queues[direction], distances[direction], distances[1 - direction], \
+                parents[direction]
+            km, node = heapq.heappop(queue)
+            if km > own[node]:
+                continue
+            if km >= best:
+                queue.clear()
+                continue
+            if node in other and km + other[node] < best:
+                best, meeting = km + other[node], node
+
+            start, end = offsets[node], offsets[node + 1]
+            # Stall: a higher node already reached reaches this one more cheaply, so nothing above it helps
+            if any(own.get(targets[edge], _INFINITY) + weights[edge] < km for edge in range(start, end)):
+                continue
+            for edge in range(start, end):
+                neighbour = targets[edge]
+                total = km + weights[edge]
+                if total < own.get(neighbour, _INFINITY):
+                    own[neighbour] = total
+                    parent[neighbour] = node
+                    heapq.heappush(queue, (total, neighbour))
+
+        return best, meeting, parents[0], parents[1]
+
+    def _unpack(self, start, end) -> List[Tuple[int, float]]:
+        """Road edges replacing hierarchy edge start-end, as (next node, km) steps from ``start``"""
+        steps = []
+        stack = [(start, end)]
+        while stack:
+            a, b = stack.pop()
+            edge = self._edge(a, b)
+            via = self.via[edge]
+            if via < 0:
+                steps.append((b, self.weight[edge]))
+            else:
+                # Push the second half first so the first half is unpacked first
+                stack.append((via, b))
+                stack.append((a, via))
+        return steps
+
+    def _edge(self, a, b) -> int:
+        low, high = (a, b) if self.rank[a] < self.rank[b] else (b, a)
+        for edge in range(self.offsets[low], self.offsets[low + 1]):
+            if self.target[edge] == high:
+                return edge
+        raise ValueError(f"No edge between nodes {a} and {b}")
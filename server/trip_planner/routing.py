@@ -0,0 +1,164 @@
+"""Pluggable road routing for the planning engine.
+
+Without a router the engine plans every leg along the great-circle line between
+its ends. A router's ``route(start, end)`` returns a ``Route``: the road
+distance plus the polyline the road follows, which fuel stops are placed
+along. It returns None for legs it cannot route (e.g. too far from any road,
+or too short to leave the nearest node), and the engine falls back to the
+great-circle leg for those.
+
+``TRIP_PLANNER_ROUTING['BACKEND']`` picks the router:
+
+    'haversine'    no router, great-circle legs (the default)
+    'road_graph'   shortest paths over the local graph file at GRAPH_PATH (see road_graph.py),
+                   built with ``manage.py build_road_graph``
+    'osrm'         a self-hosted OSRM server at URL (see routing_http.py)
+
+Routers may also provide road distance matrices, which multi-stop trips are
+ordered by instead of great-circle distances.
+"""
+import threading
+from bisect import bisect_right
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .road_graph import RoadGraph
+
+DEFAULT_ROUTING = {
+    'BACKEND': 'haversine',
+    # road_graph
+    'GRAPH_PATH': None,
+    'SNAP_RADIUS_KM': 25,  # furthest a location may be from the nearest graph node
+    # osrm
+    'URL': None,
+    'PROFILE': 'driving',
+    'TIMEOUT': 2.0,  # seconds per request
+    'POOL_SIZE': 10,  # keep-alive connections
+    'MATRIX_BATCH_SIZE': 100,  # coordinates per table request (OSRM's --max-table-size)
+    'FAILURE_THRESHOLD': 5,  # consecutive failures that open the circuit
+    'RESET_TIMEOUT': 30,  # seconds before a trial request once the circuit is open
+    'CACHE_ALIAS': 'default',
+    'CACHE_TIMEOUT': 7 * 24 * 3600,
+    'PRECISION': 5,  # decimal places of lat/lng in cache keys, ~1 m
+}
+
+
+def routing_config() -> Dict:
+    return {**DEFAULT_ROUTING, **getattr(settings, 'TRIP_PLANNER_ROUTING', {})}
+
+
+class Route:
+    """Road distance of a leg and the polyline it follows, with the km run at each point"""
+
+    def __init__(self, distance_km: float, points: Sequence[Tuple[float, float]], cumulative_km: Sequence[float]):
+        self.distance_km = distance_km
+        self.points = points
+        self.cumulative_km = cumulative_km
+
+    def point_at(self, km: float) -> Dict:
+        """Location ``km`` along the route, interpolated within the polyline piece it falls on"""
+        index = min(max(bisect_right(self.cumulative_km, km) - 1, 0), len(self.points) - 2)
+        (lat1, lng1), (lat2, lng2) = self.points[index], self.points[index + 1]
+        piece_km = self.cumulative_km[index + 1] - self.cumulative_km[index]
+        ratio = min(max((km - self.cumulative_km[index]) / piece_km, 0.0), 1.0) if piece_km else 0.0
+        return {'lat': lat1 + (lat2 - lat1) * ratio, 'lng': lng1 + (lng2 - lng1) * ratio}
+
+
+class Router:
+    """Interface of routing backends"""
+
+    name = None
+
+    def route(self, start: Dict, end: Dict) -> Optional[Route]:
+        """Road route of a leg, or None to plan it along the great-circle line"""
+        raise NotImplementedError
+
+    def matrix(self, locations: Sequence[Dict]) -> Optional[List[List[float]]]:
+        """Road km between every pair of locations, or None to use great-circle distances"""
+        return None
+
+    def identity(self) -> str:
+        """Tells routers apart whose routes differ, for caches of planned segments"""
+        return self.name
+
+    def stats(self) -> Dict:
+        return {'backend': self.name}
+
+
+class RoadGraphRouter(Router):
+    """Routes legs over a memory-mapped RoadGraph, snapping each end to its nearest node"""
+
+    name = 'road_graph'
+
+    def __init__(self, graph: RoadGraph, snap_radius_km: float = 25):
+        self.graph = graph
+        self.snap_radius_km = snap_radius_km
+
+    def route(self, start: Dict, end: Dict) -> Optional[Route]:
+        snapped_start = self.graph.nearest_node(start['lat'], start['lng'], self.snap_radius_km)
+        snapped_end = self.graph.nearest_node(end['lat'], end['lng'], self.snap_radius_km)
+        if snapped_start is None or snapped_end is None:
+            return None
+        (source, access_km), (target, egress_km) = snapped_start, snapped_end
+        if source == target:
+            # Both ends are closer to the same node than to the road network beyond it
+            return None
+
+        path = self.graph.shortest_path(source, target)
+        if path is None:
+            return None
+        road_km, nodes, cumulative = path
+
+        # Drive from the start to its node, along the roads, then from the last node to the end
+        points: List[Tuple[float, float]] = [(start['lat'], start['lng'])]
+        points.extend((self.graph.lat[node], self.graph.lng[node]) for node in nodes)
+        points.append((end['lat'], end['lng']))
+        cumulative_km = [0.0] + [access_km + km for km in cumulative] + [access_km + road_km + egress_km]
+        return Route(cumulative_km[-1], points, cumulative_km)
+
+    def stats(self) -> Dict:
+        return {'backend': self.name, 'nodes': self.graph.node_count, 'edges': self.graph.edge_count}
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router() -> Optional[Router]:
+    """Return the process-wide router configured by TRIP_PLANNER_ROUTING, or None for great-circle legs"""
+    global _router
+    config = routing_config()
+    if config['BACKEND'] == 'haversine':
+        return None
+    if config['BACKEND'] not in ('road_graph', 'osrm'):
+        raise ImproperlyConfigured(f"Unknown routing backend '{config['BACKEND']}'")
+
+    with _router_lock:
+        if _router is None:
+            _router = _create_router(config)
+        return _router
+
+
+def _create_router(config) -> Router:
+    if config['BACKEND'] == 'road_graph':
+        if not config['GRAPH_PATH']:
+            raise ImproperlyConfigured("TRIP_PLANNER_ROUTING['GRAPH_PATH'] is required for the road_graph backend")
+        return RoadGraphRouter(RoadGraph(config['GRAPH_PATH']), snap_radius_km=config['SNAP_RADIUS_KM'])
+
+    if not config['URL']:
+        raise ImproperlyConfigured("TRIP_PLANNER_ROUTING['URL'] is required for the osrm backend")
+    from .routing_http import OsrmRouter
+    return OsrmRouter(
+        config['URL'],
+        profile=config['PROFILE'],
+        timeout=config['TIMEOUT'],
+        pool_size=config['POOL_SIZE'],
+        matrix_batch_size=config['MATRIX_BATCH_SIZE'],
+        failure_threshold=config['FAILURE_THRESHOLD'],
+        reset_timeout=config['RESET_TIMEOUT'],
+        cache_alias=config['CACHE_ALIAS'],
+        cache_timeout=config['CACHE_TIMEOUT'],
+        precision=config['PRECISION'],
+    )
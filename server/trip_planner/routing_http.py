@@ -0,0 +1,257 @@
+"""Routing backend for a self-hosted OSRM server.
+
+Legs come from OSRM's ``route`` service and distance matrices (for ordering
+multi-stop trips) from its ``table`` service, split into blocks of at most
+``MATRIX_BATCH_SIZE`` coordinates. Requests share a pooled keep-alive session
+and each call is bounded by ``TIMEOUT``. Results are stored in a Django cache
+(``CACHE_ALIAS``, ideally a persistent one) under coordinates rounded to
+``PRECISION`` decimal places, so repeated lanes never reach the server.
+
+When the server keeps failing, a circuit breaker stops calling it for
+``RESET_TIMEOUT`` seconds; legs and matrix entries then fall back to
+great-circle distances.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import requests
+from django.core.cache import caches
+from requests.adapters import HTTPAdapter
+
+from .road_graph import haversine_km
+from .routing import Route, Router
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Opens after ``failure_threshold`` consecutive failures and lets one trial call through
+    every ``reset_timeout`` seconds (half-open) until a call succeeds again"""
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                # (Re)open: a failed trial waits out another full reset_timeout
+                self.opened_at = self.clock()
+            self._trial_in_flight = False
+
+
+class RoutingServiceError(Exception):
+    """The routing server could not be reached or returned an unusable response"""
+
+
+def _parse_route(data: Dict) -> Tuple[float, List]:
+    """Road km and (lat, lng) geometry of the first route in an OSRM route response"""
+    osrm_route = data['routes'][0]
+    return osrm_route['distance'] / 1000, [(lat, lng) for lng, lat in osrm_route['geometry']['coordinates']]
+
+
+class OsrmRouter(Router):
+    name = 'osrm'
+
+    # OSRM answers these for coordinates it cannot route between; the server itself is fine
+    UNROUTABLE_CODES = ('NoRoute', 'NoSegment', 'NoTable')
+
+    def __init__(self, url: str, profile: str = 'driving', timeout: float = 2.0, pool_size: int = 10,
+                 matrix_batch_size: int = 100, failure_threshold: int = 5, reset_timeout: float = 30,
+                 cache_alias: str = 'default', cache_timeout: Optional[float] = 7 * 24 * 3600,
+                 precision: int = 5, key_prefix: str = 'trip_planner:osrm'):
+        self.url = url.rstrip('/')
+        self.profile = profile
+        self.timeout = timeout
+        self.matrix_batch_size = max(matrix_batch_size, 2)
+        self.cache_alias = cache_alias
+        self.cache_timeout = cache_timeout
+        self.precision = precision
+        self.key_prefix = key_prefix
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._stats_lock = threading.Lock()
+        self.requests = self.errors = self.fallbacks = self.hits = self.misses = 0
+
+    def identity(self) -> str:
+        return f'{self.name}-{self.profile}'
+
+    def route(self, start: Dict, end: Dict) -> Optional[Route]:
+        cache = caches[self.cache_alias]
+        key = f"{self.key_prefix}:route:{self.profile}:{self._point(start)}:{self._point(end)}"
+        cached = cache.get(key)
+        if cached is not None:
+            self._count(hits=1)
+            return Route(*cached)
+        self._count(misses=1)
+
+        parsed = self._call('route', [start, end], {'overview': 'full', 'geometries': 'geojson'}, _parse_route)
+        if parsed is None:
+            return None
+
+        road_km, road_points = parsed
+        points = [(start['lat'], start['lng'])] + road_points + [(end['lat'], end['lng'])]
+
+        # Spread OSRM's road distance over the geometry in proportion to the straight pieces
+        pieces = [haversine_km(*a, *b) for a, b in zip(road_points, road_points[1:])]
+        scale = road_km / sum(pieces) if sum(pieces) else 0.0
+        cumulative = [0.0, haversine_km(*points[0], *points[1])]
+        for piece in pieces:
+            cumulative.append(cumulative[-1] + piece * scale)
+        cumulative.append(cumulative[-1] + haversine_km(*points[-2], *points[-1]))
+
+        route = Route(cumulative[-1], points, cumulative)
+        cache.set(key, (route.distance_km, points, cumulative), self.cache_timeout)
+        return route
+
+    def matrix(self, locations: Sequence[Dict]) -> List[List[float]]:
+        """Road km between every pair of locations; pairs the server cannot provide are great-circle km"""
+        count = len(locations)
+        cache = caches[self.cache_alias]
+        keys = {
+            (i, j): f"{self.key_prefix}:km:{self.profile}:{self._point(locations[i])}:{self._point(locations[j])}"
+            for i in range(count) for j in range(count) if i != j
+        }
+        cached = cache.get_many(list(keys.values()))
+        distances = [[0.0] * count for _ in range(count)]
+        missing = set()
+        for pair, key in keys.items():
+            if key in cached:
+                distances[pair[0]][pair[1]] = cached[key]
+            else:
+                missing.add(pair)
+        self._count(hits=len(keys) - len(missing), misses=len(missing))
+
+        fetched = {}
+        half = self.matrix_batch_size // 2
+        blocks = [list(range(first, min(first + half, count))) for first in range(0, count, half)]
+        if count <= self.matrix_batch_size:
+            blocks = [list(range(count))]
+        for sources in blocks:
+            for destinations in blocks:
+                if not any((i, j) in missing for i in sources for j in destinations):
+                    continue
+                block = self._matrix_block(locations, sources, destinations)
+                for i in sources:
+                    for j in destinations:
+                        if i == j:
+                            continue
+                        km = block.get((i, j))
+                        if km is None:
+                            km = haversine_km(locations[i]['lat'], locations[i]['lng'],
+                                              locations[j]['lat'], locations[j]['lng'])
+                        else:
+                            fetched[keys[i, j]] = km
+                        distances[i][j] = km
+
+        if fetched:
+            cache.set_many(fetched, self.cache_timeout)
+        return distances
+
+    def _matrix_block(self, locations, sources, destinations) -> Dict:
+        """{(i, j): km} for one table request; pairs left out could not be fetched"""
+        coordinates = sources if sources is destinations else sources + destinations
+        params = {'annotations': 'distance'}
+        if coordinates != list(range(len(locations))) or sources is not destinations:
+            params['sources'] = ';'.join(str(k) for k in range(len(sources)))
+            first_destination = 0 if sources is destinations else len(sources)
+            params['destinations'] = ';'.join(
+                str(first_destination + k) for k in range(len(destinations))
+            )
+
+        block = self._call('table', [locations[index] for index in coordinates], params, lambda data: {
+            (i, j): meters / 1000
+            for i, row in zip(sources, data['distances'])
+            for j, meters in zip(destinations, row)
+            if meters is not None
+        })
+        return {} if block is None else block
+
+    def _call(self, service: str, locations: Sequence[Dict], params: Dict, parse: Callable):
+        """``parse`` applied to the JSON response of an OSRM service, or None (counted as a fallback)
+        if it cannot be used; a body ``parse`` cannot read counts as a failure of the server"""
+        if not self.breaker.allow():
+            self._count(fallbacks=1)
+            return None
+
+        coordinates = ';'.join(f"{location['lng']},{location['lat']}" for location in locations)
+        url = f"{self.url}/{service}/v1/{self.profile}/{coordinates}"
+        self._count(requests=1)
+        try:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            data = response.json() if response.content else {}
+            if data.get('code') in self.UNROUTABLE_CODES:
+                self.breaker.record_success()
+                self._count(fallbacks=1)
+                return None
+            if response.status_code != 200 or data.get('code') != 'Ok':
+                raise RoutingServiceError(f"{response.status_code} {data.get('code')}: {data.get('message', '')}")
+            result = parse(data)
+        except (requests.RequestException, ValueError, RoutingServiceError,
+                AttributeError, KeyError, IndexError, TypeError) as exc:
+            self.breaker.record_failure()
+            self._count(errors=1, fallbacks=1)
+            logger.warning("OSRM %s request failed (%s), using great-circle distances", service, exc)
+            return None
+
+        self.breaker.record_success()
+        return result
+
+    def _point(self, location: Dict) -> str:
+        return f"{round(location['lat'], self.precision)},{round(location['lng'], self.precision)}"
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def stats(self) -> Dict:
+        return {
+            'backend': self.name,
+            'url': self.url,
+            'circuit': self.breaker.state,
+            'requests': self.requests,
+            'errors': self.errors,
+            'fallbacks': self.fallbacks,
+            'cache_hits': self.hits,
+            'cache_misses': self.misses,
+        }
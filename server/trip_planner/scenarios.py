@@ -0,0 +1,98 @@
+"""What-if comparison of one trip under many HOS starting conditions.
+
+Every combination of the grid's departure hours, cycle hours used and sleeper
+split choices is evaluated without storing anything. The variants differ only
+in how the HOS clock runs over the route, so the route segments are planned
+once (through the lane cache) and each variant costs one clock pass. Variants
+whose cycle hours never run out share that pass with the lowest such value
+for the same departure and split. Results are ranked by HOS violations,
+then total duration, then log days. Duty days start at departure, so the
+departure hour does not change how they fall; finish times are on the calendar,
+so it shows up in when the trip arrives.
+"""
+from dataclasses import dataclass
+from itertools import product
+from typing import Dict, List, Sequence, Tuple
+
+from django.conf import settings
+
+from . import hos
+from .engine import PlanningEngine
+
+DEFAULT_SCENARIOS = {
+    'MAX_SCENARIOS': 100,  # combinations one request may ask for
+}
+
+MINUTES_PER_DAY = 24 * 60
+
+GRID_FIELDS = ('departure_hour', 'current_cycle_used_hours', 'sleeper_split')
+
+
+def scenarios_config() -> Dict:
+    return {**DEFAULT_SCENARIOS, **getattr(settings, 'TRIP_PLANNER_SCENARIOS', {})}
+
+
+@dataclass(frozen=True)
+class ScenarioResult:
+    departure_hour: float
+    current_cycle_used_hours: int
+    sleeper_split: bool
+    duration_minutes: int                   # from departure to the end of the last segment
+    days: int                               # log days, restart days included
+    finish_day: int                         # calendar day, day 1 being the departure day
+    finish_minute: int                      # minute of the finish day, from midnight
+    violations: Tuple[Tuple[int, str], ...]  # (day number, rule)
+
+
+def grid_values(trip_data: Dict, grid: Dict) -> Tuple[List, List, List]:
+    """Distinct values of each grid field, defaulting to the base trip's"""
+    defaults = {'departure_hour': [0], 'current_cycle_used_hours': [trip_data['current_cycle_used_hours']],
+                'sleeper_split': [False]}
+    return tuple(list(dict.fromkeys(grid.get(field) or defaults[field])) for field in GRID_FIELDS)
+
+
+def scenario_count(trip_data: Dict, grid: Dict) -> int:
+    count = 1
+    for values in grid_values(trip_data, grid):
+        count *= len(values)
+    return count
+
+
+def evaluate_scenarios(engine: PlanningEngine, trip_data: Dict, grid: Dict) -> Tuple[Sequence, List[ScenarioResult]]:
+    """Plan the trip's route once and evaluate every grid combination on it; returns (segments, ranked results)"""
+    segments = engine.trip_segments(**trip_data)
+    cycle_minutes = sum(segment.duration_minutes or 0 for segment in segments if segment.type in hos.ON_DUTY_TYPES)
+    departures, cycle_hours, splits = grid_values(trip_data, grid)
+
+    results = []
+    for departure_hour, sleeper_split in product(departures, splits):
+        shared = None
+        for hours in sorted(cycle_hours):
+            # Without a restart the cycle hours cannot change the clock's decisions
+            never_restarts = hours * 60 + cycle_minutes <= hos.MAX_CYCLE_MINUTES
+            if never_restarts and shared is not None:
+                results.append(ScenarioResult(departure_hour, hours, sleeper_split, *shared))
+                continue
+            outcome = _run_clock(engine, segments, hours, round(departure_hour * 60), sleeper_split)
+            if never_restarts:
+                shared = outcome
+            results.append(ScenarioResult(departure_hour, hours, sleeper_split, *outcome))
+
+    results.sort(key=lambda r: (len(r.violations), r.duration_minutes, r.days, r.departure_hour,
+                                r.current_cycle_used_hours, r.sleeper_split))
+    return segments, results
+
+
+def _run_clock(engine, segments, cycle_used_hours, departure_minute, sleeper_split):
+    timeline = []
+    log_days = engine.log_days(segments, cycle_used_hours, timeline=timeline,
+                               departure_minute=departure_minute, sleeper_split=sleeper_split)
+    last = timeline[-1]
+    finish = last.minute + (segments[-1].duration_minutes or 0)
+    return (
+        finish - departure_minute,
+        len(log_days),
+        finish // MINUTES_PER_DAY + 1,
+        finish % MINUTES_PER_DAY,
+        tuple(hos.violations(timeline, segments)),
+    )
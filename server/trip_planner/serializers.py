@@ -1,5 +1,15 @@
 from rest_framework import serializers
+from .exports import FORMATS, parquet_available, parse_bound
 from .models import Trip, RouteSegment, LogSheet
+from .optimizer import optimizer_config, order_is_feasible, precedence_pairs
+from .scenarios import scenario_count, scenarios_config
+
+
+def validate_location(value):
+    """Field validator for JSON locations, which need 'lat' and 'lng'"""
+    if not isinstance(value, dict) or 'lat' not in value or 'lng' not in value:
+        raise serializers.ValidationError("Location must have 'lat' and 'lng' fields")
+    return value
 
 
 class RouteSegmentSerializer(serializers.ModelSerializer):
@@ -10,11 +20,29 @@ class RouteSegmentSerializer(serializers.ModelSerializer):
 
 class LogSheetSerializer(serializers.ModelSerializer):
     day = serializers.IntegerField(source='day_number')
+    graph_points = serializers.SerializerMethodField()
     
     class Meta:
         model = LogSheet
         fields = ['day', 'graph_points', 'summary']
 
+    def get_graph_points(self, obj):
+        return obj.get_graph_points()
+
+
+class PlannedSegmentSerializer(serializers.Serializer):
+    type = serializers.CharField()
+    start_location = serializers.JSONField()
+    end_location = serializers.JSONField()
+    duration_minutes = serializers.IntegerField()
+    distance_km = serializers.FloatField(allow_null=True)
+
+
+class PlannedLogDaySerializer(serializers.Serializer):
+    day = serializers.IntegerField(source='day_number')
+    graph_points = serializers.JSONField()
+    summary = serializers.JSONField()
+
 
 class TripCreateSerializer(serializers.Serializer):
     current_location = serializers.JSONField()
@@ -23,20 +51,91 @@ class TripCreateSerializer(serializers.Serializer):
     current_cycle_used_hours = serializers.IntegerField(min_value=0, max_value=70)
 
     def validate_current_location(self, value):
-        if not isinstance(value, dict) or 'lat' not in value or 'lng' not in value:
-            raise serializers.ValidationError("Location must have 'lat' and 'lng' fields")
-        return value
+        return validate_location(value)
 
     def validate_pickup_location(self, value):
-        if not isinstance(value, dict) or 'lat' not in value or 'lng' not in value:
-            raise serializers.ValidationError("Location must have 'lat' and 'lng' fields")
-        return value
+        return validate_location(value)
 
     def validate_dropoff_location(self, value):
-        if not isinstance(value, dict) or 'lat' not in value or 'lng' not in value:
-            raise serializers.ValidationError("Location must have 'lat' and 'lng' fields")
+        return validate_location(value)
+
+
+class ScenarioGridSerializer(serializers.Serializer):
+    departure_hour = serializers.ListField(
+        child=serializers.FloatField(min_value=0, max_value=23.99), allow_empty=False, required=False
+    )
+    current_cycle_used_hours = serializers.ListField(
+        child=serializers.IntegerField(min_value=0, max_value=70), allow_empty=False, required=False
+    )
+    sleeper_split = serializers.ListField(child=serializers.BooleanField(), allow_empty=False, required=False)
+
+
+class TripScenariosSerializer(TripCreateSerializer):
+    grid = ScenarioGridSerializer()
+
+    def validate(self, data):
+        max_scenarios = scenarios_config()['MAX_SCENARIOS']
+        if scenario_count(data, data['grid']) > max_scenarios:
+            raise serializers.ValidationError({'grid': [f"A grid may have at most {max_scenarios} combinations"]})
+        return data
+
+
+class StopSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(choices=['pickup', 'dropoff'])
+    location = serializers.JSONField()
+    # Pairs a dropoff with the pickup it must follow
+    shipment = serializers.CharField(max_length=64, required=False)
+
+    def validate_location(self, value):
+        return validate_location(value)
+
+
+class MultiStopTripCreateSerializer(serializers.Serializer):
+    current_location = serializers.JSONField()
+    stops = StopSerializer(many=True)
+    current_cycle_used_hours = serializers.IntegerField(min_value=0, max_value=70)
+    # False keeps the stops in the given order
+    optimize = serializers.BooleanField(default=True)
+
+    def validate_current_location(self, value):
+        return validate_location(value)
+
+    def validate_stops(self, value):
+        max_stops = optimizer_config()['MAX_STOPS']
+        if not 1 <= len(value) <= max_stops:
+            raise serializers.ValidationError(f"A trip must have between 1 and {max_stops} stops")
+
+        seen = set()
+        for stop in value:
+            if 'shipment' not in stop:
+                continue
+            key = (stop['shipment'], stop['type'])
+            if key in seen:
+                raise serializers.ValidationError(f"Shipment '{stop['shipment']}' has more than one {stop['type']}")
+            seen.add(key)
+        missing = sorted(
+            shipment for shipment, stop_type in seen if stop_type == 'dropoff' and (shipment, 'pickup') not in seen
+        )
+        if missing:
+            raise serializers.ValidationError(f"Dropoffs without a pickup for shipments: {', '.join(missing)}")
         return value
 
+    def validate(self, data):
+        stops = data['stops']
+        if not data['optimize'] and not order_is_feasible(range(len(stops)), precedence_pairs(stops)):
+            raise serializers.ValidationError({'stops': ["Every dropoff must come after its shipment's pickup"]})
+        return data
+
+
+class TripProgressSerializer(serializers.Serializer):
+    current_location = serializers.JSONField()
+    # Minutes since the trip started, on the clock of its log sheets
+    elapsed_minutes = serializers.IntegerField(min_value=0)
+    current_cycle_used_hours = serializers.IntegerField(min_value=0, max_value=70, required=False)
+
+    def validate_current_location(self, value):
+        return validate_location(value)
+
 
 class TripSerializer(serializers.ModelSerializer):
     route = RouteSegmentSerializer(source='segments', many=True, read_only=True)
@@ -65,7 +164,7 @@ class TripDetailSerializer(serializers.ModelSerializer):
         model = Trip
         fields = [
             'id', 'created_at', 'current_location', 'pickup_location', 
-            'dropoff_location', 'current_cycle_used_hours', 
+            'dropoff_location', 'current_cycle_used_hours', 'stops',
             'total_distance_km', 'estimated_days', 'route'
         ]
         read_only_fields = ['id', 'created_at', 'total_distance_km', 'estimated_days']
@@ -84,4 +183,57 @@ class TripLogsSerializer(serializers.Serializer):
         return {
             'trip_id': str(instance.id),
             'logs': LogSheetSerializer(instance.logs.all(), many=True).data
-        }
\ No newline at end of file
+        }
+
+
+class TripQuoteSerializer(serializers.Serializer):
+    """Renders an unsaved engine TripPlan in the same shape as TripSerializer, plus its log days"""
+    total_distance_km = serializers.FloatField()
+    estimated_days = serializers.IntegerField()
+    route = PlannedSegmentSerializer(source='segments', many=True)
+    logs = PlannedLogDaySerializer(source='log_days', many=True)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        return {
+            'trip_id': None,
+            'total_distance_km': data['total_distance_km'],
+            'estimated_days': data['estimated_days'],
+            'route': data['route'],
+            'logs': data['logs']
+        }
+
+
+class NearbyTripsQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lng = serializers.FloatField(min_value=-180, max_value=180)
+    radius_km = serializers.FloatField(min_value=0, max_value=1000, default=50)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+
+class ExportQuerySerializer(serializers.Serializer):
+    format = serializers.ChoiceField(choices=FORMATS, default='ndjson')
+    since = serializers.CharField(required=False)
+    until = serializers.CharField(required=False)
+
+    def validate_format(self, value):
+        if value == 'parquet' and not parquet_available():
+            raise serializers.ValidationError('Parquet exports are not available on this server.')
+        return value
+
+    def validate_since(self, value):
+        return self._bound(value)
+
+    def validate_until(self, value):
+        return self._bound(value)
+
+    def _bound(self, value):
+        bound = parse_bound(value)
+        if bound is None:
+            raise serializers.ValidationError('Expected an ISO 8601 date or datetime.')
+        return bound
+
+    def validate(self, data):
+        if 'since' in data and 'until' in data and data['until'] <= data['since']:
+            raise serializers.ValidationError({'until': 'Must be later than since.'})
+        return data
@@ -1,376 +1,185 @@
-import math
-from datetime import datetime, timedelta
-from typing import List, Dict, Tuple
+from itertools import groupby
+from typing import List, Dict, Optional, Sequence, Tuple
+from django.db import transaction
+from .engine import PlannedSegment, PlanningEngine, Replan, TripPlan
+from .geohash import location_geohash
+from .instrumentation import stage
+from .lane_cache import get_lane_cache
+from .log_encoding import StringTable, log_sheet_points
 from .models import Trip, RouteSegment, LogSheet
+from .optimizer import StopOrder, optimize_stop_order
+from .response_cache import invalidate_trip_responses
+from .routing import get_router
 
-class TripPlanningService:
-    def __init__(self):
-        pass
 
-    PICKUP_DURATION = 60  # minutes
-    DROPOFF_DURATION = 60  # minutes
-    FUEL_INTERVAL_KM = 1609  # ~1000 miles
-    AVERAGE_SPEED_KMH = 100
-    MAX_DRIVING_HOURS = 11
+class TripPlanningService:
+    def __init__(self, router=None):
+        # The routing backend configured by TRIP_PLANNER_ROUTING unless one is passed in
+        self.engine = PlanningEngine(lane_cache=get_lane_cache(), router=router or get_router())
 
     def plan_trip(self, trip_data: Dict) -> Trip:
-        trip = Trip.objects.create(**trip_data)
-        
-        # Calculate route segments
-        segments = self._calculate_route_segments(trip)
-        
-        # Create route segments
-        for i, segment_data in enumerate(segments):
-            RouteSegment.objects.create(
-                trip=trip,
-                sequence_order=i,
-                **segment_data
+        return self.plan_trips([trip_data])[0]
+
+    def plan_trips(self, trips_data: List[Dict]) -> List[Trip]:
+        """Plan several trips in memory and persist them in a single transaction"""
+        return self.save_plans(list(zip(trips_data, self.plan(trips_data))))
+
+    def plan(self, trips_data: List[Dict]) -> List[TripPlan]:
+        """Plan trips in memory, vectorizing the geometry when there is more than one"""
+        if len(trips_data) > 1:
+            return self.engine.plan_many(trips_data)
+        return [self.engine.plan(**trip_data) for trip_data in trips_data]
+
+    def plan_multi_stop(self, trip_data: Dict) -> Tuple[Dict, TripPlan, Optional[StopOrder]]:
+        """Order a multi-stop trip's stops (unless ``optimize`` is false) and plan it in memory.
+
+        Returns the Trip field values for save_plans, with the first pickup and the
+        last stop as its pickup and dropoff locations, the plan and the stop ordering.
+        """
+        stops = trip_data['stops']
+        stop_order = None
+        if trip_data.get('optimize', True):
+            router = self.engine.router
+            distances = None
+            if router is not None:
+                distances = router.matrix([trip_data['current_location']] + [stop['location'] for stop in stops])
+            stop_order = optimize_stop_order(trip_data['current_location'], stops, distances=distances)
+            stops = [stops[index] for index in stop_order.order]
+
+        pickup = next((stop for stop in stops if stop['type'] == 'pickup'), stops[0])
+        fields = {
+            'current_location': trip_data['current_location'],
+            'pickup_location': pickup['location'],
+            'dropoff_location': stops[-1]['location'],
+            'current_cycle_used_hours': trip_data['current_cycle_used_hours'],
+            'stops': [dict(stop) for stop in stops],
+        }
+        plan = self.engine.plan_stops(trip_data['current_location'], stops, trip_data['current_cycle_used_hours'])
+        return fields, plan, stop_order
+
+    def save_plans(self, planned_trips: List[Tuple[Dict, TripPlan]]) -> List[Trip]:
+        """Persist engine results with one bulk insert per table"""
+        trips = []
+        route_segments = []
+        log_sheets = []
+
+        for trip_data, plan in planned_trips:
+            trip = Trip(
+                total_distance_km=plan.total_distance_km,
+                estimated_days=plan.estimated_days,
+                pickup_geohash=location_geohash(trip_data['pickup_location']),
+                **trip_data
+            )
+            trips.append(trip)
+            route_segments.extend(
+                RouteSegment(trip=trip, sequence_order=i, **segment.as_dict())
+                for i, segment in enumerate(plan.segments)
+            )
+            with stage('log_sheets'):
+                log_sheets.extend(self._build_log_sheets(trip, plan.log_days))
+
+        with stage('db_write'), transaction.atomic():
+            Trip.objects.bulk_create(trips)
+            RouteSegment.objects.bulk_create(route_segments)
+            LogSheet.objects.bulk_create(log_sheets)
+
+        return trips
+
+    def update_progress(self, trip_id, current_location: Dict, elapsed_minutes: int,
+                        current_cycle_used_hours: Optional[int] = None) -> Optional[Replan]:
+        """Replan a stored trip from the driver's position, rewriting only what changes.
+
+        Segments after the kept ones and log sheets from the replan's first day
+        are deleted and inserted again; earlier rows are not touched.
+        ``current_cycle_used_hours`` is the driver's cycle as of now; it only
+        replaces the trip's starting value when nothing has been driven yet.
+        Raises Trip.DoesNotExist for unknown trips and returns None for
+        finished ones.
+        """
+        with transaction.atomic():
+            trip = (
+                Trip.objects.select_for_update().only('id', 'log_strings', 'current_cycle_used_hours').get(id=trip_id)
             )
-        
-        # Generate log sheets
-        self._generate_log_sheets(trip)
-        
-        # Update trip totals
-        total_distance = sum(s.get('distance_km', 0) for s in segments if s.get('distance_km'))
-        estimated_days = self._estimate_trip_days(segments)
-        
-        trip.total_distance_km = total_distance
-        trip.estimated_days = estimated_days
-        trip.save()
-        
-        return trip
-    
-    def _calculate_route_segments(self, trip: Trip) -> List[Dict]:
-        segments = []
-        current_hours_used = 0
-        sequence = 0
-        
-        # Drive to pickup
-        pickup_distance = self._calculate_distance(
-            trip.current_location, trip.pickup_location
+            segments = [
+                PlannedSegment(*row) for row in
+                trip.segments.order_by('sequence_order').values_list(
+                    'type', 'start_location', 'end_location', 'duration_minutes', 'distance_km'
+                )
+            ]
+            replan = self.engine.replan(segments, current_location, elapsed_minutes, trip.current_cycle_used_hours,
+                                        current_cycle_used_hours)
+            if replan is None:
+                return None
+            if replan.from_start and current_cycle_used_hours is not None:
+                # Every day was planned again from the report, so it is the trip's new starting value
+                trip.current_cycle_used_hours = current_cycle_used_hours
+
+            # Completed days keep their string table indexes, so new strings are appended
+            log_sheets = self._build_log_sheets(trip, replan.log_days, StringTable(trip.log_strings))
+            trip.segments.filter(sequence_order__gte=replan.kept_segments).delete()
+            RouteSegment.objects.bulk_create(
+                RouteSegment(trip=trip, sequence_order=replan.kept_segments + i, **segment.as_dict())
+                for i, segment in enumerate(replan.segments)
+            )
+            trip.logs.filter(day_number__gte=replan.first_day).delete()
+            LogSheet.objects.bulk_create(log_sheets)
+
+            trip.total_distance_km = replan.total_distance_km
+            trip.estimated_days = replan.estimated_days
+            trip.save(update_fields=['total_distance_km', 'estimated_days', 'log_strings', 'current_cycle_used_hours'])
+            invalidate_trip_responses([trip.id])
+        return replan
+
+    def regenerate_log_sheets(self, trip: Trip) -> List[LogSheet]:
+        """Replace a trip's log sheets with ones generated from its stored segments"""
+        log_sheets = self._build_log_sheets(
+            trip, self.engine.log_days(trip.segments.all(), trip.current_cycle_used_hours)
         )
-        pickup_drive_hours = pickup_distance / self.AVERAGE_SPEED_KMH
-        
-        segments.extend(self._create_drive_segments(
-            start_location=trip.current_location,
-            end_location=trip.pickup_location,
-            distance_km=pickup_distance,
-            drive_hours=pickup_drive_hours,
-            current_cycle_hours=trip.current_cycle_used_hours,
-            sequence_start=sequence
-        ))
-        sequence = len(segments)
-        current_hours_used += pickup_drive_hours
-        
-        # Pickup event
-        segments.append({
-            'type': 'pickup',
-            'start_location': trip.pickup_location,
-            'end_location': trip.pickup_location,
-            'duration_minutes': self.PICKUP_DURATION,
-        })
-        sequence += 1
-        current_hours_used += self.PICKUP_DURATION / 60
-        
-        # Drive to dropoff
-        dropoff_distance = self._calculate_distance(
-            trip.pickup_location, trip.dropoff_location
+        with transaction.atomic():
+            trip.logs.all().delete()
+            LogSheet.objects.bulk_create(log_sheets)
+            trip.save(update_fields=['log_strings'])
+            invalidate_trip_responses([trip.id])
+        return log_sheets
+
+    def regenerate_log_sheets_bulk(self, trip_ids: Sequence) -> int:
+        """Regenerate log sheets for many trips with one trip and one segment read, one delete and one insert"""
+        rows = (
+            RouteSegment.objects
+            .filter(trip_id__in=trip_ids)
+            .order_by('trip_id', 'sequence_order')
+            .values_list('trip_id', 'type', 'start_location', 'end_location', 'duration_minutes')
         )
-        dropoff_drive_hours = dropoff_distance / self.AVERAGE_SPEED_KMH
-        
-        segments.extend(self._create_drive_segments(
-            start_location=trip.pickup_location,
-            end_location=trip.dropoff_location,
-            distance_km=dropoff_distance,
-            drive_hours=dropoff_drive_hours,
-            current_cycle_hours=trip.current_cycle_used_hours + current_hours_used,
-            sequence_start=sequence
-        ))
-        sequence = len(segments)
-        
-        # Dropoff event
-        segments.append({
-            'type': 'dropoff',
-            'start_location': trip.dropoff_location,
-            'end_location': trip.dropoff_location,
-            'duration_minutes': self.DROPOFF_DURATION,
-        })
-        
-        return segments
-    
-    def _create_drive_segments(self, start_location: Dict, end_location: Dict, 
-                              distance_km: float, drive_hours: float, 
-                              current_cycle_hours: float, sequence_start: int) -> List[Dict]:
-        segments = []
-        
-        # For simplicity, create one drive segment and add refuel stops every 1000 miles
-        current_distance = 0
-        while current_distance < distance_km:
-            # Calculate remaining distance
-            remaining_distance = distance_km - current_distance
-            
-            # Check if we need a fuel stop
-            segment_distance = min(remaining_distance, self.FUEL_INTERVAL_KM)
-            segment_hours = (segment_distance / distance_km) * drive_hours
-            
-            # Calculate current and end locations for this segment
-            progress_start = current_distance / distance_km
-            progress_end = (current_distance + segment_distance) / distance_km
-            
-            segment_start = self._interpolate_location(start_location, end_location, progress_start)
-            segment_end = self._interpolate_location(start_location, end_location, progress_end)
-            
-            # Add drive segment
-            segments.append({
-                'type': 'drive',
-                'start_location': segment_start,
-                'end_location': segment_end,
-                'distance_km': segment_distance,
-                'duration_minutes': int(segment_hours * 60),
-            })
-            
-            current_distance += segment_distance
-            
-            # Add refuel stop if not at destination and segment was full fuel interval
-            if current_distance < distance_km and segment_distance >= self.FUEL_INTERVAL_KM:
-                segments.append({
-                    'type': 'refuel',
-                    'start_location': segment_end,
-                    'end_location': segment_end,
-                    'duration_minutes': 30,
-                })
-        
-        # Add mandatory rest breaks based on driving hours
-        if drive_hours > self.MAX_DRIVING_HOURS:
-            segments.append({
-                'type': 'rest',
-                'start_location': end_location,
-                'end_location': end_location,
-                'duration_minutes': 10 * 60,  # 10 hours mandatory rest
-            })
-        elif drive_hours > 8:
-            # Add 30-minute break after 8 hours
-            segments.append({
-                'type': 'break',
-                'start_location': end_location,
-                'end_location': end_location,
-                'duration_minutes': 30,
-            })
-        
-        return segments
-    
-    def _calculate_distance(self, location1: Dict, location2: Dict) -> float:
-        # Haversine formula for great circle distance
-        lat1, lon1 = math.radians(location1['lat']), math.radians(location1['lng'])
-        lat2, lon2 = math.radians(location2['lat']), math.radians(location2['lng'])
-        
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        
-        a = math.sin(dlat/2)**2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlon/2)**2
-        c = 2 * math.asin(math.sqrt(a))
-        
-        # Earth's radius in kilometers
-        r = 6371
-        return c * r
-    
-    def _interpolate_location(self, start: Dict, end: Dict, ratio: float) -> Dict:
-        return {
-            'lat': start['lat'] + (end['lat'] - start['lat']) * ratio,
-            'lng': start['lng'] + (end['lng'] - start['lng']) * ratio,
+        segments_by_trip = {
+            trip_id: [PlannedSegment(*row[1:]) for row in trip_rows]
+            for trip_id, trip_rows in groupby(rows.iterator(), key=lambda row: row[0])
         }
-    
-    def _format_location(self, location: Dict) -> str:
-        """Format location dict into readable string"""
-        if not location:
-            return "UNKNOWN"
-        
-        # If location has city/state info, use that
-        if 'city' in location and 'state' in location:
-            return f"{location['city']}, {location['state']}"
-        
-        # Otherwise format coordinates
-        lat = location.get('lat', 0)
-        lng = location.get('lng', 0)
-        return f"{lat:.2f}, {lng:.2f}"
-    
-    def _estimate_trip_days(self, segments: List[Dict]) -> int:
-        total_hours = sum(
-            s.get('duration_minutes', 0) / 60 
-            for s in segments
-        )
-        return math.ceil(total_hours / 24)
-    
-    def _generate_log_sheets(self, trip: Trip):
-        segments = list(trip.segments.all())
-        if not segments:
-            LogSheet.objects.create(
+
+        trips = list(Trip.objects.filter(id__in=trip_ids).only('id', 'current_cycle_used_hours'))
+        log_sheets = []
+        for trip in trips:
+            log_days = self.engine.log_days(segments_by_trip.get(trip.id, ()), trip.current_cycle_used_hours)
+            log_sheets.extend(self._build_log_sheets(trip, log_days))
+
+        with transaction.atomic():
+            LogSheet.objects.filter(trip_id__in=trip_ids).delete()
+            LogSheet.objects.bulk_create(log_sheets)
+            Trip.objects.bulk_update(trips, ['log_strings'])
+            invalidate_trip_responses(trip_ids)
+        return len(log_sheets)
+
+    def _build_log_sheets(self, trip: Trip, log_days, table: Optional[StringTable] = None) -> List[LogSheet]:
+        """Log sheets with their points encoded against ``table`` (a fresh one by default), stored on ``trip.log_strings``"""
+        if table is None:
+            table = StringTable()
+        log_sheets = [
+            LogSheet(
                 trip=trip,
-                day_number=1,
-                graph_points=[
-                    {'time': '06:00', 'status': 'off-duty'},
-                    {'time': '08:00', 'status': 'on-duty'},
-                    {'time': '18:00', 'status': 'off-duty'}
-                ],
-                summary={
-                    'driving_hours': 0,
-                    'on_duty_hours': 10,
-                    'rest_hours': 14
-                }
+                day_number=log_day.day_number,
+                summary=log_day.summary,
+                **log_sheet_points(log_day.graph_points, table)
             )
-            return
-
-        # Start processing segments with HOS compliance
-        current_time_minutes = 0  # Start at 00:00 (midnight)
-        day_number = 1
-        current_day_start = 0
-        
-        # Daily tracking
-        daily_driving_minutes = 0
-        daily_on_duty_minutes = 0
-        continuous_driving_minutes = 0
-        
-        # Graph points for current day - start off-duty
-        graph_points = [{'time': '00:00', 'status': 'off-duty'}]
-        
-        # Process each segment
-        for i, segment in enumerate(segments):
-            segment_duration = segment.duration_minutes or 0
-            
-            # Check if we need a 30-minute break after 8 hours of continuous driving
-            if (segment.type == 'drive' and 
-                continuous_driving_minutes >= 480 and  # 8 hours = 480 minutes
-                segment_duration > 0):
-                
-                # Insert mandatory 30-minute break
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'break')
-                current_time_minutes += 30
-                continuous_driving_minutes = 0
-            
-            # Check if we need to start a new day due to HOS limits
-            if self._needs_new_day(segment, segment_duration, daily_driving_minutes, 
-                                 daily_on_duty_minutes, current_time_minutes, current_day_start):
-                
-                # End current day - go off-duty
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'off-duty')
-                
-                # Create log sheet for completed day
-                self._create_log_sheet(trip, day_number, graph_points, 
-                                     daily_driving_minutes, daily_on_duty_minutes)
-                
-                # Start new day after 10-hour mandatory rest
-                day_number += 1
-                current_time_minutes += 600  # 10 hours = 600 minutes
-                current_day_start = current_time_minutes
-                
-                # Reset daily counters
-                daily_driving_minutes = 0
-                daily_on_duty_minutes = 0
-                continuous_driving_minutes = 0
-                
-                # New day starts off-duty
-                graph_points = [{'time': '00:00', 'status': 'off-duty'}]
-            
-            # Process the current segment
-            if segment.type == 'rest':
-                # Rest periods are rest status
-                location = self._format_location(segment.start_location)
-                annotation = "REST"
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'rest', location, annotation)
-                current_time_minutes += segment_duration
-                continuous_driving_minutes = 0
-                
-            elif segment.type == 'drive':
-                # Start driving
-                start_location = self._format_location(segment.start_location)
-                end_location = self._format_location(segment.end_location)
-                annotation = f"DRIVING {start_location} TO {end_location}"
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'driving', start_location, annotation)
-                current_time_minutes += segment_duration
-                daily_driving_minutes += segment_duration
-                daily_on_duty_minutes += segment_duration
-                continuous_driving_minutes += segment_duration
-                
-            elif segment.type in ['pickup', 'dropoff', 'refuel']:
-                # On-duty activities
-                location = self._format_location(segment.start_location)
-                annotation = segment.type.upper()
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'on-duty', location, annotation)
-                current_time_minutes += segment_duration
-                daily_on_duty_minutes += segment_duration
-                continuous_driving_minutes = 0
-                
-            elif segment.type == 'break':
-                # Break periods
-                location = self._format_location(segment.start_location)
-                annotation = "BREAK"
-                self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'break', location, annotation)
-                current_time_minutes += segment_duration
-                continuous_driving_minutes = 0
-        
-        # End final day - go off-duty
-        self._add_graph_point(graph_points, current_time_minutes, current_day_start, 'off-duty')
-        
-        # Create final log sheet
-        self._create_log_sheet(trip, day_number, graph_points, 
-                             daily_driving_minutes, daily_on_duty_minutes)
-    
-    def _needs_new_day(self, segment, segment_duration, daily_driving_minutes, 
-                       daily_on_duty_minutes, current_time_minutes, current_day_start):
-        # Check if adding this segment would violate HOS rules
-        
-        # 11-hour driving limit
-        if segment.type == 'drive' and daily_driving_minutes + segment_duration > 660:  # 11 hours = 660 minutes
-            return True
-            
-        # 14-hour on-duty limit (for driving/on-duty activities)
-        if segment.type in ['drive', 'pickup', 'dropoff', 'refuel']:
-            if daily_on_duty_minutes + segment_duration > 840:  # 14 hours = 840 minutes
-                return True
-        
-        # Check if current day would exceed 24 hours
-        time_in_current_day = current_time_minutes - current_day_start
-        if time_in_current_day + segment_duration > 1440:  # 24 hours = 1440 minutes
-            return True
-            
-        return False
-    
-    def _add_graph_point(self, graph_points, current_time_minutes, current_day_start, status, location=None, annotation=None):
-        # Convert absolute time to time within the current day
-        time_in_day = (current_time_minutes - current_day_start) % 1440
-        hours = time_in_day // 60
-        minutes = time_in_day % 60
-        time_str = f"{hours:02d}:{minutes:02d}"
-        
-        # Avoid duplicate consecutive status entries
-        if not graph_points or graph_points[-1]['status'] != status:
-            point = {
-                'time': time_str,
-                'status': status
-            }
-            
-            # Add location if provided
-            if location:
-                point['location'] = location
-                
-            # Add annotation if provided  
-            if annotation:
-                point['annotation'] = annotation
-                
-            graph_points.append(point)
-    
-    def _create_log_sheet(self, trip, day_number, graph_points, daily_driving_minutes, daily_on_duty_minutes):
-        driving_hours = round(daily_driving_minutes / 60, 1)
-        on_duty_hours = round(daily_on_duty_minutes / 60, 1)
-        rest_hours = round(24 - on_duty_hours, 1)
-        
-        LogSheet.objects.create(
-            trip=trip,
-            day_number=day_number,
-            graph_points=graph_points.copy(),
-            summary={
-                'driving_hours': driving_hours,
-                'on_duty_hours': on_duty_hours,
-                'rest_hours': rest_hours
-            }
-        )
+            for log_day in log_days
+        ]
+        trip.log_strings = table.strings
+        return log_sheets
@@ -0,0 +1,44 @@
+"""Radius queries over trip pickups.
+
+Every trip stores the geohash of its pickup in ``Trip.pickup_geohash``, a plain
+indexed text column. A query covers the circle's bounding box with at most
+``MAX_COVER_CELLS`` geohash cells, merges neighbouring cells into index ranges,
+reads only the trips in those ranges and keeps the ones within the exact
+great-circle radius. It works the same on SQLite and PostgreSQL without a
+spatial extension.
+"""
+from typing import Optional
+
+from django.db.models import Q
+
+from .engine import PlanningEngine
+from .geohash import covering_ranges
+from .models import Trip
+
+NEARBY_COLUMNS = (
+    'id', 'created_at', 'pickup_location', 'dropoff_location', 'total_distance_km', 'estimated_days',
+)
+
+
+def nearby_trips(lat: float, lng: float, radius_km: float, limit: Optional[int] = None):
+    """Trips whose pickup is within ``radius_km`` of the point, nearest first.
+
+    Returns ``(match_count, [(values row, distance_km), ...])`` with at most ``limit`` rows.
+    """
+    condition = Q()
+    for start, end in covering_ranges(lat, lng, radius_km):
+        cell = Q(pickup_geohash__gte=start)
+        if end is not None:
+            cell &= Q(pickup_geohash__lt=end)
+        condition |= cell
+
+    engine = PlanningEngine()
+    origin = {'lat': lat, 'lng': lng}
+    matches = []
+    for row in Trip.objects.filter(condition).values(*NEARBY_COLUMNS):
+        distance_km = engine.distance(origin, row['pickup_location'])
+        if distance_km <= radius_km:
+            matches.append((row, distance_km))
+
+    matches.sort(key=lambda match: match[1])
+    return len(matches), matches[:limit] if limit is not None else matches
@@ -1,3 +1,1516 @@
-from django.test import TestCase
+import csv
+import heapq
+import json
+import pstats
+import random
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from itertools import permutations
+from pathlib import Path
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.http import StreamingHttpResponse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from .engine import PlannedSegment, PlanningEngine
+from .exports import export_chunks, export_rows, parquet_available
+from . import hos
+from .geohash import covering_ranges, encode_geohash
+from .instrumentation import metrics, stage
+from .jobs import claim_job, requeue_stale_jobs, run_job, submit_job
+from .lane_cache import LaneCache, get_lane_cache
+from .log_encoding import StringTable, decode_graph_points, encode_graph_points, log_sheet_points
+from .models import Trip, RouteSegment, LogSheet, PlanningJob
+from .optimizer import distance_matrix, optimize_stop_order, order_is_feasible, precedence_pairs
+from .payloads import trip_logs_payload
+from .renderers import ORJSONRenderer
+from .response_cache import rendered_response
+from .road_graph import RoadGraph, build_road_graph, haversine_km
+from .routing import RoadGraphRouter, Route, Router
+from .routing_http import CircuitBreaker, OsrmRouter
+from .serializers import TripDetailSerializer, TripLogsSerializer, TripSerializer
+from .services import TripPlanningService
+
+# Rendered responses go to the in-memory default cache, not the file cache under var/response_cache
+LOCAL_RESPONSE_CACHE = override_settings(TRIP_PLANNER_RESPONSE_CACHE={'CACHE_ALIAS': 'default'})
+
+
+def setUpModule():
+    LOCAL_RESPONSE_CACHE.enable()
+
+
+def tearDownModule():
+    LOCAL_RESPONSE_CACHE.disable()
+
+
+TRIP_DATA = {
+    "current_location": {"lat": 40.7128, "lng": -74.0060},
+    "pickup_location": {"lat": 41.8781, "lng": -87.6298},
+    "dropoff_location": {"lat": 34.0522, "lng": -118.2437},
+    "current_cycle_used_hours": 20
+}
+
+
+class PlanningEngineTests(TestCase):
+    def test_plan_runs_without_database(self):
+        with self.assertNumQueries(0):
+            plan = PlanningEngine().plan(**TRIP_DATA)
+
+        self.assertEqual(plan.segments[0].type, 'drive')
+        self.assertEqual([s.type for s in plan.segments if s.type in ('pickup', 'dropoff')], ['pickup', 'dropoff'])
+        self.assertAlmostEqual(plan.total_distance_km, sum(s.distance_km or 0 for s in plan.segments))
+        self.assertEqual([day.day_number for day in plan.log_days], list(range(1, len(plan.log_days) + 1)))
+
+    def test_plan_many_matches_individual_plans(self):
+        engine = PlanningEngine()
+        trips = [
+            TRIP_DATA,
+            dict(TRIP_DATA, dropoff_location={"lat": 41.88, "lng": -87.63}),
+            dict(TRIP_DATA, pickup_location=TRIP_DATA['current_location']),
+        ]
+
+        for trip_data, plan in zip(trips, engine.plan_many(trips)):
+            expected = engine.plan(**trip_data)
+            self.assertEqual(
+                [(s.type, s.duration_minutes) for s in plan.segments],
+                [(s.type, s.duration_minutes) for s in expected.segments],
+            )
+            for segment, expected_segment in zip(plan.segments, expected.segments):
+                self.assertAlmostEqual(segment.distance_km or 0, expected_segment.distance_km or 0, places=6)
+                self.assertAlmostEqual(segment.end_location['lat'], expected_segment.end_location['lat'], places=9)
+            self.assertEqual(len(plan.log_days), len(expected.log_days))
+
+    def test_persisted_plan_matches_engine_result(self):
+        plan = PlanningEngine().plan(**TRIP_DATA)
+        trip = TripPlanningService().plan_trip(dict(TRIP_DATA))
+
+        self.assertEqual(trip.total_distance_km, plan.total_distance_km)
+        self.assertEqual(trip.estimated_days, plan.estimated_days)
+        self.assertEqual(
+            [(s.type, s.duration_minutes) for s in trip.segments.all()],
+            [(s.type, s.duration_minutes) for s in plan.segments],
+        )
+        self.assertEqual(
+            [(log.day_number, log.get_graph_points(), log.summary) for log in trip.logs.all()],
+            [(day.day_number, list(day.graph_points), day.summary) for day in plan.log_days],
+        )
+
+    def test_regenerate_log_sheets_uses_stored_segments(self):
+        trip = TripPlanningService().plan_trip(dict(TRIP_DATA))
+        expected = list(trip.logs.values_list('day_number', 'graph_points', 'points', 'summary'))
+        trip.logs.all().delete()
+
+        TripPlanningService().regenerate_log_sheets(trip)
+
+        self.assertEqual(list(trip.logs.values_list('day_number', 'graph_points', 'points', 'summary')), expected)
+
+
+def reference_log_days(engine, segments):
+    """The log day loop the HosClock replaced, kept to check it still produces the same days"""
+    log_days = []
+    current_time = day_start = 0
+    day_number = 1
+    driving = on_duty = continuous = 0
+    graph_points = [{'time': '00:00', 'status': 'off-duty'}]
+
+    for segment in segments:
+        duration = segment.duration_minutes or 0
+        if segment.type == 'drive' and continuous >= 480 and duration > 0:
+            engine._add_graph_point(graph_points, current_time, day_start, 'break')
+            current_time += 30
+            continuous = 0
+
+        if ((segment.type == 'drive' and driving + duration > 660)
+                or (segment.type in ['drive', 'pickup', 'dropoff', 'refuel'] and on_duty + duration > 840)
+                or current_time - day_start + duration > 1440):
+            engine._add_graph_point(graph_points, current_time, day_start, 'off-duty')
+            log_days.append(engine._log_day(day_number, graph_points, driving, on_duty))
+            day_number += 1
+            current_time += 600
+            day_start = current_time
+            driving = on_duty = continuous = 0
+            graph_points = [{'time': '00:00', 'status': 'off-duty'}]
+
+        location = engine.format_location(segment.start_location)
+        if segment.type == 'rest':
+            engine._add_graph_point(graph_points, current_time, day_start, 'rest', location, "REST")
+            continuous = 0
+        elif segment.type == 'drive':
+            end_location = engine.format_location(segment.end_location)
+            engine._add_graph_point(graph_points, current_time, day_start, 'driving', location,
+                                    f"DRIVING {location} TO {end_location}")
+            driving += duration
+            on_duty += duration
+            continuous += duration
+        elif segment.type in ['pickup', 'dropoff', 'refuel']:
+            engine._add_graph_point(graph_points, current_time, day_start, 'on-duty', location, segment.type.upper())
+            on_duty += duration
+            continuous = 0
+        elif segment.type == 'break':
+            engine._add_graph_point(graph_points, current_time, day_start, 'break', location, "BREAK")
+            continuous = 0
+        current_time += duration
+
+    engine._add_graph_point(graph_points, current_time, day_start, 'off-duty')
+    log_days.append(engine._log_day(day_number, graph_points, driving, on_duty))
+    return tuple(log_days)
+
+
+class HosClockTests(TestCase):
+    def random_segments(self, rng):
+        """Segments of a random multi-stop trip through the US, drives of up to 16 hours included"""
+        def location():
+            return {'lat': rng.uniform(26, 48), 'lng': rng.uniform(-123, -70)}
+
+        stops = [{'type': rng.choice(['pickup', 'dropoff']), 'location': location()} for _ in range(rng.randint(1, 8))]
+        return list(PlanningEngine().stop_segments(location(), stops))
+
+    def cycle_minutes(self, segments):
+        return sum(segment.duration_minutes for segment in segments if segment.type in hos.ON_DUTY_TYPES)
+
+    def test_matches_previous_log_days_while_cycle_lasts(self):
+        engine = PlanningEngine()
+        rng = random.Random(7)
+        checked = 0
+        while checked < 300:
+            segments = self.random_segments(rng)
+            spare_hours = (hos.MAX_CYCLE_MINUTES - self.cycle_minutes(segments)) // 60
+            if spare_hours < 0:
+                continue
+            hours = rng.randint(0, spare_hours)
+            self.assertEqual(engine.log_days(segments, hours), reference_log_days(engine, segments))
+            checked += 1
+
+    def test_34_hour_restart_when_cycle_runs_out(self):
+        engine = PlanningEngine()
+        segments = engine.plan(**TRIP_DATA).segments
+        cycle_hours = 70 - self.cycle_minutes(segments) // 60 + 5
+        timeline = []
+        days = engine.log_days(segments, cycle_hours, timeline=timeline)
+
+        # Day 1 is empty too: the first 16-hour drive cannot start within the daily limits
+        off_duty_days = [day for day in days if day.graph_points == ({'time': '00:00', 'status': 'off-duty'},)]
+        self.assertEqual(len(off_duty_days), 2)
+        self.assertEqual(off_duty_days[0].day_number, 1)
+        restart_day = off_duty_days[1]
+        self.assertEqual(len(days), len(reference_log_days(engine, segments)) + 1)
+        # The cycle resets once and never goes past 70 hours
+        cycles = [state.cycle + (segment.duration_minutes if segment.type in hos.ON_DUTY_TYPES else 0)
+                  for state, segment in zip(timeline, segments)]
+        self.assertTrue(all(cycle <= hos.MAX_CYCLE_MINUTES for cycle in cycles))
+        self.assertEqual(sum(1 for a, b in zip(timeline, timeline[1:]) if b.cycle < a.cycle), 1)
+        restart_at = next(b for a, b in zip(timeline, timeline[1:]) if b.cycle < a.cycle)
+        self.assertEqual(restart_at.day_number, restart_day.day_number + 1)
+        self.assertEqual(restart_at.minute - timeline[timeline.index(restart_at) - 1].minute,
+                         segments[timeline.index(restart_at) - 1].duration_minutes + hos.RESTART_MINUTES)
+
+    def test_snapshot_restores_the_same_state(self):
+        clock = hos.HosClock(cycle_used_hours=12.5)
+        for segment_type, minutes in (('drive', 300), ('pickup', 60), ('drive', 200), ('break', 30)):
+            clock.record(segment_type, minutes)
+        self.assertFalse(clock.needs_break('drive', 10))
+        clock.record('drive', 480)
+        self.assertTrue(clock.needs_break('drive', 10))
+        state = clock.snapshot()
+
+        branch = hos.HosClock.restore(state)
+        branch.rest()
+        self.assertEqual(clock.snapshot(), state)
+        self.assertEqual((branch.day_number, branch.driving, branch.cycle), (2, 0, state.cycle))
+        self.assertEqual(state.cycle, 750 + 60 + 980)
+        self.assertFalse(hasattr(clock, '__dict__'))
+
+    def test_resumed_days_match_full_plan(self):
+        engine = PlanningEngine()
+        segments = engine.plan(**TRIP_DATA).segments
+        timeline = []
+        days = engine.log_days(segments, 20, timeline=timeline)
+        for index, state in enumerate(timeline):
+            resumed = engine.log_days(segments[index:], resume=state)
+            self.assertEqual(resumed[1:], days[state.day_number:])
+
+
+class BatchTripPlanTests(TestCase):
+    def test_batch_matches_single_plans(self):
+        single = TripPlanningService().plan_trip(dict(TRIP_DATA))
+        batched = TripPlanningService().plan_trips([dict(TRIP_DATA)])[0]
+
+        self.assertEqual(batched.total_distance_km, single.total_distance_km)
+        self.assertEqual(batched.estimated_days, single.estimated_days)
+        self.assertEqual(
+            list(batched.segments.values('type', 'duration_minutes', 'distance_km', 'sequence_order')),
+            list(single.segments.values('type', 'duration_minutes', 'distance_km', 'sequence_order')),
+        )
+        self.assertEqual(
+            list(batched.logs.values('day_number', 'graph_points', 'points', 'summary')),
+            list(single.logs.values('day_number', 'graph_points', 'points', 'summary')),
+        )
+
+    def test_plan_trip_writes_in_one_transaction(self):
+        with mock.patch.object(LogSheet.objects, 'bulk_create', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                TripPlanningService().plan_trip(dict(TRIP_DATA))
+
+        self.assertFalse(Trip.objects.exists())
+        self.assertFalse(RouteSegment.objects.exists())
+
+    def test_batch_endpoint_reports_each_item_in_order(self):
+        invalid = dict(TRIP_DATA, pickup_location={"lat": 41.8781})
+        response = self.client.post(
+            reverse('create_trip_plans_batch'),
+            [TRIP_DATA, invalid, TRIP_DATA],
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual([r['index'] for r in results], [0, 1, 2])
+        self.assertEqual([r['status'] for r in results], [201, 400, 201])
+        self.assertIn('pickup_location', results[1]['errors'])
+        self.assertTrue(results[0]['trip']['route'])
+        self.assertEqual(Trip.objects.count(), 2)
+        self.assertEqual(
+            RouteSegment.objects.filter(trip_id=results[2]['trip']['trip_id']).count(),
+            len(results[2]['trip']['route']),
+        )
+        self.assertTrue(LogSheet.objects.filter(trip_id=results[2]['trip']['trip_id']).exists())
+
+    def test_batch_endpoint_rejects_non_list(self):
+        response = self.client.post(reverse('create_trip_plans_batch'), TRIP_DATA, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class QuoteTripPlanTests(TestCase):
+    def test_quote_matches_created_plan_without_writing(self):
+        quote = self.client.post(reverse('quote_trip_plan'), TRIP_DATA, content_type='application/json')
+        self.assertEqual(quote.status_code, 200)
+        self.assertFalse(Trip.objects.exists())
+
+        created = self.client.post(reverse('trip_plans'), TRIP_DATA, content_type='application/json').json()
+        quoted = quote.json()
+        self.assertIsNone(quoted['trip_id'])
+        for key in ('total_distance_km', 'estimated_days', 'route'):
+            self.assertEqual(quoted[key], created[key])
+        self.assertEqual(
+            quoted['logs'],
+            self.client.get(reverse('get_trip_logs', args=[created['trip_id']])).json()['logs'],
+        )
+
+    def test_persist_false_on_create_returns_quote(self):
+        response = self.client.post(
+            reverse('trip_plans') + '?persist=false', TRIP_DATA, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNone(response.json()['trip_id'])
+        self.assertFalse(Trip.objects.exists())
+
+
+class MultiStopTripPlanTests(TestCase):
+    # Shipment A goes east from Chicago, shipment B is picked up west of it and dropped off in Chicago
+    STOPS = [
+        {"type": "dropoff", "location": {"lat": 40.4406, "lng": -79.9959}, "shipment": "A"},
+        {"type": "pickup", "location": {"lat": 41.8781, "lng": -87.6298}, "shipment": "A"},
+        {"type": "dropoff", "location": {"lat": 41.8800, "lng": -87.6300}, "shipment": "B"},
+        {"type": "pickup", "location": {"lat": 41.5868, "lng": -93.6250}, "shipment": "B"},
+        {"type": "dropoff", "location": {"lat": 39.9612, "lng": -82.9988}},
+    ]
+
+    def trip_data(self, **overrides):
+        return {
+            "current_location": {"lat": 41.2565, "lng": -95.9345},
+            "stops": self.STOPS,
+            "current_cycle_used_hours": 10,
+            **overrides,
+        }
+
+    def test_two_stop_plan_matches_single_lane_plan(self):
+        engine = PlanningEngine()
+        stops = [
+            {'type': 'pickup', 'location': TRIP_DATA['pickup_location']},
+            {'type': 'dropoff', 'location': TRIP_DATA['dropoff_location']},
+        ]
+        self.assertEqual(engine.plan_stops(TRIP_DATA['current_location'], stops, 20), engine.plan(**TRIP_DATA))
+
+    def test_optimizer_finds_best_feasible_order(self):
+        origin = self.trip_data()['current_location']
+        pairs = precedence_pairs(self.STOPS)
+        result = optimize_stop_order(origin, self.STOPS)
+        self.assertTrue(order_is_feasible(result.order, pairs))
+
+        distances = distance_matrix([origin] + [stop['location'] for stop in self.STOPS])
+
+        def path_distance(order):
+            path = [0] + [index + 1 for index in order]
+            return sum(distances[a][b] for a, b in zip(path, path[1:]))
+
+        best = min(path_distance(order) for order in permutations(range(5)) if order_is_feasible(order, pairs))
+        self.assertAlmostEqual(result.distance_km, best)
+        self.assertLessEqual(result.distance_km, result.initial_distance_km)
+
+    def test_time_budget_bounds_the_search(self):
+        result = optimize_stop_order(self.trip_data()['current_location'], self.STOPS, time_budget=0)
+        self.assertFalse(result.converged)
+        self.assertEqual(result.moves, 0)
+        self.assertEqual(result.distance_km, result.initial_distance_km)
+
+    def test_create_stores_optimized_stop_order(self):
+        response = self.client.post(
+            reverse('create_multi_stop_trip_plan'), self.trip_data(), content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        stops = [(stop['type'], stop.get('shipment')) for stop in data['stops']]
+        self.assertLess(stops.index(('pickup', 'A')), stops.index(('dropoff', 'A')))
+        self.assertLess(stops.index(('pickup', 'B')), stops.index(('dropoff', 'B')))
+        self.assertAlmostEqual(data['optimization']['distance_km'], data['total_distance_km'])
+
+        trip = Trip.objects.get(id=data['trip_id'])
+        self.assertEqual(trip.stops, data['stops'])
+        self.assertEqual(
+            [segment for segment in trip.segments.values_list('type', flat=True) if segment in ('pickup', 'dropoff')],
+            [stop_type for stop_type, _ in stops],
+        )
+        detail = self.client.get(reverse('get_trip_plan', args=[trip.id])).json()
+        self.assertEqual(detail['stops'], data['stops'])
+
+    def test_optimize_false_keeps_given_order(self):
+        stops = [self.STOPS[1], self.STOPS[0], self.STOPS[4]]
+        response = self.client.post(
+            reverse('create_multi_stop_trip_plan') + '?persist=false',
+            self.trip_data(stops=stops, optimize=False), content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['stops'], stops)
+        self.assertIsNone(response.json()['optimization'])
+        self.assertFalse(Trip.objects.exists())
+
+    def test_invalid_stops_are_rejected(self):
+        url = reverse('create_multi_stop_trip_plan')
+        for stops, optimize in (
+            ([self.STOPS[0]], True),                  # dropoff without its pickup
+            (self.STOPS[:2], False),                  # dropoff before its pickup
+            ([self.STOPS[1], self.STOPS[1]], True),   # two pickups for one shipment
+            ([self.STOPS[4]] * 51, True),             # more than MAX_STOPS
+            ([], True),
+        ):
+            response = self.client.post(
+                url, self.trip_data(stops=stops, optimize=optimize), content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 400, stops)
+            self.assertIn('stops', response.json())
+
+
+class TripProgressTests(TestCase):
+    STOPS = [
+        {'type': 'pickup', 'location': {'lat': 41.8781, 'lng': -87.6298}},
+        {'type': 'dropoff', 'location': {'lat': 39.7392, 'lng': -104.9903}},
+        {'type': 'pickup', 'location': {'lat': 35.0844, 'lng': -106.6504}},
+        {'type': 'dropoff', 'location': {'lat': 34.0522, 'lng': -118.2437}},
+    ]
+
+    def setUp(self):
+        self.service = TripPlanningService()
+        fields, plan, _ = self.service.plan_multi_stop({
+            'current_location': TRIP_DATA['current_location'], 'stops': self.STOPS,
+            'current_cycle_used_hours': 20, 'optimize': False,
+        })
+        self.trip = self.service.save_plans([(fields, plan)])[0]
+        self.segments = list(plan.segments)
+        self.timeline = []
+        PlanningEngine().log_days(self.segments, 20, timeline=self.timeline)
+
+    def patch(self, trip_id, data):
+        return self.client.patch(reverse('update_trip_progress', args=[trip_id]), data,
+                                 content_type='application/json')
+
+    def stored_segments(self):
+        return [PlannedSegment(*row) for row in RouteSegment.objects.filter(trip=self.trip).values_list(
+            'type', 'start_location', 'end_location', 'duration_minutes', 'distance_km')]
+
+    def test_late_update_rewrites_only_the_remaining_trip(self):
+        # Halfway through a drive that is not the first segment of its day
+        index = next(i for i in range(len(self.segments) - 1, 0, -1)
+                     if self.segments[i].type == 'drive'
+                     and self.timeline[i].day_number == self.timeline[i - 1].day_number)
+        day, start = self.timeline[index].day_number, self.timeline[index].minute
+        elapsed = start + self.segments[index].duration_minutes // 2
+        position = {'lat': self.segments[index].start_location['lat'] + 0.3,
+                    'lng': self.segments[index].start_location['lng']}
+        old_segment_ids = list(RouteSegment.objects.filter(trip=self.trip).values_list('id', flat=True))
+        old_days = {log.day_number: (log.id, bytes(log.points)) for log in LogSheet.objects.filter(trip=self.trip)}
+        self.client.get(reverse('get_trip_plan', args=[self.trip.id]))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.patch(self.trip.id, {'current_location': position, 'elapsed_minutes': elapsed})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data['replanned_from_segment'], data['replanned_from_day']), (index, day))
+        self.assertEqual(data['route'][0]['end_location'], position)
+
+        segments = self.stored_segments()
+        self.assertEqual(segments[:index], self.segments[:index])
+        self.assertEqual(list(RouteSegment.objects.filter(trip=self.trip).values_list('id', flat=True))[:index],
+                         old_segment_ids[:index])
+        self.assertEqual(segments[-1].end_location, self.STOPS[-1]['location'])
+
+        for log in LogSheet.objects.filter(trip=self.trip, day_number__lt=day):
+            self.assertEqual((log.id, bytes(log.points)), old_days[log.day_number])
+        expected_logs = PlanningEngine().log_days(segments, 20)
+        logs = self.client.get(reverse('get_trip_logs', args=[self.trip.id])).json()['logs']
+        self.assertEqual([log['graph_points'] for log in logs], [list(d.graph_points) for d in expected_logs])
+
+        detail = self.client.get(reverse('get_trip_plan', args=[self.trip.id])).json()
+        self.assertEqual(len(detail['route']), len(segments))
+        self.assertAlmostEqual(detail['total_distance_km'], PlanningEngine().total_distance(segments))
+
+    def test_reported_cycle_hours_apply_from_now(self):
+        # A drive on a later day with more than 5 on-duty hours after it
+        index = next(i for i in range(len(self.segments) - 1, 0, -1)
+                     if self.segments[i].type == 'drive' and self.timeline[i].day_number > 1
+                     and sum(s.duration_minutes for s in self.segments[i + 1:] if s.type != 'rest') > 5 * 60)
+        elapsed = self.timeline[index].minute + self.segments[index].duration_minutes // 2
+        replan = self.service.update_progress(self.trip.id, self.segments[index].end_location, elapsed,
+                                              current_cycle_used_hours=65)
+
+        segments = self.stored_segments()
+        self.assertEqual(segments[:index], self.segments[:index])
+        logs = LogSheet.objects.filter(trip=self.trip).order_by('day_number')
+        self.assertEqual(list(logs.values_list('day_number', flat=True)), list(range(1, logs.count() + 1)))
+        self.assertAlmostEqual(sum(log.summary['driving_hours'] for log in logs),
+                               sum(s.duration_minutes for s in segments if s.type == 'drive') / 60,
+                               delta=0.05 * len(logs))  # daily totals are rounded
+        # 65 hours at the report leave no room for the rest of the trip without a 34-hour restart
+        self.assertTrue(any(day.summary['driving_hours'] == 0 for day in replan.log_days))
+        self.assertEqual(Trip.objects.get(id=self.trip.id).current_cycle_used_hours, 20)
+
+    def test_update_at_start_matches_new_plan(self):
+        position = {'lat': 40.0, 'lng': -80.0}
+        replan = self.service.update_progress(self.trip.id, position, 0, current_cycle_used_hours=30)
+        expected = PlanningEngine().plan_stops(position, self.STOPS, 30)
+        self.assertEqual(self.stored_segments(), list(expected.segments))
+        self.assertEqual((replan.kept_segments, replan.first_day), (0, 1))
+        self.assertEqual(replan.log_days, expected.log_days)
+        self.assertEqual(Trip.objects.get(id=self.trip.id).current_cycle_used_hours, 30)
+
+    def test_finished_unknown_and_invalid_updates(self):
+        end = self.timeline[-1].minute + self.segments[-1].duration_minutes
+        position = self.STOPS[-1]['location']
+        self.assertEqual(self.patch(self.trip.id, {'current_location': position, 'elapsed_minutes': end}).status_code,
+                         409)
+        self.assertEqual(self.patch(uuid.uuid4(), {'current_location': position, 'elapsed_minutes': 0}).status_code,
+                         404)
+        response = self.patch(self.trip.id, {'current_location': {'lat': 1}, 'elapsed_minutes': -1})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()), {'current_location', 'elapsed_minutes'})
+
+
+class TripScenarioTests(TestCase):
+    GRID = {'departure_hour': [0, 6, 18.5], 'current_cycle_used_hours': [0, 10, 40, 70], 'sleeper_split': [False, True]}
+
+    def post(self, grid):
+        return self.client.post(reverse('compare_trip_scenarios'), {**TRIP_DATA, 'grid': grid},
+                                content_type='application/json')
+
+    def test_scenarios_are_ranked_and_nothing_is_stored(self):
+        with self.assertNumQueries(0):
+            response = self.post(self.GRID)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['scenarios']), 24)
+        self.assertFalse(Trip.objects.exists())
+
+        ranked = [(len(s['violations']), s['total_duration_hours'], s['days']) for s in data['scenarios']]
+        self.assertEqual(ranked, sorted(ranked))
+        self.assertEqual([s['rank'] for s in data['scenarios']], list(range(1, 25)))
+        self.assertEqual(data['segment_count'], len(PlanningEngine().plan(**TRIP_DATA).segments))
+
+    def test_each_variant_matches_its_own_clock_pass(self):
+        engine = PlanningEngine()
+        segments = engine.plan(**TRIP_DATA).segments
+        for scenario in self.post(self.GRID).json()['scenarios']:
+            departure = round(scenario['departure_hour'] * 60)
+            timeline = []
+            log_days = engine.log_days(segments, scenario['current_cycle_used_hours'], timeline=timeline,
+                                       departure_minute=departure, sleeper_split=scenario['sleeper_split'])
+            finish = timeline[-1].minute + segments[-1].duration_minutes
+            self.assertEqual(scenario['days'], len(log_days))
+            self.assertEqual(scenario['total_duration_hours'], round((finish - departure) / 60, 2))
+            self.assertEqual(scenario['finish'], {'day': finish // 1440 + 1,
+                                                  'time': f"{finish % 1440 // 60:02d}:{finish % 60:02d}"})
+            self.assertEqual([(v['day'], v['rule']) for v in scenario['violations']],
+                             hos.violations(timeline, segments))
+
+    def test_cycle_hours_and_sleeper_split_change_the_plan(self):
+        scenarios = {(s['current_cycle_used_hours'], s['sleeper_split']): s
+                     for s in self.post({'current_cycle_used_hours': [0, 70], 'sleeper_split': [False, True]})
+                     .json()['scenarios']}
+        # A full cycle needs a 34-hour restart first
+        self.assertEqual(scenarios[(70, False)]['days'], scenarios[(0, False)]['days'] + 1)
+        self.assertGreaterEqual(scenarios[(70, False)]['total_duration_hours'],
+                                scenarios[(0, False)]['total_duration_hours'] + 24)
+        self.assertLess(scenarios[(0, True)]['total_duration_hours'], scenarios[(0, False)]['total_duration_hours'])
+
+        segments = PlanningEngine().plan(**TRIP_DATA).segments
+        statuses = {point['status'] for day in PlanningEngine().log_days(segments, sleeper_split=True)
+                    for point in day.graph_points}
+        self.assertIn('sleeper', statuses)
+
+    def test_single_day_trip_takes_as_long_whatever_the_departure(self):
+        trip = {**TRIP_DATA, 'pickup_location': {'lat': 40.2206, 'lng': -74.7597},
+                'dropoff_location': {'lat': 39.9526, 'lng': -75.1652}}
+        response = self.client.post(reverse('compare_trip_scenarios'),
+                                    {**trip, 'grid': {'departure_hour': [0, 6, 12, 18, 22]}},
+                                    content_type='application/json')
+        scenarios = response.json()['scenarios']
+        self.assertEqual(len(scenarios), 5)
+        self.assertEqual({s['days'] for s in scenarios}, {1})
+        self.assertEqual(len({s['total_duration_hours'] for s in scenarios}), 1)
+        late = next(s for s in scenarios if s['departure_hour'] == 22)
+        # The arrival is on the calendar, after midnight
+        self.assertEqual(late['finish']['day'], 2)
+
+    def test_violations_report_segments_that_fit_no_duty_day(self):
+        segments = [PlannedSegment('drive', {'lat': 0, 'lng': 0}, {'lat': 0, 'lng': 10}, 16 * 60, 1100)]
+        timeline = []
+        PlanningEngine().log_days(segments, timeline=timeline)
+        self.assertEqual(hos.violations(timeline, segments),
+                         [(2, '11-hour driving'), (2, '30-minute break'), (2, '14-hour on duty')])
+
+    def test_grid_is_validated_and_capped(self):
+        response = self.post({'departure_hour': list(range(24)), 'current_cycle_used_hours': list(range(5))})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('grid', response.json())
+        response = self.post({'departure_hour': [24], 'current_cycle_used_hours': [71]})
+        self.assertEqual(response.status_code, 400)
+        with override_settings(TRIP_PLANNER_SCENARIOS={'MAX_SCENARIOS': 200}):
+            self.assertEqual(len(self.post({'departure_hour': list(range(24)),
+                                            'current_cycle_used_hours': list(range(5))}).json()['scenarios']), 120)
+
+
+class RoadGraphTests(TestCase):
+    def setUp(self):
+        # 12 x 8 grid around Chicago, 0.5 degrees apart, with some links missing and detours on the rest
+        rng = random.Random(3)
+        self.nodes = [(38 + 0.5 * row, -92 + 0.5 * column) for row in range(8) for column in range(12)]
+        self.edges = []
+        for row in range(8):
+            for column in range(12):
+                node = row * 12 + column
+                for other in ((node + 1) if column < 11 else None, (node + 12) if row < 7 else None):
+                    if other is not None and rng.random() < 0.8:
+                        self.edges.append((node, other, haversine_km(*self.nodes[node], *self.nodes[other])
+                                           * rng.uniform(1, 1.5)))
+        # An island no road reaches
+        self.nodes.append((30.0, -80.0))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / 'test.graph'
+        self.stats = build_road_graph(path, self.nodes, self.edges)
+        self.graph = RoadGraph(path)
+        self.addCleanup(self.graph.close)
+
+    def node(self, original):
+        lat, lng = self.nodes[original]
+        return self.graph.nearest_node(lat, lng, 1)[0]
+
+    def dijkstra(self, source):
+        adjacency = [[] for _ in self.nodes]
+        for u, v, km in self.edges:
+            adjacency[u].append((v, km))
+            adjacency[v].append((u, km))
+        distances, queue = {source: 0.0}, [(0.0, source)]
+        while queue:
+            km, node = heapq.heappop(queue)
+            if km <= distances[node]:
+                for neighbour, edge_km in adjacency[node]:
+                    if km + edge_km < distances.get(neighbour, float('inf')):
+                        distances[neighbour] = km + edge_km
+                        heapq.heappush(queue, (km + edge_km, neighbour))
+        return distances
+
+    def test_shortest_paths_match_dijkstra(self):
+        for source in (0, 17, 50, 95):
+            expected = self.dijkstra(source)
+            for target in range(0, 96, 7):
+                found = self.graph.shortest_path(self.node(source), self.node(target))
+                if target not in expected:
+                    self.assertIsNone(found)
+                    continue
+                km, nodes, cumulative = found
+                self.assertAlmostEqual(km, expected[target], delta=0.01)
+                self.assertAlmostEqual(cumulative[-1], km, delta=0.01)
+                self.assertEqual((nodes[0], nodes[-1]), (self.node(source), self.node(target)))
+
+    def test_unreachable_and_unsnappable_locations(self):
+        self.assertIsNone(self.graph.shortest_path(self.node(0), self.node(96)))
+        self.assertIsNone(self.graph.nearest_node(45.0, -60.0, 25))
+        node, km = self.graph.nearest_node(38.01, -91.99, 25)
+        self.assertEqual(node, self.node(0))
+        self.assertLess(km, 2)
+
+    def test_build_command_reads_csv(self):
+        directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, directory)
+        (directory / 'nodes.csv').write_text('id,lat,lng\na,41.0,-87.0\nb,41.0,-86.0\nc,42.0,-86.0\n')
+        (directory / 'edges.csv').write_text('from,to,distance_km\na,b,90\nb,c,\n')
+        call_command('build_road_graph', str(directory / 'nodes.csv'), str(directory / 'edges.csv'),
+                     str(directory / 'out.graph'), stdout=StringIO())
+
+        graph = RoadGraph(directory / 'out.graph')
+        self.addCleanup(graph.close)
+        source, target = (graph.nearest_node(41.0, -87.0, 1)[0], graph.nearest_node(42.0, -86.0, 1)[0])
+        self.assertAlmostEqual(graph.shortest_path(source, target)[0], 90 + haversine_km(41, -86, 42, -86), places=3)
+
+    def test_engine_follows_road_routes(self):
+        router = RoadGraphRouter(self.graph, snap_radius_km=25)
+        engine = PlanningEngine(router=router)
+        start, end = {'lat': 38.01, 'lng': -91.99}, {'lat': 41.49, 'lng': -86.51}
+        route = router.route(start, end)
+        segments = engine.route_segments(start, start, end)
+
+        self.assertAlmostEqual(engine.total_distance(segments), route.distance_km)
+        self.assertGreater(route.distance_km, engine.distance(start, end))
+        drives = [segment for segment in segments if segment.type == 'drive']
+        self.assertEqual(drives[0].start_location, route.point_at(0))
+        self.assertAlmostEqual(drives[-1].end_location['lat'], end['lat'], places=4)
+
+        # Legs the graph cannot reach fall back to great-circle lines
+        island = {'lat': 45.0, 'lng': -60.0}
+        fallback = engine.route_segments(start, start, island)
+        self.assertEqual(fallback, PlanningEngine().route_segments(start, start, island))
+
+
+class OsrmStubHandler(BaseHTTPRequestHandler):
+    """Answers OSRM route and table requests with great-circle distances stretched by ROAD_FACTOR"""
+
+    ROAD_FACTOR = 1.2
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.path)
+        if server.delay:
+            time.sleep(server.delay)
+        if server.fail:
+            return self.reply(500, {'code': 'InternalError', 'message': 'down'})
+        if server.body is not None:
+            return self.reply(200, server.body)
+
+        url = urlsplit(self.path)
+        service = url.path.split('/')[1]
+        points = [tuple(map(float, pair.split(','))) for pair in url.path.rsplit('/', 1)[1].split(';')]
+        points = [(lat, lng) for lng, lat in points]
+        if service == 'route':
+            middle = ((points[0][0] + points[1][0]) / 2 + 0.1, (points[0][1] + points[1][1]) / 2)
+            geometry = [points[0], middle, points[1]]
+            return self.reply(200, {'code': 'Ok', 'routes': [{
+                'distance': self.road_meters(points[0], points[1]),
+                'geometry': {'type': 'LineString', 'coordinates': [[lng, lat] for lat, lng in geometry]},
+            }]})
+
+        query = parse_qs(url.query)
+        sources = [int(k) for k in query['sources'][0].split(';')] if 'sources' in query else range(len(points))
+        destinations = ([int(k) for k in query['destinations'][0].split(';')]
+                        if 'destinations' in query else range(len(points)))
+        distances = [[self.road_meters(points[i], points[j]) for j in destinations] for i in sources]
+        self.reply(200, {'code': 'Ok', 'distances': distances})
+
+    def road_meters(self, a, b):
+        return haversine_km(*a, *b) * self.ROAD_FACTOR * 1000
+
+    def reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client timed out
+    def log_message(self, *args):
+        pass
+
+
+class OsrmRouterTests(TestCase):
+    LOCATIONS = [
+        {'lat': 41.8781, 'lng': -87.6298}, {'lat': 40.4406, 'lng': -79.9959}, {'lat': 39.9612, 'lng': -82.9988},
+        {'lat': 41.5868, 'lng': -93.6250}, {'lat': 41.2565, 'lng': -95.9345}, {'lat': 38.6270, 'lng': -90.1994},
+    ]
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), OsrmStubHandler)
+        self.server.requests, self.server.fail, self.server.delay, self.server.body = [], False, 0, None
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def router(self, **options):
+        router = OsrmRouter(f'http://127.0.0.1:{self.server.server_port}', **options)
+        self.addCleanup(router.session.close)
+        return router
+
+    def test_route_follows_osrm_distance_and_is_cached(self):
+        router = self.router()
+        start, end = self.LOCATIONS[0], self.LOCATIONS[1]
+        route = router.route(start, end)
+        expected = haversine_km(start['lat'], start['lng'], end['lat'], end['lng']) * OsrmStubHandler.ROAD_FACTOR
+        self.assertAlmostEqual(route.distance_km, expected, places=3)
+        self.assertEqual(route.point_at(0), start)
+        self.assertAlmostEqual(route.point_at(route.distance_km)['lng'], end['lng'])
+
+        # Nearby coordinates round to the same cache key
+        again = router.route({'lat': start['lat'] + 1e-7, 'lng': start['lng']}, end)
+        self.assertEqual(again.distance_km, route.distance_km)
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(router.stats()['cache_hits'], 1)
+
+    def test_matrix_is_fetched_in_batches(self):
+        router = self.router(matrix_batch_size=4)
+        matrix = router.matrix(self.LOCATIONS)
+        self.assertEqual(len(self.server.requests), 9)  # 3 x 3 blocks of two coordinates
+        for i, a in enumerate(self.LOCATIONS):
+            for j, b in enumerate(self.LOCATIONS):
+                expected = 0 if i == j else haversine_km(a['lat'], a['lng'], b['lat'], b['lng']) * 1.2
+                self.assertAlmostEqual(matrix[i][j], expected, places=3)
+
+        self.assertEqual(router.matrix(self.LOCATIONS[1:4]), [row[1:4] for row in matrix[1:4]])
+        self.assertEqual(len(self.server.requests), 9)
+
+    def test_circuit_opens_and_falls_back_to_great_circle(self):
+        clock = mock.Mock(return_value=0.0)
+        router = self.router(failure_threshold=2, reset_timeout=30)
+        router.breaker.clock = clock
+        self.server.fail = True
+        start, end = self.LOCATIONS[0], self.LOCATIONS[1]
+
+        with self.assertLogs('trip_planner.routing_http', 'WARNING'):
+            for _ in range(4):
+                self.assertIsNone(router.route(start, end))
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertEqual(router.stats()['circuit'], CircuitBreaker.OPEN)
+        matrix = router.matrix(self.LOCATIONS[:2])
+        self.assertAlmostEqual(matrix[0][1], haversine_km(start['lat'], start['lng'], end['lat'], end['lng']))
+
+        # After the reset timeout one trial request goes through and closes the circuit again
+        clock.return_value = 31.0
+        self.server.fail = False
+        self.assertIsNotNone(router.route(start, end))
+        self.assertEqual(router.stats()['circuit'], CircuitBreaker.CLOSED)
+        self.assertEqual(router.stats()['fallbacks'], 5)
+
+    def test_unreadable_ok_response_falls_back_and_counts_as_failure(self):
+        router = self.router(failure_threshold=3)
+        engine = PlanningEngine(router=router)
+        start, end = self.LOCATIONS[0], self.LOCATIONS[1]
+
+        self.server.body = {'code': 'Ok', 'routes': []}
+        with self.assertLogs('trip_planner.routing_http', 'WARNING'):
+            self.assertEqual(engine.route_segments(start, start, end), PlanningEngine().route_segments(start, start, end))
+        self.assertEqual(router.stats()['errors'], len(self.server.requests))
+        self.assertEqual(router.stats()['circuit'], CircuitBreaker.CLOSED)
+
+        self.server.body = {'code': 'Ok'}
+        with self.assertLogs('trip_planner.routing_http', 'WARNING'):
+            matrix = router.matrix(self.LOCATIONS[:2])
+        self.assertAlmostEqual(matrix[0][1], haversine_km(start['lat'], start['lng'], end['lat'], end['lng']))
+        self.assertEqual(router.stats()['circuit'], CircuitBreaker.OPEN)
+
+    def test_fallback_plans_stay_out_of_the_lane_cache(self):
+        clock = mock.Mock(return_value=0.0)
+        router = self.router(failure_threshold=1, reset_timeout=30)
+        router.breaker.clock = clock
+        engine = PlanningEngine(lane_cache=LaneCache(), router=router)
+        start, pickup, end = self.LOCATIONS[:3]
+        great_circle = PlanningEngine().route_segments(start, pickup, end)
+
+        self.server.fail = True
+        with self.assertLogs('trip_planner.routing_http', 'WARNING'):
+            self.assertEqual(engine.trip_segments(start, pickup, end, 10), great_circle)
+        self.assertEqual(router.stats()['circuit'], CircuitBreaker.OPEN)
+
+        # Once OSRM is back the same lane follows the roads, and only then is it cached
+        clock.return_value = 31.0
+        self.server.fail = False
+        routed = engine.trip_segments(start, pickup, end, 10)
+        self.assertAlmostEqual(engine.total_distance(routed), engine.total_distance(great_circle) * 1.2, places=3)
+        self.assertEqual(engine.trip_segments(start, pickup, end, 10), routed)
+        self.assertEqual(engine.lane_cache.stats()['hits'], 1)
+        self.assertEqual(engine.plan_many([{'current_location': start, 'pickup_location': pickup,
+                                            'dropoff_location': end, 'current_cycle_used_hours': 10}] * 2)[0].segments,
+                         routed)
+
+        # Engines without the router do not share its entries
+        self.assertEqual(PlanningEngine(lane_cache=engine.lane_cache).trip_segments(start, pickup, end, 10),
+                         great_circle)
+
+    def test_half_open_trial_failure_reopens(self):
+        clock = mock.Mock(return_value=0.0)
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=clock)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        clock.return_value = 10.0
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # one trial at a time
+        breaker.record_failure()
+        self.assertEqual(breaker.state, CircuitBreaker.OPEN)
+
+    def test_slow_server_times_out_to_great_circle_plan(self):
+        self.server.delay = 0.5
+        engine = PlanningEngine(router=self.router(timeout=0.1))
+        start, end = self.LOCATIONS[0], self.LOCATIONS[1]
+        with self.assertLogs('trip_planner.routing_http', 'WARNING'):
+            segments = engine.route_segments(start, start, end)
+        self.assertEqual(segments, PlanningEngine().route_segments(start, start, end))
+        self.assertGreaterEqual(engine.router.stats()['errors'], 1)
+
+    def test_multi_stop_plan_uses_road_matrix(self):
+        router = self.router()
+        stops = [{'type': 'pickup', 'location': location} for location in self.LOCATIONS[1:]]
+        trip_data = {'current_location': self.LOCATIONS[0], 'stops': stops, 'current_cycle_used_hours': 10}
+        fields, plan, stop_order = TripPlanningService(router=router).plan_multi_stop(trip_data)
+
+        self.assertTrue(any('/table/' in path for path in self.server.requests))
+        great_circle = optimize_stop_order(self.LOCATIONS[0], stops)
+        self.assertEqual(stop_order.order, great_circle.order)
+        self.assertAlmostEqual(stop_order.distance_km, great_circle.distance_km * 1.2, places=3)
+        self.assertAlmostEqual(plan.total_distance_km, stop_order.distance_km, places=3)
+
+
+class NearbyTripPlanTests(TestCase):
+    def setUp(self):
+        service = TripPlanningService()
+        self.chicago = service.plan_trip(TRIP_DATA)
+        # Pickup in Evanston, about 20 km north of the Chicago pickup
+        self.evanston = service.plan_trip({**TRIP_DATA, 'pickup_location': {'lat': 42.0451, 'lng': -87.6877}})
+        self.denver = service.plan_trip({**TRIP_DATA, 'pickup_location': {'lat': 39.7392, 'lng': -104.9903}})
+
+    def nearby(self, **params):
+        return self.client.get(reverse('nearby_trip_plans'), params)
+
+    def test_returns_trips_within_radius_nearest_first(self):
+        response = self.nearby(lat=41.88, lng=-87.63, radius_km=50)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([r['trip_id'] for r in data['results']], [str(self.chicago.id), str(self.evanston.id)])
+        self.assertLess(data['results'][0]['distance_km'], 1)
+
+        data = self.nearby(lat=41.88, lng=-87.63, radius_km=5).json()
+        self.assertEqual([r['trip_id'] for r in data['results']], [str(self.chicago.id)])
+
+    def test_limit_caps_results_but_not_count(self):
+        data = self.nearby(lat=41.88, lng=-87.63, radius_km=50, limit=1).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(len(data['results']), 1)
+
+    def test_invalid_query_is_rejected(self):
+        self.assertEqual(self.nearby(lat=41.88).status_code, 400)
+        self.assertEqual(self.nearby(lat=95, lng=0).status_code, 400)
+        self.assertEqual(self.nearby(lat=0, lng=0, radius_km=-1).status_code, 400)
+
+    def test_pickups_are_indexed_on_save(self):
+        self.assertEqual(self.chicago.pickup_geohash, encode_geohash(41.8781, -87.6298))
+
+    def test_cover_spans_the_antimeridian(self):
+        ranges = covering_ranges(0.0, 179.99, 20)
+        for lng in (179.9, -179.9):
+            cell = encode_geohash(0.0, lng)
+            self.assertTrue(any(start <= cell and (end is None or cell < end) for start, end in ranges))
+
+
+class LaneCacheTests(TestCase):
+    def test_repeated_lane_is_served_from_cache(self):
+        engine = PlanningEngine(lane_cache=LaneCache(max_entries=2))
+        first = engine.plan(**TRIP_DATA)
+        nearby = dict(TRIP_DATA, current_location={"lat": 40.71281, "lng": -74.00601})
+        second = engine.plan(**nearby)
+
+        self.assertIs(second.segments, first.segments)
+        self.assertEqual(engine.lane_cache.stats()['hits'], 1)
+        self.assertEqual(engine.lane_cache.stats()['misses'], 1)
+
+    def test_least_recently_used_lane_is_evicted(self):
+        lane_cache = LaneCache(max_entries=2)
+        for key in ('a', 'b', 'a', 'c'):
+            if lane_cache.get(key) is None:
+                lane_cache.set(key, key)
+
+        self.assertEqual(lane_cache.stats()['evictions'], 1)
+        self.assertEqual(lane_cache.get('a'), 'a')
+        self.assertIsNone(lane_cache.get('b'))
+
+    def test_expired_lane_is_recomputed(self):
+        lane_cache = LaneCache(timeout=-1)
+        lane_cache.set('a', 'first')
+
+        self.assertIsNone(lane_cache.get('a'))
+        self.assertEqual(lane_cache.stats()['evictions'], 1)
+
+    def test_django_backend_shares_entries_between_instances(self):
+        LaneCache(backend='django', key_prefix='test-lane').set('test-lane:a', 'shared')
+        other = LaneCache(backend='django', key_prefix='test-lane')
+
+        self.assertEqual(other.get('test-lane:a'), 'shared')
+        self.assertEqual(other.stats()['hits'], 1)
+
+    def test_stats_endpoint(self):
+        response = self.client.get(reverse('get_lane_cache_stats'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('evictions', response.json())
+
+
+class LogEncodingTests(TestCase):
+    def test_engine_points_round_trip(self):
+        table = StringTable()
+        for day in PlanningEngine().plan(**TRIP_DATA).log_days:
+            points = list(day.graph_points)
+            self.assertEqual(decode_graph_points(encode_graph_points(points, table), table.strings), points)
+
+    def test_drive_annotations_reference_interned_locations(self):
+        table = StringTable()
+        points = [
+            {'time': '00:00', 'status': 'off-duty'},
+            {'time': '06:15', 'status': 'driving', 'location': '40.71, -74.01',
+             'annotation': 'DRIVING 40.71, -74.01 TO 41.88, -87.63'},
+            {'time': '17:15', 'status': 'on-duty', 'location': '41.88, -87.63', 'annotation': 'PICKUP'},
+        ]
+        encoded = encode_graph_points(points, table)
+
+        self.assertEqual(table.strings, ['40.71, -74.01', '41.88, -87.63', 'PICKUP'])
+        self.assertEqual(decode_graph_points(encoded, table.strings), points)
+        self.assertLess(len(encoded), len(json.dumps(points)) // 10)
+
+    def test_unrepresentable_points_stay_json(self):
+        for points in (
+            [{'status': 'off-duty', 'time': '00:00'}],
+            [{'time': '00:00', 'status': 'unknown'}],
+            [{'time': '0:00', 'status': 'off-duty'}],
+            [{'time': '00:00', 'status': 'off-duty', 'note': 'extra'}],
+        ):
+            self.assertEqual(log_sheet_points(points, StringTable()), {'points': None, 'graph_points': points})
+
+    def test_stored_log_sheets_are_compact_and_render_unchanged(self):
+        plan = PlanningEngine().plan(**TRIP_DATA)
+        trip = TripPlanningService().plan_trip(dict(TRIP_DATA))
+
+        self.assertFalse(trip.logs.filter(points__isnull=True).exists())
+        self.assertFalse(trip.logs.filter(graph_points__isnull=False).exists())
+        response = self.client.get(reverse('get_trip_logs', args=[trip.id]))
+        self.assertEqual(
+            [log['graph_points'] for log in response.json()['logs']],
+            [list(day.graph_points) for day in plan.log_days],
+        )
+
+
+class RegenerateLogsCommandTests(TestCase):
+    def setUp(self):
+        self.trips = TripPlanningService().plan_trips([dict(TRIP_DATA) for _ in range(3)])
+        self.expected = list(LogSheet.objects.order_by('trip_id', 'day_number').values_list(
+            'trip_id', 'day_number', 'graph_points', 'points', 'summary'
+        ))
+        LogSheet.objects.all().delete()
+        self.checkpoint = Path(tempfile.mkdtemp()) / 'checkpoint.json'
+
+    def regenerate(self, **options):
+        call_command('regenerate_logs', workers=1, chunk_size=2, checkpoint=str(self.checkpoint),
+                     stdout=StringIO(), **options)
+
+    def test_regenerates_all_trips_and_records_checkpoint(self):
+        self.regenerate()
+
+        self.assertEqual(
+            list(LogSheet.objects.order_by('trip_id', 'day_number').values_list(
+                'trip_id', 'day_number', 'graph_points', 'points', 'summary'
+            )),
+            self.expected,
+        )
+        last_trip_id = max(trip.id for trip in self.trips)
+        self.assertEqual(json.loads(self.checkpoint.read_text())['last_trip_id'], str(last_trip_id))
+
+    def test_resume_skips_trips_before_checkpoint(self):
+        first_trip_id = min(trip.id for trip in self.trips)
+        self.checkpoint.write_text(json.dumps({'last_trip_id': str(first_trip_id)}))
+
+        self.regenerate(resume=True)
+
+        self.assertFalse(LogSheet.objects.filter(trip_id=first_trip_id).exists())
+        self.assertEqual(LogSheet.objects.values('trip_id').distinct().count(), 2)
+
+    def test_since_filters_by_creation_date(self):
+        self.regenerate(since='2999-01-01')
+        self.assertFalse(LogSheet.objects.exists())
+
+
+class QueryBudgetTests(TestCase):
+    """Read endpoints must cost a fixed number of queries however many trips or rows they return"""
+
+    def plan(self, count):
+        return TripPlanningService().plan_trips([dict(TRIP_DATA) for _ in range(count)])
+
+    def test_list_costs_three_queries_per_page(self):
+        self.plan(5)
+        with self.assertNumQueries(3):  # count, trips, segments
+            small = self.client.get(reverse('trip_plans'))
+
+        self.plan(100)
+        with self.assertNumQueries(3):
+            large = self.client.get(reverse('trip_plans'))
+
+        self.assertEqual(len(small.json()['results']), 5)
+        self.assertEqual(large.json()['count'], 105)
+        self.assertEqual(len(large.json()['results']), 100)
+        self.assertTrue(large.json()['next'])
+
+    def test_list_filters_by_ids(self):
+        trips = self.plan(3)
+        ids = ','.join(str(trip.id) for trip in trips[:2])
+
+        response = self.client.get(reverse('trip_plans'), {'ids': ids})
+
+        self.assertEqual({t['trip_id'] for t in response.json()['results']}, {str(t.id) for t in trips[:2]})
+        self.assertEqual(response.json()['results'][0]['route'], self.client.get(
+            reverse('get_trip_plan', args=[response.json()['results'][0]['trip_id']])
+        ).json()['route'])
+        self.assertEqual(self.client.get(reverse('trip_plans'), {'ids': 'nope'}).status_code, 400)
+
+    def test_detail_and_logs_query_budget(self):
+        trip = self.plan(1)[0]
+        with self.assertNumQueries(2):  # trip, segments
+            self.client.get(reverse('get_trip_plan', args=[trip.id]))
+        with self.assertNumQueries(2):  # string table, log sheets
+            self.client.get(reverse('get_trip_logs', args=[trip.id]))
+
+
+class FastPathSerializationTests(TestCase):
+    """The plain-dict payloads and orjson renderer must match the DRF serializers byte for byte"""
+
+    def setUp(self):
+        self.trip = TripPlanningService().plan_trip(dict(
+            TRIP_DATA, dropoff_location={"lat": 34.0522, "lng": -118.2437, "city": "Los Ángeles", "state": "CA"}
+        ))
+
+    def drf_bytes(self, data):
+        return JSONRenderer().render(data)
+
+    def test_detail_matches_trip_detail_serializer(self):
+        expected = self.drf_bytes(TripDetailSerializer(Trip.objects.prefetch_related('segments').get(id=self.trip.id)).data)
+        self.assertEqual(self.client.get(reverse('get_trip_plan', args=[self.trip.id])).content, expected)
+
+    def test_logs_match_trip_logs_serializer(self):
+        expected = self.drf_bytes(TripLogsSerializer(Trip.objects.prefetch_related('logs').get(id=self.trip.id)).data)
+        self.assertEqual(self.client.get(reverse('get_trip_logs', args=[self.trip.id])).content, expected)
+
+    def test_create_matches_trip_serializer(self):
+        response = self.client.post(reverse('trip_plans'), TRIP_DATA, content_type='application/json')
+        trip = Trip.objects.prefetch_related('segments').get(id=response.json()['trip_id'])
+        self.assertEqual(response.content, self.drf_bytes(TripSerializer(trip).data))
+
+    def test_list_matches_trip_detail_serializer(self):
+        trips = Trip.objects.prefetch_related('segments').order_by('-created_at', 'id')
+        expected = self.drf_bytes({
+            'count': 1, 'next': None, 'previous': None,
+            'results': TripDetailSerializer(trips, many=True).data,
+        })
+        self.assertEqual(self.client.get(reverse('trip_plans')).content, expected)
+
+    def test_missing_trip_is_404(self):
+        missing = '00000000-0000-0000-0000-000000000000'
+        self.assertEqual(self.client.get(reverse('get_trip_plan', args=[missing])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('get_trip_logs', args=[missing])).status_code, 404)
+
+    def test_renderer_falls_back_for_exponent_floats(self):
+        data = {'tiny': 0.00001, 'huge': 1e16, 'text': 'line\u2028separator'}
+        self.assertEqual(ORJSONRenderer().render(data), self.drf_bytes(data))
+
+    def test_renderer_rejects_non_finite_floats(self):
+        for value in (float('nan'), float('inf'), -float('inf')):
+            with self.assertRaises(ValueError):
+                ORJSONRenderer().render({'route': [{'distance_km': value, 'start_location': None}]})
+        data = {'distance_km': 1.5, 'start_location': None}
+        self.assertEqual(ORJSONRenderer().render(data), self.drf_bytes(data))
+
+
+class RenderedResponseCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.trip = TripPlanningService().plan_trip(dict(TRIP_DATA))
+        self.logs_url = reverse('get_trip_logs', args=[self.trip.id])
+
+    def test_repeated_polls_are_served_from_cache(self):
+        first = self.client.get(self.logs_url)
+        with self.assertNumQueries(0):
+            second = self.client.get(self.logs_url)
+
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_matching_etag_returns_304_without_body(self):
+        etag = self.client.get(reverse('get_trip_plan', args=[self.trip.id]))['ETag']
+
+        response = self.client.get(reverse('get_trip_plan', args=[self.trip.id]), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.logs_url, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+
+    def test_regeneration_invalidates_stored_responses(self):
+        stale = self.client.get(self.logs_url)
+        RouteSegment.objects.filter(trip=self.trip, type='pickup').update(duration_minutes=180)
+        self.assertEqual(self.client.get(self.logs_url).content, stale.content)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            TripPlanningService().regenerate_log_sheets_bulk([self.trip.id])
+
+        fresh = self.client.get(self.logs_url, HTTP_IF_NONE_MATCH=stale['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+        self.assertNotEqual(fresh['ETag'], stale['ETag'])
+        self.assertNotEqual(fresh.content, stale.content)
+
+
+    def test_body_rendered_during_invalidation_is_not_kept(self):
+        stale = self.client.get(self.logs_url)
+        RouteSegment.objects.filter(trip=self.trip, type='pickup').update(duration_minutes=180)
+
+        def build_then_regenerate(trip_id):
+            payload = trip_logs_payload(trip_id)
+            with self.captureOnCommitCallbacks(execute=True):
+                TripPlanningService().regenerate_log_sheets_bulk([trip_id])
+            return payload
+
+        caches['default'].clear()
+        raced = rendered_response('logs', self.trip.id, build_then_regenerate)
+        self.assertEqual(raced[1], stale['ETag'])
+        self.assertNotEqual(self.client.get(self.logs_url)['ETag'], stale['ETag'])
+
+    def test_deleting_a_trip_drops_its_responses(self):
+        self.assertEqual(self.client.get(self.logs_url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.trip.delete()
+        self.assertEqual(self.client.get(self.logs_url).status_code, 404)
+
+
+class StretchedRouter(Router):
+    """Routes every leg along its great-circle line, ROAD_FACTOR times longer"""
+
+    name = 'stretched'
+    ROAD_FACTOR = 1.3
+
+    def route(self, start, end):
+        km = haversine_km(start['lat'], start['lng'], end['lat'], end['lng']) * self.ROAD_FACTOR
+        return Route(km, [(start['lat'], start['lng']), (end['lat'], end['lng'])], [0.0, km])
+
+
+class AsyncEndpointTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    async def test_create_matches_sync_endpoint(self):
+        response = await self.async_client.post(
+            reverse('async_create_trip_plan'), TRIP_DATA, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 201)
+
+        trip = await Trip.objects.prefetch_related('segments').aget(id=response.json()['trip_id'])
+        self.assertEqual(response.content, JSONRenderer().render(TripSerializer(trip).data))
+        self.assertTrue(await LogSheet.objects.filter(trip=trip).aexists())
+
+    async def test_create_follows_configured_router(self):
+        lane_cache = get_lane_cache()
+        if lane_cache is not None:
+            lane_cache.clear()
+            self.addCleanup(lane_cache.clear)
+        with override_settings(TRIP_PLANNER_ROUTING={'BACKEND': 'road_graph'}), \
+                mock.patch('trip_planner.routing._router', StretchedRouter()):
+            response = await self.async_client.post(
+                reverse('async_create_trip_plan'), TRIP_DATA, content_type='application/json'
+            )
+            expected = await sync_to_async(TripPlanningService().engine.route_segments)(
+                TRIP_DATA['current_location'], TRIP_DATA['pickup_location'], TRIP_DATA['dropoff_location']
+            )
+            # After the async create, the sync path reads the lane cache entry it left
+            sync_response = await sync_to_async(self.client.post)(reverse('trip_plans'), TRIP_DATA,
+                                                                  content_type='application/json')
+
+        route = [segment['distance_km'] for segment in response.json()['route']]
+        self.assertEqual(route, [segment.distance_km for segment in expected])
+        self.assertEqual([segment['distance_km'] for segment in sync_response.json()['route']], route)
+        self.assertAlmostEqual(response.json()['total_distance_km'], PlanningEngine().total_distance(
+            PlanningEngine().route_segments(TRIP_DATA['current_location'], TRIP_DATA['pickup_location'],
+                                            TRIP_DATA['dropoff_location'])
+        ) * StretchedRouter.ROAD_FACTOR, places=3)
+
+    async def test_create_rejects_invalid_data(self):
+        response = await self.async_client.post(
+            reverse('async_create_trip_plan'), {'current_location': {}}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('pickup_location', response.json())
+
+        response = await self.async_client.post(
+            reverse('async_create_trip_plan'), 'not json', content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    async def test_detail_and_logs_match_sync_endpoints(self):
+        trip = await sync_to_async(TripPlanningService().plan_trip)(dict(TRIP_DATA))
+
+        for sync_name, async_name in (('get_trip_plan', 'async_get_trip_plan'),
+                                      ('get_trip_logs', 'async_get_trip_logs')):
+            response = await self.async_client.get(reverse(async_name, args=[trip.id]))
+            expected = await sync_to_async(self.client.get)(reverse(sync_name, args=[trip.id]))
+            self.assertEqual(response.content, expected.content)
+            self.assertEqual(response['ETag'], expected['ETag'])
+
+            not_modified = await self.async_client.get(
+                reverse(async_name, args=[trip.id]), headers={'if-none-match': response['ETag']}
+            )
+            self.assertEqual(not_modified.status_code, 304)
+
+    async def test_missing_trip_is_404(self):
+        missing = '00000000-0000-0000-0000-000000000000'
+        response = await self.async_client.get(reverse('async_get_trip_logs', args=[missing]))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json(), {'detail': 'Not found.'})
+
+
+INSTRUMENTED = {'ENABLED': True}
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        metrics.reset()
+
+    def server_timing(self, response):
+        return {entry.split(';')[0]: entry for entry in response['Server-Timing'].split(', ')}
+
+    @override_settings(TRIP_PLANNER_INSTRUMENTATION=INSTRUMENTED)
+    def test_create_reports_each_stage(self):
+        response = Client().post(reverse('trip_plans'), TRIP_DATA, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        timing = self.server_timing(response)
+        self.assertEqual(list(timing), ['validate', 'route', 'hos', 'log_sheets', 'db_write', 'serialize', 'render',
+                                        'total'])
+        self.assertIn('desc="0 queries"', timing['route'])
+        self.assertNotIn('desc="0 queries"', timing['db_write'])
+
+        scrape = Client().get(reverse('get_metrics'))
+        self.assertEqual(scrape['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = scrape.content.decode()
+        self.assertIn('trip_planner_requests_total{view="trip_plans",method="POST",status="201"} 1', text)
+        self.assertIn('trip_planner_request_duration_seconds_count{view="trip_plans"} 1', text)
+        self.assertIn('trip_planner_stage_calls_total{view="trip_plans",stage="db_write"} 1', text)
+
+    @override_settings(TRIP_PLANNER_INSTRUMENTATION=INSTRUMENTED)
+    async def test_async_requests_are_timed(self):
+        response = await AsyncClient().post(reverse('async_create_trip_plan'), TRIP_DATA,
+                                            content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('render', self.server_timing(response))
+        self.assertIn('view="async_create_trip_plan"', metrics.render())
+
+    def test_disabled_by_default(self):
+        response = Client().post(reverse('trip_plans'), TRIP_DATA, content_type='application/json')
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('trip_planner_requests_total{', metrics.render())
+        with stage('route') as timed:
+            self.assertIsNone(timed)
+
+    def test_slow_requests_leave_profiles(self):
+        profile_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, profile_dir)
+        config = {**INSTRUMENTED, 'PROFILE_THRESHOLD_MS': 0, 'PROFILE_DIR': profile_dir}
+        with override_settings(TRIP_PLANNER_INSTRUMENTATION=config):
+            Client().post(reverse('trip_plans'), TRIP_DATA, content_type='application/json')
+        with override_settings(TRIP_PLANNER_INSTRUMENTATION={**config, 'PROFILE_THRESHOLD_MS': 60000}):
+            Client().post(reverse('trip_plans'), TRIP_DATA, content_type='application/json')
+
+        profiles = list(profile_dir.glob('*-trip_plans-*ms.prof'))
+        self.assertEqual(len(profiles), 1)
+        stats = pstats.Stats(str(profiles[0]))
+        self.assertTrue(any(name == 'plan' for _, _, name in stats.stats))
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.trips = TripPlanningService().plan_trips([dict(TRIP_DATA) for _ in range(3)])
+        for day, trip in enumerate(self.trips, start=1):
+            Trip.objects.filter(id=trip.id).update(created_at=datetime(2025, 6, day, 12, tzinfo=dt_timezone.utc))
+
+    def export(self, kind='logs', **params):
+        response = self.client.get(reverse('export_trip_data', args=[kind]), params)
+        self.assertIsInstance(response, StreamingHttpResponse)
+        return response, b''.join(response.streaming_content)
+
+    def test_ndjson_logs_match_logs_endpoint(self):
+        response, body = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+
+        self.assertEqual(rows[0]['trip_id'], str(self.trips[0].id))
+        for trip in self.trips:
+            logs = self.client.get(reverse('get_trip_logs', args=[trip.id])).json()['logs']
+            exported = [row for row in rows if row['trip_id'] == str(trip.id)]
+            self.assertEqual([row['graph_points'] for row in exported], [log['graph_points'] for log in logs])
+            self.assertEqual([row['day'] for row in exported], [log['day'] for log in logs])
+
+    def test_created_at_range(self):
+        _, body = self.export('trips', since='2025-06-02', until='2025-06-03T00:00:00Z')
+        self.assertEqual([json.loads(line)['trip_id'] for line in body.splitlines()], [str(self.trips[1].id)])
+
+    def test_chunks_do_not_change_rows(self):
+        self.assertEqual(list(export_rows('segments', chunk_size=1)), list(export_rows('segments', chunk_size=500)))
+
+    def test_csv_has_header_and_json_columns(self):
+        response, body = self.export('segments', format='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(StringIO(body.decode())))
+
+        self.assertEqual(len(rows), RouteSegment.objects.count())
+        self.assertEqual(json.loads(rows[0]['start_location']), self.trips[0].segments.order_by('sequence_order')
+                         .first().start_location)
+        self.assertEqual(rows[0]['trip_created_at'], '2025-06-01T12:00:00+00:00')
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(reverse('export_trip_data', args=['drivers'])).status_code, 404)
+        for params in ({'format': 'xml'}, {'since': 'yesterday'}, {'since': '2025-06-03', 'until': '2025-06-01'}):
+            self.assertEqual(self.client.get(reverse('export_trip_data', args=['logs']), params).status_code, 400)
+
+    def test_command_writes_file(self):
+        output = Path(tempfile.mkdtemp()) / 'logs.ndjson'
+        self.addCleanup(shutil.rmtree, output.parent)
+        stderr = StringIO()
+        call_command('export_logs', output=str(output), since='2025-06-02', stderr=stderr)
+
+        lines = output.read_bytes().splitlines()
+        self.assertEqual(len(lines), LogSheet.objects.filter(trip__in=self.trips[1:]).count())
+        self.assertIn(f'Exported {len(lines)} logs rows', stderr.getvalue())
+
+    @skipUnless(parquet_available(), 'pyarrow is not installed')
+    def test_parquet_round_trip(self):
+        import pyarrow.parquet
+
+        _, body = self.export(format='parquet')
+        table = pyarrow.parquet.read_table(pyarrow.BufferReader(body))
+        self.assertEqual(table.num_rows, LogSheet.objects.count())
+        first = json.loads(b''.join(export_chunks('logs', 'ndjson', export_rows('logs'))).splitlines()[0])
+        self.assertEqual(json.loads(table.column('graph_points')[0].as_py()), first['graph_points'])
+        self.assertEqual(table.column('trip_id')[0].as_py(), first['trip_id'])
+
+
+class PlanningJobTests(TestCase):
+    def submit(self):
+        response = self.client.post(reverse('submit_trip_plan_job'), TRIP_DATA, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        return response
+
+    def test_submitted_job_is_planned_by_a_worker(self):
+        response = self.submit()
+        job_id = response.json()['job_id']
+        self.assertEqual(response.json()['status'], 'queued')
+        self.assertTrue(response['Location'].endswith(reverse('get_trip_plan_job', args=[job_id])))
+        self.assertEqual(Trip.objects.count(), 0)
+
+        job = claim_job('test-worker')
+        self.assertEqual(str(job.id), job_id)
+        self.assertIsNone(claim_job('other-worker'))
+        run_job(job)
+
+        status = self.client.get(reverse('get_trip_plan_job', args=[job_id]), {'wait': 5}).json()
+        self.assertEqual(status['status'], 'succeeded')
+        self.assertEqual(status['attempts'], 1)
+        self.assertGreaterEqual(status['service_seconds'], 0)
+        self.assertTrue(Trip.objects.filter(id=status['trip_id']).exists())
+
+    def test_async_mode_on_create_endpoint(self):
+        response = self.client.post(reverse('trip_plans') + '?async=true', TRIP_DATA, content_type='application/json')
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(PlanningJob.objects.filter(id=response.json()['job_id']).exists())
+
+    def test_planning_runs_before_the_transaction(self):
+        self.submit()
+        depths = {}
+        plan, save_plans = TripPlanningService.plan, TripPlanningService.save_plans
+
+        def record(name, method):
+            def wrapper(service, *args):
+                depths[name] = len(connection.savepoint_ids)
+                return method(service, *args)
+            return wrapper
+
+        with mock.patch.object(TripPlanningService, 'plan', record('plan', plan)), \
+                mock.patch.object(TripPlanningService, 'save_plans', record('save_plans', save_plans)):
+            job = run_job(claim_job('test-worker'))
+        self.assertEqual(job.status, 'succeeded')
+        self.assertEqual(depths['save_plans'], depths['plan'] + 1)
+
+    @override_settings(TRIP_PLANNER_JOBS={'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 0})
+    def test_failed_jobs_are_retried_then_marked_failed(self):
+        job_id = self.submit().json()['job_id']
+
+        with mock.patch.object(TripPlanningService, 'plan', side_effect=RuntimeError('routing down')), \
+                self.assertLogs('trip_planner.jobs', 'ERROR'):
+            job = run_job(claim_job('test-worker'))
+            self.assertEqual((job.status, job.attempts), ('queued', 1))
+            run_job(claim_job('test-worker'))
+
+        status = self.client.get(reverse('get_trip_plan_job', args=[job_id])).json()
+        self.assertEqual((status['status'], status['attempts']), ('failed', 2))
+        self.assertEqual(status['error'], 'RuntimeError: routing down')
+        self.assertIsNone(status['trip_id'])
+        self.assertEqual(Trip.objects.count(), 0)
+
+    def test_jobs_of_dead_workers_are_requeued(self):
+        self.submit()
+        job = claim_job('dead-worker')
+        PlanningJob.objects.filter(id=job.id).update(started_at=job.started_at - timedelta(hours=1))
+
+        self.assertEqual(requeue_stale_jobs(), 1)
+        self.assertEqual(claim_job('test-worker').id, job.id)
+
+    def test_metrics_report_depth_and_timings(self):
+        self.submit()
+        self.submit()
+        run_job(claim_job('test-worker'))
+
+        metrics = self.client.get(reverse('get_trip_plan_job_metrics')).json()
+        self.assertEqual((metrics['queued'], metrics['ready'], metrics['succeeded']), (1, 1, 1))
+        self.assertEqual(metrics['recent_jobs'], 1)
+        self.assertGreaterEqual(metrics['service_seconds']['p95'], 0)
+
+    def test_missing_job_is_404(self):
+        missing = '00000000-0000-0000-0000-000000000000'
+        self.assertEqual(self.client.get(reverse('get_trip_plan_job', args=[missing])).status_code, 404)
+
+
+class PlanningWorkerPoolTests(TransactionTestCase):
+    # One worker: the in-memory test database raises "table is locked" instead of
+    # waiting when two threads write at once
+    def test_burst_pool_drains_the_queue(self):
+        for _ in range(3):
+            submit_job(dict(TRIP_DATA))
+
+        out = StringIO()
+        call_command('run_planning_workers', '--concurrency', '1', '--burst', stdout=out)
+
+        self.assertIn('processed 3 jobs', out.getvalue())
+        self.assertEqual(PlanningJob.objects.filter(status='succeeded').count(), 3)
+        self.assertEqual(Trip.objects.count(), 3)
@@ -2,7 +2,20 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
-    path('trip-plans/', views.create_trip_plan, name='create_trip_plan'),
+    path('trip-plans/', views.trip_plans, name='trip_plans'),
+    path('trip-plans/multi-stop/', views.create_multi_stop_trip_plan, name='create_multi_stop_trip_plan'),
+    path('trip-plans/nearby/', views.nearby_trip_plans, name='nearby_trip_plans'),
+    path('trip-plans/quote/', views.quote_trip_plan, name='quote_trip_plan'),
+    path('trip-plans/scenarios/', views.compare_trip_scenarios, name='compare_trip_scenarios'),
+    path('trip-plans/batch/', views.create_trip_plans_batch, name='create_trip_plans_batch'),
+    path('trip-plans/jobs/', views.submit_trip_plan_job, name='submit_trip_plan_job'),
+    path('trip-plans/jobs/metrics/', views.get_trip_plan_job_metrics, name='get_trip_plan_job_metrics'),
+    path('trip-plans/jobs/<uuid:job_id>/', views.get_trip_plan_job, name='get_trip_plan_job'),
     path('trip-plans/<uuid:trip_id>/', views.get_trip_plan, name='get_trip_plan'),
     path('trip-plans/<uuid:trip_id>/logs/', views.get_trip_logs, name='get_trip_logs'),
+    path('trip-plans/<uuid:trip_id>/progress/', views.update_trip_progress, name='update_trip_progress'),
+    path('lane-cache/stats/', views.get_lane_cache_stats, name='get_lane_cache_stats'),
+    path('routing/stats/', views.get_routing_stats, name='get_routing_stats'),
+    path('exports/<str:kind>/', views.export_trip_data, name='export_trip_data'),
+    path('metrics/', views.get_metrics, name='get_metrics'),
 ]
\ No newline at end of file
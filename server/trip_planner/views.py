@@ -1,36 +1,281 @@
 from rest_framework import status
 from rest_framework.decorators import api_view
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.shortcuts import get_object_or_404
+from rest_framework.serializers import UUIDField, as_serializer_error
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
+from django.urls import reverse
+from .exports import CONTENT_TYPES, KINDS, export_chunks, export_rows
+from .instrumentation import metrics, stage
+from .jobs import job_payload, jobs_config, queue_metrics, submit_job, wait_for_job
+from .lane_cache import get_lane_cache
 from .models import Trip
+from .pagination import TripPlanPagination
+from .response_cache import conditional_response, rendered_response
+from .payloads import (
+    TRIP_DETAIL_COLUMNS, nearby_payload, optimization_payload, progress_payload, scenarios_payload,
+    trip_detail_payload, trip_detail_payloads, trip_logs_payload, trip_payload
+)
 from .serializers import (
-    TripCreateSerializer, TripSerializer, TripDetailSerializer, TripLogsSerializer
+    ExportQuerySerializer, MultiStopTripCreateSerializer, NearbyTripsQuerySerializer, TripCreateSerializer, TripProgressSerializer,
+    TripQuoteSerializer, TripScenariosSerializer
 )
+from .routing import get_router
+from .scenarios import evaluate_scenarios
 from .services import TripPlanningService
+from .spatial import nearby_trips
 
+MAX_BATCH_SIZE = 1000
 
-@api_view(['POST'])
-def create_trip_plan(request):
+
+@api_view(['GET', 'POST'])
+def trip_plans(request):
+    if request.method == 'GET':
+        return _list_trip_plans(request)
+    return _create_trip_plan(request)
+
+
+def _list_trip_plans(request):
+    trips = Trip.objects.order_by('-created_at', 'id').values(*TRIP_DETAIL_COLUMNS)
+
+    ids = request.query_params.get('ids')
+    if ids:
+        id_field = UUIDField()
+        try:
+            trip_ids = [id_field.to_internal_value(trip_id.strip()) for trip_id in ids.split(',') if trip_id.strip()]
+        except ValidationError as exc:
+            return Response({'ids': exc.detail}, status=status.HTTP_400_BAD_REQUEST)
+        trips = trips.filter(id__in=trip_ids)
+
+    paginator = TripPlanPagination()
+    page = paginator.paginate_queryset(trips, request)
+    return paginator.get_paginated_response(trip_detail_payloads(page))
+
+
+def _create_trip_plan(request):
     serializer = TripCreateSerializer(data=request.data)
-    if serializer.is_valid():
+    with stage('validate'):
+        valid = serializer.is_valid()
+    if valid:
+        if request.query_params.get('persist', '').lower() == 'false':
+            return _quote_response(serializer.validated_data)
+        if request.query_params.get('async', '').lower() == 'true':
+            return _job_accepted_response(request, serializer.validated_data)
+
         trip_service = TripPlanningService()
-        trip = trip_service.plan_trip(serializer.validated_data)
-        
-        response_serializer = TripSerializer(trip)
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        plan = trip_service.plan([serializer.validated_data])[0]
+        trip = trip_service.save_plans([(serializer.validated_data, plan)])[0]
+
+        with stage('serialize'):
+            data = trip_payload(trip, plan.segments)
+        return Response(data, status=status.HTTP_201_CREATED)
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+def create_multi_stop_trip_plan(request):
+    serializer = MultiStopTripCreateSerializer(data=request.data)
+    with stage('validate'):
+        valid = serializer.is_valid()
+    if not valid:
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    trip_service = TripPlanningService()
+    trip_fields, plan, stop_order = trip_service.plan_multi_stop(serializer.validated_data)
+    if request.query_params.get('persist', '').lower() == 'false':
+        data, response_status = TripQuoteSerializer(plan).data, status.HTTP_200_OK
+    else:
+        trip = trip_service.save_plans([(trip_fields, plan)])[0]
+        with stage('serialize'):
+            data, response_status = trip_payload(trip, plan.segments), status.HTTP_201_CREATED
+
+    data['stops'] = trip_fields['stops']
+    data['optimization'] = optimization_payload(stop_order)
+    return Response(data, status=response_status)
+
+
+@api_view(['GET'])
+def nearby_trip_plans(request):
+    query = NearbyTripsQuerySerializer(data=request.query_params)
+    if not query.is_valid():
+        return Response(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    params = query.validated_data
+    match_count, matches = nearby_trips(params['lat'], params['lng'], params['radius_km'], limit=params['limit'])
+    return Response(nearby_payload(match_count, matches))
+
+
+@api_view(['POST'])
+def quote_trip_plan(request):
+    serializer = TripCreateSerializer(data=request.data)
+    if serializer.is_valid():
+        return _quote_response(serializer.validated_data)
+
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+def compare_trip_scenarios(request):
+    serializer = TripScenariosSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Like quotes, nothing is written
+    trip_data = dict(serializer.validated_data)
+    grid = trip_data.pop('grid')
+    segments, results = evaluate_scenarios(TripPlanningService().engine, trip_data, grid)
+    return Response(scenarios_payload(segments, results))
+
+
+def _quote_response(trip_data):
+    # Plan fully in memory; nothing is written for quotes
+    plan = TripPlanningService().engine.plan(**trip_data)
+    return Response(TripQuoteSerializer(plan).data)
+
+
+@api_view(['POST'])
+def submit_trip_plan_job(request):
+    serializer = TripCreateSerializer(data=request.data)
+    if serializer.is_valid():
+        return _job_accepted_response(request, serializer.validated_data)
+
+    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+def _job_accepted_response(request, trip_data):
+    job = submit_job(trip_data)
+    status_url = request.build_absolute_uri(reverse('get_trip_plan_job', args=[job.id]))
+    return Response(job_payload(job), status=status.HTTP_202_ACCEPTED, headers={'Location': status_url})
+
+
+@api_view(['GET'])
+def get_trip_plan_job(request, job_id):
+    # ?wait=<seconds> long-polls until the job finishes
+    try:
+        wait = min(float(request.query_params.get('wait', 0)), jobs_config()['MAX_WAIT'])
+    except ValueError:
+        return Response({'wait': ['A number of seconds is required.']}, status=status.HTTP_400_BAD_REQUEST)
+
+    job = wait_for_job(job_id, max(wait, 0))
+    if job is None:
+        raise Http404
+    return Response(job_payload(job))
+
+
+@api_view(['GET'])
+def get_trip_plan_job_metrics(request):
+    return Response(queue_metrics())
+
+
+@api_view(['POST'])
+def create_trip_plans_batch(request):
+    items = request.data
+    if not isinstance(items, list):
+        return Response({'detail': 'Expected a list of trip plans'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > MAX_BATCH_SIZE:
+        return Response(
+            {'detail': f'A batch may contain at most {MAX_BATCH_SIZE} trip plans'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(items)
+    valid_items = []
+    # One serializer validates every item so its fields are only bound once
+    validator = TripCreateSerializer()
+    for index, item in enumerate(items):
+        try:
+            valid_items.append((index, validator.run_validation(item)))
+        except ValidationError as exc:
+            results[index] = {
+                'index': index,
+                'status': status.HTTP_400_BAD_REQUEST,
+                'errors': as_serializer_error(exc),
+            }
+
+    trip_service = TripPlanningService()
+    trips_data = [trip_data for _, trip_data in valid_items]
+    plans = trip_service.plan(trips_data)
+    trips = trip_service.save_plans(list(zip(trips_data, plans)))
+
+    for (index, _), trip, plan in zip(valid_items, trips, plans):
+        results[index] = {
+            'index': index,
+            'status': status.HTTP_201_CREATED,
+            'trip': trip_payload(trip, plan.segments),
+        }
+
+    response_status = status.HTTP_201_CREATED if len(trips) == len(items) else status.HTTP_207_MULTI_STATUS
+    return Response({'results': results}, status=response_status)
+
+
 @api_view(['GET'])
 def get_trip_plan(request, trip_id):
-    trip = get_object_or_404(Trip, id=trip_id)
-    serializer = TripDetailSerializer(trip)
-    return Response(serializer.data)
+    return _rendered_trip_response(request, 'detail', trip_id, trip_detail_payload)
 
 
 @api_view(['GET'])
 def get_trip_logs(request, trip_id):
-    trip = get_object_or_404(Trip, id=trip_id)
-    serializer = TripLogsSerializer(trip)
-    return Response(serializer.data)
+    return _rendered_trip_response(request, 'logs', trip_id, trip_logs_payload)
+
+
+@api_view(['PATCH'])
+def update_trip_progress(request, trip_id):
+    serializer = TripProgressSerializer(data=request.data)
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        replan = TripPlanningService().update_progress(trip_id, **serializer.validated_data)
+    except Trip.DoesNotExist:
+        raise Http404
+    if replan is None:
+        return Response({'detail': 'The trip is already complete'}, status=status.HTTP_409_CONFLICT)
+    return Response(progress_payload(trip_id, replan))
+
+
+def _rendered_trip_response(request, kind, trip_id, build_payload):
+    rendered = rendered_response(kind, trip_id, build_payload)
+    if rendered is None:
+        raise Http404
+    return conditional_response(request, rendered)
+
+
+@api_view(['GET'])
+def get_lane_cache_stats(request):
+    lane_cache = get_lane_cache()
+    if lane_cache is None:
+        return Response({'backend': None})
+    return Response(lane_cache.stats())
+
+
+@api_view(['GET'])
+def get_routing_stats(request):
+    router = get_router()
+    if router is None:
+        return Response({'backend': 'haversine'})
+    return Response(router.stats())
+
+
+@require_GET
+def get_metrics(request):
+    # Prometheus text format, outside DRF so scrapes are not content-negotiated
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@require_GET
+def export_trip_data(request, kind):
+    # Outside DRF, so ?format= picks the export format rather than a renderer and the body is streamed
+    if kind not in KINDS:
+        raise Http404
+    query = ExportQuerySerializer(data=request.GET)
+    if not query.is_valid():
+        return JsonResponse(query.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    params = query.validated_data
+    export_format = params['format']
+    rows = export_rows(kind, since=params.get('since'), until=params.get('until'))
+    response = StreamingHttpResponse(export_chunks(kind, export_format, rows), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = f'attachment; filename="trip-planner-{kind}.{export_format}"'
+    return response